@@ -1,20 +1,37 @@
-import os, logging
-from typing import List
+import os, time, logging
+from dataclasses import dataclass
+from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
-# Optional providers
-try:
-    from .luma_adapter import LumaClient
-except Exception:
-    LumaClient = None
+from .health import HEALTH, HealthRegistry
 
-try:
-    from .replicate_adapter import ReplicateClient  # Sora via Replicate
-except Exception:
-    ReplicateClient = None
+# Клиенты (httpx/aiohttp) импортируются при первом вызове провайдера, а не при
+# `import adapters` — иначе их платит любой `from adapters.providers import ...`.
+def _luma_client():
+    try:
+        from .luma_adapter import LumaClient
+    except Exception:
+        return None
+    return LumaClient
 
-from .ffmpeg_stub import render_many as ffmpeg_render_many
+def _replicate_client():
+    try:
+        from .replicate_adapter import ReplicateClient  # Sora via Replicate
+    except Exception:
+        return None
+    return ReplicateClient
+
+def __getattr__(name):
+    # совместимость: adapters.LumaClient / adapters.ReplicateClient / adapters.ffmpeg_render_many
+    if name == "LumaClient":
+        return _luma_client()
+    if name == "ReplicateClient":
+        return _replicate_client()
+    if name == "ffmpeg_render_many":
+        from .ffmpeg_stub import render_many_async
+        return render_many_async
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def _providers_from_env() -> list:
     order = os.getenv('_PROVIDERS_ONCE') or os.getenv('PROVIDERS','ffmpeg')
@@ -25,53 +42,75 @@ def _providers_from_env() -> list:
 async def _try_ffmpeg(prompt: str, n: int, out_dir: str):
     logger.info("PROVIDER=FFMPEG start")
     import asyncio, inspect
+    from .ffmpeg_stub import render_many_async as ffmpeg_render_many
     if inspect.iscoroutinefunction(ffmpeg_render_many):
         files = await ffmpeg_render_many(prompt, n, out_dir)
     else:
         loop = asyncio.get_event_loop()
         files = await loop.run_in_executor(None, lambda: ffmpeg_render_many(prompt, n, out_dir))
-    os.environ['_LAST_PROVIDER'] = 'FFMPEG'
     logger.info("PROVIDER=FFMPEG ok: %r", files)
     return files
 
 async def _try_luma(prompt: str, n: int, out_dir: str):
+    LumaClient = _luma_client()
     if LumaClient is None:
         raise RuntimeError("LumaClient not available")
     logger.info("PROVIDER=LUMA start")
     client = LumaClient.from_env()
     files = await client.generate(prompt, n, out_dir)
-    os.environ['_LAST_PROVIDER'] = 'LUMA'
     logger.info("PROVIDER=LUMA ok: %r", files)
     return files
 
 async def _try_sora(prompt: str, n: int, out_dir: str):
+    ReplicateClient = _replicate_client()
     if ReplicateClient is None:
         raise RuntimeError("ReplicateClient not available")
     logger.info("PROVIDER=SORA start")
     client = ReplicateClient.from_env()
     files = await client.generate(prompt, n, out_dir)
-    os.environ['_LAST_PROVIDER'] = 'SORA'
     logger.info("PROVIDER=SORA ok: %r", files)
     return files
 
-async def render_videos(prompt: str, n: int, out_dir: str) -> List[str]:
-    name2fn = {
-        "sora": _try_sora,
-        "luma": _try_luma,
-        "ffmpeg": _try_ffmpeg,
-    }
-    providers = _providers_from_env()
-    last_error = None
-    for name in providers:
-        fn = name2fn.get(name)
-        if not fn:
+@dataclass
+class RenderResult:
+    provider: str
+    files: List[str]
+
+_NAME2FN = {
+    "sora": _try_sora,
+    "luma": _try_luma,
+    "ffmpeg": _try_ffmpeg,
+}
+
+async def render_videos_ex(prompt: str, n: int, out_dir: str,
+                           providers: Optional[List[str]] = None) -> RenderResult:
+    """
+    Пробует провайдеров по очереди (PROVIDERS или явный providers), пропуская
+    тех, у кого открыт circuit breaker, и возвращает, кто именно отдал файлы.
+    """
+    configured = providers or _providers_from_env()
+    for name in configured:
+        if name not in _NAME2FN:
             logger.error("Unknown provider in PROVIDERS: %s", name)
-            continue
+    chain = HEALTH.order([x for x in configured if x in _NAME2FN])
+    skipped = [x for x in configured if x in _NAME2FN and x not in chain]
+    if skipped:
+        logger.info("PROVIDERS circuit open, skipping: %s", ",".join(skipped))
+    last_error = None
+    for name in chain:
+        t0 = time.monotonic()
         try:
-            return await fn(prompt, n, out_dir)
+            files = await _NAME2FN[name](prompt, n, out_dir)
         except Exception as e:
+            HEALTH.record_failure(name, time.monotonic() - t0, e)
             last_error = e
             logger.error("PROVIDER=%s failed: %s", name.upper(), e)
+            continue
+        HEALTH.record_success(name, time.monotonic() - t0)
+        return RenderResult(name.upper(), files)
     if last_error:
         raise last_error
-    return []
+    return RenderResult("", [])
+
+async def render_videos(prompt: str, n: int, out_dir: str) -> List[str]:
+    return (await render_videos_ex(prompt, n, out_dir)).files
@@ -1,4 +1,4 @@
-import os, subprocess, tempfile, random, string, shlex, textwrap
+import os, subprocess, tempfile, random, string, shlex, textwrap, asyncio, shutil
 
 def _rand(n=8):
     return ''.join(random.choices(string.ascii_lowercase + string.digits, k=n))
@@ -10,6 +10,14 @@ def _sanitize_text(t: str, limit=450):
         t = t[:limit-3] + "..."
     return t
 
+def _drawtext(txt: str) -> str:
+    # drawtext требует установленный шрифт dejavu; у нас он стоит
+    return (
+        "drawbox=x=0:y=0:w=iw:h=ih:color=black@1:t=fill,"
+        f"drawtext=font='DejaVu Sans':text='{txt}':"
+        "fontcolor=white:fontsize=36:x=(w-text_w)/2:y=(h-text_h)/2:box=1:boxcolor=black@0.0"
+    )
+
 def render_many(prompt: str, count: int = 1, out_dir: str | None = None,
                 fps: int = 24, duration: int = 6, size: str = "1280x720") -> list[str]:
     """
@@ -25,18 +33,74 @@ def render_many(prompt: str, count: int = 1, out_dir: str | None = None,
     for _ in range(int(count)):
         fname = f"cf_{_rand(9)}.mp4"
         path = os.path.join(out_dir, fname)
-        # drawtext требует установленный шрифт dejavu; у нас он стоит
-        draw = (
-            "drawbox=x=0:y=0:w=iw:h=ih:color=black@1:t=fill,"
-            f"drawtext=font='DejaVu Sans':text='{txt}':"
-            "fontcolor=white:fontsize=36:x=(w-text_w)/2:y=(h-text_h)/2:box=1:boxcolor=black@0.0"
-        )
+        draw = _drawtext(txt)
         cmd = [
             "ffmpeg","-y",
             "-f","lavfi","-i",f"color=c=black:s={size}:d={duration}",
             "-vf", draw, "-r", str(fps), "-pix_fmt","yuv420p", path
         ]
         # запустим и не упадём, даже если ffmpeg что-то ворчит на stderr
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        from app.renderfarm import FARM, FINAL
+        FARM.run_sync(cmd, FINAL)
         paths.append(path)
     return paths
+
+
+# ---------- async-рендер ----------
+
+async def _ffmpeg(cmd: list[str]) -> None:
+    # общий планировщик app.renderfarm: лимит по ядрам/памяти и -threads на задачу
+    from app.renderfarm import FARM, FINAL
+    await FARM.run(cmd, FINAL, tail=500)
+
+async def render_many_async(prompt: str, count: int = 1, out_dir: str | None = None,
+                            fps: int = 24, duration: int = 6, size: str = "1280x720",
+                            single_card: bool = True) -> list[str]:
+    """
+    Async-версия render_many.
+    single_card=True (по умолчанию): кадр одинаковый для всех клипов, поэтому
+    рисуем текстовую карточку один раз в PNG, кодируем из неё один клип,
+    а остальные count-1 получаем копией готового файла (без перекодирования).
+    single_card=False: count независимых ffmpeg параллельно через app.renderfarm.
+    """
+    if out_dir is None:
+        out_dir = os.getenv("OUT_DIR", "/opt/content_factory/out")
+    os.makedirs(out_dir, exist_ok=True)
+
+    txt = _sanitize_text(prompt)
+    paths = [os.path.join(out_dir, f"cf_{_rand(9)}.mp4") for _ in range(max(1, int(count)))]
+
+    if not single_card:
+        await asyncio.gather(*[
+            _ffmpeg([
+                "ffmpeg", "-y",
+                "-f", "lavfi", "-i", f"color=c=black:s={size}:d={duration}",
+                "-vf", _drawtext(txt), "-r", str(fps), "-pix_fmt", "yuv420p", path,
+            ])
+            for path in paths
+        ])
+        return paths
+
+    tmpdir = tempfile.mkdtemp(prefix="cf_card_")
+    try:
+        card = os.path.join(tmpdir, "card.png")
+        await _ffmpeg([
+            "ffmpeg", "-y",
+            "-f", "lavfi", "-i", f"color=c=black:s={size}",
+            "-vf", _drawtext(txt), "-frames:v", "1", card,
+        ])
+        # статичная картинка: stillimage + короткий GOP почти ничего не стоит
+        await _ffmpeg([
+            "ffmpeg", "-y",
+            "-loop", "1", "-framerate", str(fps), "-t", str(duration), "-i", card,
+            "-c:v", "libx264", "-preset", "veryfast", "-tune", "stillimage",
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart", paths[0],
+        ])
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[
+        loop.run_in_executor(None, shutil.copyfile, paths[0], path) for path in paths[1:]
+    ])
+    return paths
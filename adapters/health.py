@@ -0,0 +1,134 @@
+import os, time, threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Настройки circuit breaker (через env, как и всё остальное в adapters)
+WINDOW        = int(os.getenv("HEALTH_WINDOW", "50"))            # сколько последних вызовов помним
+FAIL_OPEN     = int(os.getenv("HEALTH_FAIL_OPEN", "3"))          # подряд ошибок -> открываем цепь
+COOLDOWN_SEC  = float(os.getenv("HEALTH_COOLDOWN_SEC", "120"))   # сколько провайдер «отдыхает»
+MIN_RATE      = float(os.getenv("HEALTH_MIN_SUCCESS_RATE", "0.5"))  # ниже -> провайдер в конец очереди
+MIN_SAMPLES   = 5
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    xs = sorted(values)
+    k = min(len(xs) - 1, max(0, int(round(q * (len(xs) - 1)))))
+    return xs[k]
+
+
+@dataclass
+class ProviderStats:
+    name: str
+    calls: Deque[Tuple[bool, float]] = field(default_factory=lambda: deque(maxlen=WINDOW))
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    last_error: str = ""
+    last_ok_ts: float = 0.0
+
+    @property
+    def success_rate(self) -> Optional[float]:
+        if not self.calls:
+            return None
+        return sum(1 for ok, _ in self.calls if ok) / len(self.calls)
+
+    def latencies(self) -> List[float]:
+        return [dt for ok, dt in self.calls if ok]
+
+    def is_open(self, now: float) -> bool:
+        return self.open_until > now
+
+    def snapshot(self, now: float) -> Dict[str, object]:
+        lat = self.latencies()
+        return {
+            "name": self.name,
+            "samples": len(self.calls),
+            "success_rate": self.success_rate,
+            "p50": _pct(lat, 0.50),
+            "p95": _pct(lat, 0.95),
+            "consecutive_failures": self.consecutive_failures,
+            "circuit": "open" if self.is_open(now) else "closed",
+            "open_for_sec": max(0.0, self.open_until - now),
+            "last_error": self.last_error,
+        }
+
+
+class HealthRegistry:
+    """
+    Здоровье провайдеров: скользящее окно успехов/латентностей, счётчик ошибок подряд
+    и circuit breaker. Все методы синхронные и под threading.Lock — внутри нет await,
+    поэтому безопасно и из корутин, и из потоков executor'а.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, ProviderStats] = {}
+
+    def _get(self, name: str) -> ProviderStats:
+        st = self._stats.get(name)
+        if st is None:
+            st = self._stats[name] = ProviderStats(name)
+        return st
+
+    def record_success(self, name: str, latency: float) -> None:
+        with self._lock:
+            st = self._get(name)
+            st.calls.append((True, float(latency)))
+            st.consecutive_failures = 0
+            st.open_until = 0.0
+            st.last_ok_ts = time.time()
+
+    def record_failure(self, name: str, latency: float, error: object = "") -> None:
+        with self._lock:
+            st = self._get(name)
+            st.calls.append((False, float(latency)))
+            st.consecutive_failures += 1
+            st.last_error = str(error)[:300]
+            # после cooldown цепь «полуоткрыта»: одна пробная ошибка снова открывает её
+            if st.consecutive_failures >= FAIL_OPEN:
+                st.open_until = time.monotonic() + COOLDOWN_SEC
+
+    def is_available(self, name: str) -> bool:
+        with self._lock:
+            st = self._stats.get(name)
+            return st is None or not st.is_open(time.monotonic())
+
+    def order(self, names: List[str]) -> List[str]:
+        """
+        Порядок попыток: сначала здоровые (в порядке из PROVIDERS), потом деградировавшие
+        (success rate < MIN_RATE), провайдеры с открытой цепью пропускаются.
+        Если открыто всё — возвращаем исходный порядок, чтобы запрос не упал без попытки.
+        """
+        now = time.monotonic()
+        healthy, degraded = [], []
+        with self._lock:
+            for name in names:
+                st = self._stats.get(name)
+                if st is None:
+                    healthy.append(name)
+                    continue
+                if st.is_open(now):
+                    continue
+                rate = st.success_rate
+                if rate is not None and len(st.calls) >= MIN_SAMPLES and rate < MIN_RATE:
+                    degraded.append(name)
+                else:
+                    healthy.append(name)
+        return (healthy + degraded) or list(names)
+
+    def reset(self, name: Optional[str] = None) -> None:
+        with self._lock:
+            if name is None:
+                self._stats.clear()
+            else:
+                self._stats.pop(name, None)
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        now = time.monotonic()
+        with self._lock:
+            return {name: st.snapshot(now) for name, st in self._stats.items()}
+
+
+HEALTH = HealthRegistry()
@@ -8,6 +8,7 @@ TIMEOUT_S  = int(os.getenv("KIE_TIMEOUT", "300"))
 DURATION   = int(os.getenv("KIE_DURATION", "6"))
 RES        = os.getenv("KIE_RESOLUTION", "1280x720")
 FPS        = int(os.getenv("KIE_FPS", "24"))
+POLL_SEC   = float(os.getenv("KIE_POLL_SEC", "2"))
 
 ENV_START  = os.getenv("KIE_START_PATH")   # e.g. /api/v1/video/generate
 ENV_STATUS = os.getenv("KIE_STATUS_PATH")  # e.g. /api/v1/video/tasks/{task_id}
@@ -96,12 +97,12 @@ class KIEClient:
                             raise RuntimeError("KIE: completed but no download url")
                         return durl
                     if status in {"queued","pending","processing","running","in_progress"}:
-                        await asyncio.sleep(2); break
+                        await asyncio.sleep(POLL_SEC); break
                     if status in {"failed","error"}:
                         raise RuntimeError(f"KIE: task failed: {data}")
                 except Exception:
-                    await asyncio.sleep(2)
-            await asyncio.sleep(2)
+                    await asyncio.sleep(POLL_SEC)
+            await asyncio.sleep(POLL_SEC)
         raise TimeoutError("KIE: task timeout")
 
     async def generate(self, prompt: str, n: int, out_dir: str):
@@ -0,0 +1,453 @@
+"""
+Единый async-интерфейс провайдеров видео и ленивый реестр.
+
+Все клиенты (app/replicate_adapter, app/adapters/*, adapters/*) заворачиваются в
+VideoProvider: submit -> status -> fetch (+ cancel), плюс capabilities и стоимость.
+Планировщик, кэш, хеджирование и т.п. пишутся один раз поверх этого интерфейса.
+"""
+import os, asyncio, logging, threading, time, uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+log = logging.getLogger("providers")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELED = "queued", "running", "succeeded", "failed", "canceled"
+TERMINAL = (SUCCEEDED, FAILED, CANCELED)
+
+
+@dataclass
+class Capabilities:
+    t2v: bool = True
+    i2v: bool = False
+    max_frames: int = 0          # 0 = без ограничения / неизвестно
+    fps: tuple = (24,)           # допустимые fps (min..max или список)
+    max_seconds: float = 0.0
+    frames: tuple = ()           # допустимые num_frames (пусто = любое до max_frames)
+
+    def supports(self, req: "JobRequest") -> bool:
+        return bool(self.i2v if req.image else self.t2v)
+
+
+@dataclass
+class Cost:
+    per_job: float = 0.0         # фикс за запуск
+    per_second: float = 0.0      # за секунду выдаваемого видео
+    currency: str = "USD"
+
+    def estimate(self, seconds: float) -> float:
+        return self.per_job + self.per_second * float(seconds)
+
+
+@dataclass
+class JobRequest:
+    prompt: str
+    image: Optional[str] = None
+    seconds: float = 5.0
+    fps: Optional[int] = None
+    seed: Optional[int] = None
+    out_dir: str = field(default_factory=lambda: os.getenv("OUT_DIR", "/opt/content_factory/out"))
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class JobHandle:
+    provider: str
+    id: str
+    created: float = field(default_factory=time.time)
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class JobStatus:
+    state: str
+    output: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in TERMINAL
+
+
+class ProviderError(RuntimeError):
+    pass
+
+
+def _cost_from_env(name: str, per_job: float = 0.0, per_second: float = 0.0) -> Cost:
+    key = name.upper().replace("-", "_")
+    return Cost(
+        per_job=float(os.getenv(f"COST_{key}_PER_JOB", per_job)),
+        per_second=float(os.getenv(f"COST_{key}_PER_SEC", per_second)),
+    )
+
+
+class VideoProvider:
+    name = "base"
+    capabilities = Capabilities()
+    cost = Cost()
+    poll_sec = 2.0
+    timeout_sec = 900.0
+
+    async def submit(self, req: JobRequest) -> JobHandle:
+        raise NotImplementedError
+
+    async def status(self, handle: JobHandle) -> JobStatus:
+        raise NotImplementedError
+
+    async def cancel(self, handle: JobHandle) -> None:
+        raise NotImplementedError
+
+    async def fetch(self, handle: JobHandle, status: JobStatus) -> str:
+        """Забрать результат в локальный файл, вернуть путь."""
+        raise NotImplementedError
+
+    async def stage_image(self, image: str) -> str:
+        """
+        Подготовить фото для i2v заранее (app.speculative): результат можно передать
+        в JobRequest.image вместо локального пути. По умолчанию ничего не делает.
+        """
+        return image
+
+    async def run(self, req: JobRequest) -> str:
+        """submit -> poll -> fetch. При отмене корутины отменяет и задачу у провайдера."""
+        if not self.capabilities.supports(req):
+            raise ProviderError(f"{self.name}: {'i2v' if req.image else 't2v'} not supported")
+        from app.tracing import span, record
+        with span("provider.submit", provider=self.name):
+            handle = await self.submit(req)
+        t_submit = t_run = time.monotonic()
+        deadline = t_submit + self.timeout_sec
+        queued = True
+        try:
+            while True:
+                st = await self.status(handle)
+                if queued and st.state != QUEUED:
+                    # очередь у провайдера vs собственно рендер
+                    t_run = time.monotonic()
+                    record("provider.queue", t_run - t_submit, provider=self.name)
+                    queued = False
+                if st.state == SUCCEEDED:
+                    record("provider.render", time.monotonic() - t_run, provider=self.name)
+                    with span("provider.fetch", provider=self.name):
+                        return await self.fetch(handle, st)
+                if st.state in (FAILED, CANCELED):
+                    raise ProviderError(f"{self.name} id={handle.id} status={st.state} error={st.error}")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{self.name} id={handle.id} timeout")
+                await asyncio.sleep(self.poll_sec)
+        except BaseException:
+            # таймаут / CancelledError / ошибка сети: не оставляем задачу жечь GPU
+            try:
+                await asyncio.shield(self.cancel(handle))
+            except Exception as e:
+                log.warning("%s cancel id=%s failed: %s", self.name, handle.id, e)
+            raise
+
+
+# ---------- Replicate /models/{slug}/predictions (curl-хелперы app/replicate_adapter) ----------
+
+class ReplicateModelProvider(VideoProvider):
+    """
+    WAN 2.2 t2v/i2v. Сеть — те же curl-хелперы, что в app/replicate_adapter,
+    вынесенные в поток, так что токен, payload и финализация совпадают с ботом.
+    """
+    name = "wan"
+    capabilities = Capabilities(t2v=True, i2v=True, max_frames=100, fps=(5, 24), max_seconds=10,
+                                frames=(81, 84, 88, 92, 96, 100))   # = app.frameplan.WAN_FRAMES
+    poll_sec = float(os.environ.get("REPLICATE_POLL_SEC", "1.5"))
+
+    def __init__(self):
+        from app import replicate_adapter as ra
+        self.ra = ra
+        self.client = ra.ReplicateClient()
+        self.cost = _cost_from_env(self.name)
+
+    async def stage_image(self, image: str) -> str:
+        # catbox-заливка; URL в req.image _image_url пропускает как есть
+        return await asyncio.to_thread(self.ra._image_url, image)
+
+    async def submit(self, req: JobRequest) -> JobHandle:
+        ra = self.ra
+        # кадры/fps — app.frameplan; недостающие до 24 fps досчитываются в fetch при нормализации
+        plan = ra._frame_plan(req.seconds, req.fps)
+        if req.image:
+            img_url = await asyncio.to_thread(ra._image_url, req.image)
+            payload, model = ra._i2v_payload(img_url, req.prompt, req.seconds, req.seed, req.fps), ra.I2V_MODEL
+        else:
+            payload, model = ra._t2v_payload(req.prompt, req.seconds, req.seed, req.fps), ra.T2V_MODEL
+        payload.update(req.extra)
+        r = await asyncio.to_thread(
+            ra._post_json, f"{ra.API_BASE}/models/{model}/predictions", {"input": payload}, self.client.token)
+        pid = r.get("id")
+        if not pid:
+            raise ProviderError(f"wan: no prediction id in {r}")
+        return JobHandle(self.name, pid, meta={"model": model, "fps": plan.out_fps, "interp": plan.interpolate,
+                                               "out_dir": req.out_dir, "kind": "i2v" if req.image else "t2v"})
+
+    async def status(self, handle: JobHandle) -> JobStatus:
+        ra = self.ra
+        s = await asyncio.to_thread(ra._get_json, f"{ra.API_BASE}/predictions/{handle.id}", self.client.token)
+        st = s.get("status") or QUEUED
+        if st == "starting":
+            st = QUEUED
+        elif st == "processing":
+            st = RUNNING
+        out = s.get("output")
+        url = out[-1] if isinstance(out, list) and out else (out if isinstance(out, str) else None)
+        return JobStatus(st, url, s.get("error"))
+
+    async def cancel(self, handle: JobHandle) -> None:
+        await asyncio.to_thread(self.ra._cancel_prediction, handle.id, self.client.token)
+
+    async def fetch(self, handle: JobHandle, status: JobStatus) -> str:
+        if not status.output:
+            raise ProviderError("wan: no output url")
+        from app.utils.proc import run_async
+        ra = self.ra
+        # curl — через run_async, ffmpeg — через FARM; при отмене задачи процессы убиваются
+        tmp = ra.OUT_DIR / f"replicate_{handle.meta['kind']}_{handle.id}.dl.tmp.mp4"
+        from app.renderfarm import FARM, FINAL
+        from app.tracing import span
+        with span("download", provider=self.name):
+            await run_async(ra._download_cmd(status.output, tmp))
+        cmd, normalized = await asyncio.to_thread(ra._norm_cmd, tmp, handle.meta["fps"], handle.meta.get("interp", ""))
+        with span("ffmpeg.norm", provider=self.name):
+            await FARM.run(cmd, FINAL)
+        tmp.unlink(missing_ok=True)
+        from app.storage import store_final
+        final = await asyncio.to_thread(store_final, normalized, f"replicate_wanA_{handle.meta['kind']}")
+        return str(final)
+
+
+# ---------- обёртка над монолитными клиентами (generate / run_*) ----------
+
+class TaskProvider(VideoProvider):
+    """
+    Для клиентов без раздельного submit/status: весь вызов идёт asyncio-задачей,
+    status смотрит на задачу, cancel её отменяет (у провайдера — на совести клиента).
+    stage — своя заливка фото для stage_image (иначе фото уходит клиенту как есть).
+    """
+    poll_sec = 0.5
+
+    def __init__(self, name: str, run: Callable[[JobRequest], Awaitable[str]],
+                 capabilities: Capabilities, cost: Optional[Cost] = None,
+                 stage: Optional[Callable[[str], Awaitable[str]]] = None):
+        self.name = name
+        self._run = run
+        self._stage = stage
+        self.capabilities = capabilities
+        self.cost = cost or _cost_from_env(name)
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def stage_image(self, image: str) -> str:
+        if self._stage is None:
+            return image
+        return await self._stage(image)
+
+    async def submit(self, req: JobRequest) -> JobHandle:
+        handle = JobHandle(self.name, uuid.uuid4().hex[:12])
+        self._tasks[handle.id] = asyncio.ensure_future(self._run(req))
+        return handle
+
+    async def status(self, handle: JobHandle) -> JobStatus:
+        t = self._tasks.get(handle.id)
+        if t is None:
+            return JobStatus(FAILED, error="unknown job")
+        if not t.done():
+            return JobStatus(RUNNING)
+        if t.cancelled():
+            return JobStatus(CANCELED)
+        if t.exception() is not None:
+            return JobStatus(FAILED, error=str(t.exception()))
+        return JobStatus(SUCCEEDED, t.result())
+
+    async def cancel(self, handle: JobHandle) -> None:
+        t = self._tasks.pop(handle.id, None)
+        if t is not None and not t.done():
+            t.cancel()
+
+    async def fetch(self, handle: JobHandle, status: JobStatus) -> str:
+        self._tasks.pop(handle.id, None)
+        return status.output
+
+
+def _first(files) -> str:
+    if not files:
+        raise ProviderError("provider returned no files")
+    return files[0]
+
+
+def _generate_client(factory: Callable[[], Any]) -> Callable[[JobRequest], Awaitable[str]]:
+    """Клиенты вида async generate(prompt, n, out_dir) -> [paths]."""
+    client = None
+
+    async def run(req: JobRequest) -> str:
+        nonlocal client
+        if client is None:
+            client = factory()
+        return _first(await client.generate(req.prompt, 1, req.out_dir))
+    return run
+
+
+def _sora():
+    from .replicate_adapter import ReplicateClient
+    return TaskProvider("sora", _generate_client(ReplicateClient.from_env),
+                        Capabilities(t2v=True, max_seconds=int(os.getenv("VIDEO_DURATION", "6"))))
+
+
+def _luma():
+    from .luma_adapter import LumaClient
+    return TaskProvider("luma", _generate_client(LumaClient.from_env), Capabilities(t2v=True))
+
+
+def _runway():
+    from .runway_adapter import RunwayClient
+    return TaskProvider("runway", _generate_client(RunwayClient.from_env), Capabilities(t2v=True))
+
+
+def _kie():
+    from .kie_ai import KIEClient
+    return TaskProvider("kie", _generate_client(KIEClient), Capabilities(t2v=True))
+
+
+def _ffmpeg():
+    from .ffmpeg_stub import render_many_async
+
+    async def run(req: JobRequest) -> str:
+        return _first(await render_many_async(req.prompt, 1, req.out_dir, duration=int(req.seconds)))
+    return TaskProvider("ffmpeg", run, Capabilities(t2v=True, fps=(24,)), Cost())
+
+
+async def _to_thread_cancellable(fn: Callable[..., str], *args, **kw) -> str:
+    """
+    Синхронный клиент в потоке с threading.Event cancel: отмена корутины (JOBS,
+    таймаут) выставляет его, клиент отменяет предсказание у провайдера.
+    """
+    cancel = threading.Event()
+    try:
+        return await asyncio.to_thread(fn, *args, cancel=cancel, **kw)
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+
+
+def _wan_ui():
+    # app/adapters/replicate_adapter — синхронный клиент, которым пользуется UI (t2v).
+    # Фото — через app/replicate_adapter (SLA, ретраи, лог предсказаний): у UI-клиента i2v нет
+    from app.adapters.replicate_adapter import ReplicateClient, MAX_FRAMES_HARD, UI_FRAMES
+    from app import replicate_adapter as ra
+    client = ReplicateClient()
+    i2v_client = None
+
+    async def run(req: JobRequest) -> str:
+        nonlocal i2v_client
+        kw = {"fps": req.fps} if req.fps else {}
+        if req.image:
+            if i2v_client is None:
+                i2v_client = ra.ReplicateClient()
+            return await _to_thread_cancellable(i2v_client.generate_from_image, req.image, req.prompt,
+                                                req.seconds, seed=req.seed, **kw)
+        return await _to_thread_cancellable(client.generate_from_text, req.prompt, req.seconds,
+                                            seed=req.seed, **kw)
+
+    async def stage(image: str) -> str:
+        # catbox-заливка заранее (app.speculative); URL _image_url пропускает как есть
+        return await asyncio.to_thread(ra._image_url, image)
+    return TaskProvider("wan-ui", run, Capabilities(t2v=True, i2v=True, max_frames=MAX_FRAMES_HARD, fps=(5, 24),
+                                                    frames=UI_FRAMES), stage=stage)
+
+
+def _wan_i2v_version():
+    # app/adapters/wan_adapter.run_wan_i2v: синхронный, отдаёт URL
+    from app.adapters import wan_adapter
+    from app import replicate_adapter as ra
+
+    async def run(req: JobRequest) -> str:
+        url = await asyncio.to_thread(wan_adapter.run_wan_i2v, req.image, req.prompt)
+        dst = os.path.join(req.out_dir, f"wan_i2v_{uuid.uuid4().hex[:10]}.mp4")
+        await asyncio.to_thread(ra._download, url, dst)
+        return dst
+    return TaskProvider("wan-i2v", run, Capabilities(t2v=False, i2v=True, fps=(24,), max_seconds=6))
+
+
+def _wan_long():
+    # app.longform: длинный ролик из параллельных сегментов "wan", склейка xfade
+    from app.longform import LONG_MAX_SEC, LONG_PROVIDER, generate_long
+
+    async def run(req: JobRequest) -> str:
+        return await generate_long(req, provider=LONG_PROVIDER)
+    return TaskProvider("wan-long", run, Capabilities(t2v=True, i2v=True, fps=(24,), max_seconds=LONG_MAX_SEC))
+
+
+def _offline():
+    from app.adapters.offline_adapter import OfflineClient
+
+    async def run(req: JobRequest) -> str:
+        out = await OfflineClient(req.out_dir).generate_video(req.prompt, int(req.seconds))
+        if not (isinstance(out, str) and os.path.isfile(out)):
+            raise ProviderError(f"offline: {out}")
+        return out
+    return TaskProvider("offline", run, Capabilities(t2v=True), Cost())
+
+
+# ---------- реестр ----------
+
+class ProviderRegistry:
+    """name -> фабрика; экземпляр (и импорт клиента) создаётся при первом get()."""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], VideoProvider]] = {}
+        self._instances: Dict[str, VideoProvider] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], VideoProvider]) -> None:
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    def get(self, name: str) -> VideoProvider:
+        with self._lock:
+            inst = self._instances.get(name)
+            if inst is None:
+                factory = self._factories.get(name)
+                if factory is None:
+                    raise KeyError(f"unknown provider: {name}")
+                inst = self._instances[name] = factory()
+            return inst
+
+    def try_get(self, name: str) -> Optional[VideoProvider]:
+        try:
+            return self.get(name)
+        except Exception as e:
+            log.info("provider %s unavailable: %s", name, e)
+            return None
+
+    def capable(self, req: JobRequest, names: Optional[List[str]] = None) -> List[VideoProvider]:
+        out = []
+        for name in names or self.names():
+            p = self.try_get(name)
+            if p is not None and p.capabilities.supports(req):
+                out.append(p)
+        return out
+
+
+REGISTRY = ProviderRegistry()
+for _name, _factory in (
+    ("wan", ReplicateModelProvider),
+    ("wan-ui", _wan_ui),
+    ("wan-i2v", _wan_i2v_version),
+    ("wan-long", _wan_long),
+    ("sora", _sora),
+    ("luma", _luma),
+    ("runway", _runway),
+    ("kie", _kie),
+    ("ffmpeg", _ffmpeg),
+    ("offline", _offline),
+):
+    REGISTRY.register(_name, _factory)
+
+
+def get_provider(name: str) -> VideoProvider:
+    return REGISTRY.get(name)
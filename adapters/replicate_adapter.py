@@ -1,8 +1,19 @@
 import os, asyncio, aiohttp, logging, pathlib, time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 
 log = logging.getLogger(__name__)
-REPL_API = "https://api.replicate.com/v1"
+REPL_API = os.getenv("REPLICATE_API_BASE", "https://api.replicate.com/v1").rstrip("/")
+POLL_SEC = float(os.getenv("REPLICATE_POLL_SEC", "5"))
+
+# Сколько предсказаний Replicate держим одновременно (на весь процесс)
+MAX_CONCURRENCY = int(os.getenv("REPLICATE_MAX_CONCURRENCY", "4"))
+_SEM: Optional[asyncio.Semaphore] = None
+
+def _provider_semaphore() -> asyncio.Semaphore:
+    global _SEM
+    if _SEM is None:
+        _SEM = asyncio.Semaphore(max(1, MAX_CONCURRENCY))
+    return _SEM
 
 def _out_path(out_dir: str, suffix: str = ".mp4") -> str:
     p = pathlib.Path(out_dir); p.mkdir(parents=True, exist_ok=True)
@@ -63,29 +74,49 @@ class ReplicateClient:
         if openai_key:
             inputs["openai_api_key"] = openai_key
 
-        out_files: List[str] = []
+        variants = await self.generate_variants(prompt, n, out_dir, inputs=inputs)
+        out_files = [v for v in variants if isinstance(v, str)]
+        errors = [v for v in variants if isinstance(v, BaseException)]
+        if errors:
+            log.warning("Replicate: %d/%d variants failed: %s", len(errors), len(variants), errors[0])
+        if not out_files:
+            raise errors[0]
+        return out_files
+
+    async def generate_variants(self, prompt: str, n: int, out_dir: str,
+                                inputs: Optional[Dict[str, Any]] = None) -> List[Union[str, BaseException]]:
+        """
+        Все n предсказаний создаются сразу и ждутся параллельно (под общим лимитом
+        REPLICATE_MAX_CONCURRENCY). Порядок результатов совпадает с порядком вариантов;
+        на месте упавшего варианта лежит исключение — частичный результат не теряется.
+        """
+        if inputs is None:
+            inputs = {"prompt": prompt}
+        sem = _provider_semaphore()
         async with aiohttp.ClientSession() as s:
-            for _ in range(max(1, n)):
-                create = await self._post(s, f"{REPL_API}/predictions", {"version": self.version, "input": inputs})
-                pid = create.get("id"); get_url = create.get("urls", {}).get("get")
-                if not pid or not get_url:
-                    raise RuntimeError(f"Unexpected create response: {create}")
+            tasks = [self._one(s, sem, inputs, out_dir) for _ in range(max(1, n))]
+            return list(await asyncio.gather(*tasks, return_exceptions=True))
 
-                # poll
-                for _i in range(360):
-                    j = await self._get(s, get_url)
-                    st = j.get("status")
-                    if st in ("succeeded","failed","canceled"):
-                        if st != "succeeded":
-                            err = j.get('error')
-                            raise RuntimeError(f"Replicate status={st} id={pid} error={err}")
-                        output = j.get("output")
-                        urls = output if isinstance(output, list) else [output]
-                        out_path = _out_path(out_dir, ".mp4")
-                        await self._download(s, urls[0], out_path)
-                        out_files.append(out_path)
-                        break
-                    await asyncio.sleep(5)
-                else:
-                    raise RuntimeError(f"Timeout waiting replicate id={pid}")
-        return out_files
+    async def _one(self, s: aiohttp.ClientSession, sem: asyncio.Semaphore,
+                   inputs: Dict[str, Any], out_dir: str) -> str:
+        async with sem:
+            create = await self._post(s, f"{REPL_API}/predictions", {"version": self.version, "input": inputs})
+            pid = create.get("id"); get_url = create.get("urls", {}).get("get")
+            if not pid or not get_url:
+                raise RuntimeError(f"Unexpected create response: {create}")
+
+            # poll
+            for _i in range(360):
+                j = await self._get(s, get_url)
+                st = j.get("status")
+                if st in ("succeeded","failed","canceled"):
+                    if st != "succeeded":
+                        err = j.get('error')
+                        raise RuntimeError(f"Replicate status={st} id={pid} error={err}")
+                    output = j.get("output")
+                    urls = output if isinstance(output, list) else [output]
+                    out_path = _out_path(out_dir, ".mp4")
+                    await self._download(s, urls[0], out_path)
+                    return out_path
+                await asyncio.sleep(POLL_SEC)
+            raise RuntimeError(f"Timeout waiting replicate id={pid}")
@@ -1,15 +1,25 @@
-import subprocess, tempfile
+import tempfile
+
+from app.audiobeds import silent_track
+from app.mediainfo import try_probe
+from app.renderfarm import FARM, FINAL
 
 def ensure_audio(video_path: str) -> str:
+    """Добавляет тихую дорожку, если звука нет. Если звук уже есть — возвращает исходный путь."""
+    info = try_probe(video_path)
+    if info is not None and info.has_audio:
+        return video_path
+    # тишина из кэша app.audiobeds — здесь только мукс без кодирования
+    dur = info.duration if info is not None and info.duration > 0 else 600
     out = tempfile.NamedTemporaryFile(prefix="aud_", suffix=".mp4", delete=False).name
     cmd = [
         "ffmpeg", "-y",
         "-i", video_path,
-        "-f", "lavfi", "-t", "600", "-i", "anullsrc=channel_layout=stereo:sample_rate=48000",
-        "-c:v", "copy",
-        "-c:a", "aac", "-b:a", "128k",
+        "-i", silent_track(dur),
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c", "copy",
         "-shortest",
         out
     ]
-    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    FARM.run_sync(cmd, FINAL)
     return out
@@ -1,21 +1,25 @@
 # -*- coding: utf-8 -*-
-import os, json, shlex, time, subprocess, uuid, random
+import os, json, shlex, time, logging, subprocess, uuid, random, threading
 from pathlib import Path
 from typing import Dict, Any, Optional
 
-API_BASE = "https://api.replicate.com/v1"
+log = logging.getLogger("replicate_ui")
+
+API_BASE = os.environ.get("REPLICATE_API_BASE", "https://api.replicate.com/v1").rstrip("/")
 T2V_MODEL = os.environ.get("REPLICATE_MODEL_T2V", "wan-video/wan-2.2-t2v-fast")
 
 ROOT = Path("/opt/content_factory")
-OUT_DIR = ROOT / "out"
+OUT_DIR = Path(os.environ.get("OUT_DIR", str(ROOT / "out")))
 PRED_DIR = OUT_DIR / "predictions"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
-PRED_DIR.mkdir(parents=True, exist_ok=True)
 
 ENV_PATH = ROOT / ".env"
 DEFAULT_SECONDS = float(os.environ.get("DEFAULT_DURATION", "5"))
-DEFAULT_FPS = int(os.environ.get("REPLICATE_FPS", "24"))
+# fps генерации: не задан — выбирает app.frameplan (минимум кадров на длительность)
+DEFAULT_FPS = int(os.environ["REPLICATE_FPS"]) if os.environ.get("REPLICATE_FPS") else None
 MAX_FRAMES_HARD = 120
+# wan-2.2-t2v-fast принимает num_frames от 81 (см. app.frameplan.WAN_FRAMES)
+MIN_FRAMES = 81
+UI_FRAMES = tuple(range(MIN_FRAMES, MAX_FRAMES_HARD + 1))
 
 FIXED_SEED = int(os.environ.get("REPLICATE_FIXED_SEED", "123456789"))
 
@@ -36,6 +40,10 @@ class ReplicateError(RuntimeError):
     pass
 
 
+class ReplicateCancelled(ReplicateError):
+    pass
+
+
 def _run(cmd: str, check=True):
     p = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     if check and p.returncode != 0:
@@ -88,9 +96,9 @@ def _download(url: str, dst: Path):
     _run(cmd)
 
 
-def _calc_frames(seconds: float, fps: int) -> int:
-    n = int(round(seconds * fps))
-    return max(1, min(n, MAX_FRAMES_HARD))
+def _frame_plan(seconds: float, fps: Optional[int] = None):
+    from app.frameplan import plan_frames
+    return plan_frames(seconds, max_frames=MAX_FRAMES_HARD, fps_range=(5, 24), frames=UI_FRAMES, fps=fps)
 
 
 def _seed(seed: Optional[int]):
@@ -101,22 +109,43 @@ def _seed(seed: Optional[int]):
     return s or FIXED_SEED
 
 
-def _ffmpeg_norm(path: Path, fps: int) -> Path:
+def _ffmpeg_norm(path: Path, fps: int, interp: str = "") -> Path:
+    from app.frameplan import interp_filter
+    from app.mediainfo import is_normalized, remux_cmd, try_probe
+    from app.renderfarm import FARM, FINAL
     out = path.with_suffix(".final.mp4")
+    if not interp and is_normalized(try_probe(path), 720, fps, need_faststart=False):
+        FARM.run_sync(remux_cmd(path, out), FINAL)
+        return out
+    vf = ",".join(x for x in ("scale=-2:720:flags=lanczos", interp_filter(interp, int(fps))) if x)
     cmd = (
         f"ffmpeg -y -i {shlex.quote(str(path))} "
-        f"-vf scale=-2:720:flags=lanczos "
+        f"-vf {shlex.quote(vf)} "
         f"-r {int(fps)} "
         f"-c:v libx264 -preset veryfast -movflags +faststart "
         f"{shlex.quote(str(out))}"
     )
-    _run(cmd)
+    FARM.run_sync(cmd, FINAL)
     return out
 
 
-def _poll_prediction(url: str, tok: str) -> str:
+def _cancel_prediction(cancel_url: str, tok: str) -> None:
+    """POST /predictions/{id}/cancel — брошенная задача не должна жечь GPU."""
+    try:
+        _json_post(cancel_url, {}, tok)
+    except Exception as e:
+        log.warning("cancel failed %s: %s", cancel_url, e)
+
+
+def _poll_prediction(url: str, tok: str, cancel: Optional[threading.Event] = None,
+                     cancel_url: str = "") -> str:
     for _ in range(300):
-        time.sleep(1.3)
+        # wait вместо sleep: отмена срабатывает сразу, а не через 1.3 с
+        if cancel is not None and cancel.wait(1.3):
+            _cancel_prediction(cancel_url or f"{url.rstrip('/')}/cancel", tok)
+            raise ReplicateCancelled(f"prediction {url} cancelled")
+        if cancel is None:
+            time.sleep(1.3)
         js = _json_get(url, tok)
         st = js.get("status")
         if st == "succeeded":
@@ -134,27 +163,30 @@ def _poll_prediction(url: str, tok: str) -> str:
 class ReplicateClient:
     def __init__(self, token: Optional[str] = None):
         self.token = token or _ensure_token()
-
-    def _finalize(self, downloaded_path: Path, fps: int):
-        norm = _ffmpeg_norm(downloaded_path, fps)
-        final = OUT_DIR / f"wan22_{int(time.time())}.mp4"
-        norm.rename(final)
-        return final
-
-    def generate_from_text(self, prompt: str, seconds=DEFAULT_SECONDS, fps=DEFAULT_FPS, seed=None):
+        # папки — при создании клиента, не при импорте модуля
+        OUT_DIR.mkdir(parents=True, exist_ok=True)
+        PRED_DIR.mkdir(parents=True, exist_ok=True)
+
+    def _finalize(self, downloaded_path: Path, fps: int, interp: str = ""):
+        from app.storage import store_final
+        norm = _ffmpeg_norm(downloaded_path, fps, interp)
+        downloaded_path.unlink(missing_ok=True)
+        return store_final(norm, "wan22")
+
+    def generate_from_text(self, prompt: str, seconds=DEFAULT_SECONDS, fps=DEFAULT_FPS, seed=None,
+                           cancel: Optional[threading.Event] = None):
         if not prompt.strip():
             raise ReplicateError("Prompt empty")
 
-        fps = max(5, min(int(fps), 24))
-        frames = _calc_frames(seconds, fps)
+        plan = _frame_plan(float(seconds), fps)
         sd = _seed(seed)
 
         payload = {
             "input": {
                 "prompt": f"{PROMPT_PRIMER}{prompt}",
                 "negative_prompt": NEG,
-                "num_frames": frames,
-                "frames_per_second": fps,
+                "num_frames": plan.num_frames,
+                "frames_per_second": plan.fps,
                 "seed": sd,
             }
         }
@@ -162,10 +194,13 @@ class ReplicateClient:
         js = _json_post(f"{API_BASE}/models/{T2V_MODEL}/predictions", payload, self.token)
         get_url = js["urls"]["get"]
 
-        url = _poll_prediction(get_url, self.token)
+        url = _poll_prediction(get_url, self.token, cancel, js["urls"].get("cancel", ""))
+        if cancel is not None and cancel.is_set():
+            # отменили между последним опросом и скачиванием — клип никому не нужен
+            raise ReplicateCancelled(f"prediction {get_url} cancelled")
         tmp = OUT_DIR / f"tmp_{uuid.uuid4().hex[:10]}.mp4"
         _download(url, tmp)
-        final = self._finalize(tmp, fps)
+        final = self._finalize(tmp, plan.out_fps, plan.interpolate)
         return str(final)
 
     def text(self, p: str):
@@ -1,14 +1,24 @@
-import subprocess, tempfile
-from gtts import gTTS
+from app.renderfarm import FARM, FINAL
+from app.tts import TTS
 
 def tts_to_mp3(text: str) -> str:
-    mp3 = tempfile.NamedTemporaryFile(prefix="tts_", suffix=".mp3", delete=False)
-    gTTS(text=text, lang="ru").save(mp3.name)
-    return mp3.name
+    """
+    Звук для озвучки: piper из app.tts, если настроен (WAV), иначе gTTS (MP3).
+    Оба варианта кэшируются по тексту — повтор не ходит ни в piper, ни в сеть.
+    Файл лежит в кэше TTS: только читать.
+    """
+    wav = TTS.synth(text)
+    if wav:
+        return wav
+
+    def produce(tmp):
+        from gtts import gTTS  # сеть и gTTS — только на промахе кэша
+        gTTS(text=text, lang="ru").save(str(tmp))
+    return TTS.cached("gtts-ru", text, ".mp3", produce)
 
 def voiceover_video(video_path: str, text: str) -> str:
     mp3 = tts_to_mp3(text)
     out = video_path.rsplit(".", 1)[0] + "_vo.mp4"
     cmd = ["ffmpeg","-y","-i",video_path,"-i",mp3,"-c:v","copy","-c:a","aac","-b:a","192k","-shortest",out]
-    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    FARM.run_sync(cmd, FINAL)
     return out
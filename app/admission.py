@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Admission control для dispatcher'а: token bucket на пользователя и общий,
+вес запроса зависит от стоимости работы (превью / рендер 5с / рендер 10с).
+Рендеры дополнительно ограничены по числу одновременных; лишние ждут в очереди
+(пользователь видит свою позицию), переполненная очередь — отказ с подсказкой.
+
+Middleware только списывает токены и отказывает при полной очереди — быстро, до
+query.answer() в хендлере. Слот рендера берётся внутри задачи генерации
+(render_slot в app.bot_ui_patch): ожидание в очереди не съедает окно ответа на
+callback, а повторные тапы, которые JOBS склеит с идущей задачей, не платят токенами
+и не занимают место в очереди.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+log = logging.getLogger("admission")
+
+COST_PREVIEW = float(os.environ.get("ADMIT_COST_PREVIEW", "1"))
+COST_5S = float(os.environ.get("ADMIT_COST_5S", "5"))
+COST_10S = float(os.environ.get("ADMIT_COST_10S", "10"))
+
+USER_BURST = float(os.environ.get("ADMIT_USER_BURST", "12"))
+USER_RATE = float(os.environ.get("ADMIT_USER_RATE", "0.1"))        # токенов в секунду
+GLOBAL_BURST = float(os.environ.get("ADMIT_GLOBAL_BURST", "120"))
+GLOBAL_RATE = float(os.environ.get("ADMIT_GLOBAL_RATE", "2"))
+
+MAX_RENDERS = int(os.environ.get("ADMIT_MAX_RENDERS", "4"))        # одновременных генераций
+MAX_QUEUE = int(os.environ.get("ADMIT_MAX_QUEUE", "20"))
+
+RENDER_CALLBACKS = ("again", "sora2_go")
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self.ts = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    def wait_time(self, cost: float) -> float:
+        """Через сколько секунд хватит токенов (0 — уже хватает)."""
+        self._refill(time.monotonic())
+        if self.tokens >= cost:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (min(cost, self.capacity) - self.tokens) / self.rate
+
+    def take(self, cost: float) -> None:
+        self.tokens -= cost
+
+
+class AdmissionController:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users: Dict[int, TokenBucket] = {}
+        self._global = TokenBucket(GLOBAL_BURST, GLOBAL_RATE)
+        self._render_sem: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.queued = 0
+        self.stats = {
+            "admitted": 0,
+            "rejected_user": 0,
+            "rejected_global": 0,
+            "rejected_queue": 0,
+            "queue_wait_total_sec": 0.0,
+        }
+
+    def _sem(self) -> asyncio.Semaphore:
+        if self._render_sem is None:
+            self._render_sem = asyncio.Semaphore(max(1, MAX_RENDERS))
+        return self._render_sem
+
+    def try_admit(self, user_id: int, cost: float) -> float:
+        """0 — пропущен (токены списаны), иначе через сколько секунд повторить."""
+        if cost <= 0:
+            return 0.0
+        with self._lock:
+            ub = self._users.get(user_id)
+            if ub is None:
+                ub = self._users[user_id] = TokenBucket(USER_BURST, USER_RATE)
+            wait_u = ub.wait_time(cost)
+            if wait_u > 0:
+                self.stats["rejected_user"] += 1
+                return wait_u
+            wait_g = self._global.wait_time(cost)
+            if wait_g > 0:
+                self.stats["rejected_global"] += 1
+                return wait_g
+            ub.take(cost)
+            self._global.take(cost)
+            self.stats["admitted"] += 1
+            if self.stats["admitted"] % 256 == 0:
+                self._prune()
+            return 0.0
+
+    def _prune(self) -> None:
+        # полные бакеты не храним — так словарь не растёт вместе с числом пользователей
+        for uid in [u for u, b in self._users.items() if b.wait_time(b.capacity) == 0]:
+            self._users.pop(uid, None)
+
+    def queue_position(self) -> int:
+        """Позиция нового рендера: 0 — стартует сразу."""
+        free = MAX_RENDERS - self.in_flight
+        return 0 if free > 0 and self.queued == 0 else self.queued + 1
+
+    async def acquire_render(self) -> None:
+        self.queued += 1
+        t0 = time.monotonic()
+        try:
+            await self._sem().acquire()
+        finally:
+            self.queued -= 1
+        self.stats["queue_wait_total_sec"] += time.monotonic() - t0
+        self.in_flight += 1
+
+    def release_render(self) -> None:
+        self.in_flight -= 1
+        self._sem().release()
+
+    @asynccontextmanager
+    async def render_slot(self):
+        await self.acquire_render()
+        try:
+            yield
+        finally:
+            self.release_render()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, in_flight=self.in_flight, queued=self.queued,
+                        tracked_users=len(self._users), global_tokens=round(self._global.tokens, 2))
+
+
+ADMISSION = AdmissionController()
+
+
+def _render_cost(user_id: int, bot_state) -> float:
+    try:
+        dur = bot_state["last_dur"].get(user_id) or ""
+    except Exception:
+        dur = ""
+    return COST_10S if dur == "dur10" else COST_5S
+
+
+def _retry_text(wait: float) -> str:
+    return f"⏳ Слишком много запросов. Попробуй через {max(1, int(wait + 0.999))} сек."
+
+
+class AdmissionMiddleware(BaseMiddleware):
+    """Ставится после StateMiddleware: вес рендера берётся из bot_state['last_dur']."""
+
+    def __init__(self, controller: AdmissionController = ADMISSION):
+        super().__init__()
+        self.ctl = controller
+
+    async def on_pre_process_message(self, message: types.Message, data: Dict[str, Any]):
+        cost = COST_PREVIEW if message.content_type == "text" else 0
+        wait = self.ctl.try_admit(message.from_user.id, cost)
+        if wait > 0:
+            await message.answer(_retry_text(wait))
+            raise CancelHandler()
+
+    async def on_pre_process_callback_query(self, query: types.CallbackQuery, data: Dict[str, Any]):
+        if (query.data or "") not in RENDER_CALLBACKS:
+            return
+        user = query.from_user.id
+        bot_state = data.get("bot_state")
+        # повторный тап по идущей генерации — JOBS присоединит его, платить нечем
+        from app.bot_ui_patch import is_render_running
+        if bot_state is not None and is_render_running(user, bot_state):
+            return
+        wait = self.ctl.try_admit(user, _render_cost(user, bot_state))
+        if wait > 0:
+            await query.answer(_retry_text(wait), show_alert=True)
+            raise CancelHandler()
+        pos = self.ctl.queue_position()
+        if pos > MAX_QUEUE:
+            self.ctl.stats["rejected_queue"] += 1
+            await query.answer("⏳ Очередь заполнена, попробуй через минуту.", show_alert=True)
+            raise CancelHandler()
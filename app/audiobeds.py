@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Заранее подготовленный звук для микса: музыкальные подложки и тишина.
+
+Раньше каждый рендер заново декодировал MP3 из ASSETS_MUSIC, крутил его через
+aloop и применял volume, а ensure_audio генерировал 600 с anullsrc на каждый клип.
+Теперь:
+
+    bed = music_bed(dur)          # AAC-подложка нужной длины (или None, если музыки нет)
+    sil = silent_track(dur)       # тихая AAC-дорожка, дальше только -c copy
+
+- трек декодируется один раз в мастер: PCM 48 кГц стерео, громкость по loudnorm
+  (BED_LUFS) — разные треки звучат одинаково;
+- из мастера режутся подложки 5/10/15 с (BED_DURATIONS) с уже применённой
+  громкостью BED_GAIN и коротким затуханием в конце; длиннее — по запросу, с шагом 1 с;
+- всё лежит в AUDIO_BEDS_DIR (OUT_DIR/audio_beds), ключ — трек (путь, размер, mtime)
+  и параметры, поэтому замена файла в assets сама сбрасывает кэш.
+
+Прогрев (после деплоя / замены музыки): python -m app.audiobeds
+"""
+import os
+import sys
+import math
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from app.renderfarm import FARM, BATCH
+
+log = logging.getLogger("audiobeds")
+
+ASSETS_MUSIC = Path(os.environ.get("ASSETS_MUSIC", "/opt/content_factory/assets/music"))
+MUSIC_CANDIDATES = ("bg1.mp3", "bg.mp3", "music.mp3")
+AUDIO_BEDS_DIR = Path(os.environ.get(
+    "AUDIO_BEDS_DIR", str(Path(os.environ.get("OUT_DIR", "/opt/content_factory/out")) / "audio_beds")))
+BED_DURATIONS = tuple(int(x) for x in os.environ.get("BED_DURATIONS", "5,10,15").split(",") if x.strip())
+BED_LUFS = float(os.environ.get("BED_LUFS", "-16"))
+BED_GAIN = float(os.environ.get("BED_GAIN", "0.25"))
+BED_FADE_SEC = 0.5
+SAMPLE_RATE = 48000
+AAC_BITRATE = "192k"
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock(key: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _build(dst: Path, cmd_tail: List[str]) -> Path:
+    """ffmpeg ... <tmp> -> dst атомарно; параллельные запросы одного файла ждут первый."""
+    if dst.exists():
+        return dst
+    with _lock(str(dst)):
+        if dst.exists():
+            return dst
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f".{dst.stem}.{os.getpid()}.{threading.get_ident()}{dst.suffix}")
+        try:
+            FARM.run_sync(["ffmpeg", "-y"] + cmd_tail + [str(tmp)], BATCH)
+            os.replace(tmp, dst)
+        finally:
+            tmp.unlink(missing_ok=True)
+    return dst
+
+
+def bed_seconds(duration: float) -> int:
+    """Длина подложки: ближайшая стандартная не короче клипа, иначе — с округлением вверх."""
+    need = max(1, math.ceil(duration - 1e-3))
+    for d in sorted(BED_DURATIONS):
+        if d >= need:
+            return d
+    return need
+
+
+def find_music(music_dir: Path = ASSETS_MUSIC) -> Optional[Path]:
+    for cand in MUSIC_CANDIDATES:
+        p = music_dir / cand
+        if p.exists():
+            return p
+    return None
+
+
+def _track_id(music: Path) -> str:
+    st = music.stat()
+    raw = f"{music.resolve()}\0{st.st_size}\0{st.st_mtime_ns}\0{BED_LUFS}\0{SAMPLE_RATE}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def master(music: Path) -> Path:
+    """Трек, декодированный один раз: PCM, SAMPLE_RATE, стерео, громкость по loudnorm."""
+    dst = AUDIO_BEDS_DIR / "master" / f"{music.stem}_{_track_id(music)}.wav"
+    return _build(dst, [
+        "-i", str(music), "-vn",
+        "-af", f"loudnorm=I={BED_LUFS}:TP=-1.5:LRA=11,aresample={SAMPLE_RATE}",
+        "-ac", "2", "-c:a", "pcm_s16le",
+    ])
+
+
+def music_bed(duration: float, music: Optional[Path] = None) -> Optional[str]:
+    """AAC-подложка не короче duration (обрезает -shortest при муксе). None — музыки нет."""
+    music = music or find_music()
+    if music is None:
+        return None
+    secs = bed_seconds(duration)
+    src = master(music)
+    dst = AUDIO_BEDS_DIR / "beds" / f"{music.stem}_{_track_id(music)}_g{BED_GAIN:g}_{secs}s.m4a"
+    fade = f",afade=t=out:st={max(0.0, secs - BED_FADE_SEC):.3f}:d={BED_FADE_SEC}" if secs > BED_FADE_SEC else ""
+    return str(_build(dst, [
+        "-stream_loop", "-1", "-i", str(src), "-t", str(secs),
+        "-af", f"volume={BED_GAIN}{fade}",
+        "-c:a", "aac", "-b:a", AAC_BITRATE, "-ar", str(SAMPLE_RATE), "-ac", "2",
+    ]))
+
+
+def silent_track(duration: float) -> str:
+    """Тихая AAC-дорожка не короче duration; в клип кладётся через -c copy -shortest."""
+    secs = bed_seconds(duration)
+    dst = AUDIO_BEDS_DIR / "silence" / f"silence_{SAMPLE_RATE}_{secs}s.m4a"
+    return str(_build(dst, [
+        "-f", "lavfi", "-t", str(secs), "-i", f"anullsrc=channel_layout=stereo:sample_rate={SAMPLE_RATE}",
+        "-c:a", "aac", "-b:a", "128k",
+    ]))
+
+
+def warm(music_dir: Path = ASSETS_MUSIC, durations: Iterable[int] = BED_DURATIONS) -> List[str]:
+    """Готовит мастера, подложки и тишину для всех треков каталога."""
+    built = []
+    tracks = [p for p in sorted(music_dir.glob("*")) if p.suffix.lower() in (".mp3", ".wav", ".m4a", ".aac", ".flac", ".ogg")] \
+        if music_dir.is_dir() else []
+    for d in durations:
+        built.append(silent_track(d))
+        for t in tracks:
+            built.append(music_bed(d, t))
+    return built
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    target = Path(sys.argv[1]) if len(sys.argv) > 1 else ASSETS_MUSIC
+    for p in warm(target):
+        print(p)
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетная генерация: список промптов (CSV/JSONL) -> ролики + манифест.
+
+    python -m app.batch prompts.csv --out /opt/content_factory/out/batch/spring \\
+        --providers wan,kie --concurrency 6 --cap wan=4 --cap kie=2
+
+    rows = await run_batch(load_items("prompts.jsonl"), "/tmp/spring", providers=["wan"])
+
+Поля строки: prompt (обязательно), image (путь или URL), seconds|duration, provider, seed, id.
+
+- одинаковые строки (промпт без учёта регистра/пробелов, содержимое фото, длительность,
+  seed, провайдер) генерируются один раз, в манифесте — ссылка dup_of;
+- общий лимит --concurrency и свой на провайдера (--cap); строка без provider уходит
+  наименее загруженному из --providers, умеющему t2v/i2v; ошибка -> следующий провайдер
+  (--retries);
+- одно фото заливается один раз на провайдера (VideoProvider.stage_image), экземпляры
+  провайдеров (токен, клиенты) общие — из adapters.providers.REGISTRY;
+- каждый готовый ключ дописывается в <out>/checkpoint.jsonl: перезапуск той же командой
+  пропускает уже сделанное (если файл результата на месте);
+- итог — <out>/manifest.json в порядке входных строк (+ оценка цены из app.pricing).
+"""
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from adapters.providers import REGISTRY, JobRequest, VideoProvider
+from app.tracing import new_job, span
+
+log = logging.getLogger("batch")
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+BATCH_PROVIDERS = [p for p in os.environ.get("BATCH_PROVIDERS", "wan").split(",") if p.strip()]
+BATCH_RETRIES = int(os.environ.get("BATCH_RETRIES", "1"))
+
+
+# ---------- вход ----------
+
+def load_items(path) -> List[Dict[str, Any]]:
+    path = Path(path)
+    items = []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.suffix.lower() in (".jsonl", ".ndjson", ".json"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    items.append(json.loads(line))
+        else:
+            items.extend(dict(r) for r in csv.DictReader(f))
+    out = []
+    for i, it in enumerate(items):
+        prompt = (it.get("prompt") or "").strip()
+        if not prompt:
+            log.warning("batch: row %d has no prompt, skipped", i)
+            continue
+        out.append({
+            "row": i,
+            "id": str(it.get("id") or i),
+            "prompt": prompt,
+            "image": (it.get("image") or "").strip() or None,
+            "seconds": float(it.get("seconds") or it.get("duration") or 5),
+            "provider": (it.get("provider") or "").strip() or None,
+            "seed": int(it["seed"]) if str(it.get("seed") or "").strip() else None,
+        })
+    return out
+
+
+_file_digests: Dict[str, str] = {}
+
+
+def _image_id(image: Optional[str]) -> str:
+    if not image:
+        return ""
+    if image.lower().startswith(("http://", "https://")):
+        return image
+    real = os.path.realpath(image)
+    if real not in _file_digests:
+        h = hashlib.sha1()
+        with open(real, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _file_digests[real] = h.hexdigest()
+    return _file_digests[real]
+
+
+def item_key(it: Dict[str, Any]) -> str:
+    raw = json.dumps([it.get("provider") or "", " ".join(it["prompt"].split()).casefold(),
+                      _image_id(it.get("image")), it["seconds"], it.get("seed")], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+# ---------- чекпойнт ----------
+
+class Checkpoint:
+    def __init__(self, path: Path):
+        self.path = path
+        self.done: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue          # недописанная строка после падения
+                    if rec.get("status") == "ok" and rec.get("path") and os.path.exists(rec["path"]):
+                        self.done[rec["key"]] = rec
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(path, "a", encoding="utf-8")
+
+    def write(self, rec: Dict[str, Any]) -> None:
+        self._f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        self._f.close()
+
+
+# ---------- планировщик ----------
+
+class _Pool:
+    """Общий лимит + лимит на провайдера; выбор наименее загруженного."""
+
+    def __init__(self, names: List[str], concurrency: int, caps: Dict[str, int]):
+        self.total = asyncio.Semaphore(max(1, concurrency))
+        self.caps = {n: max(1, caps.get(n, concurrency)) for n in names}
+        self.sems = {n: asyncio.Semaphore(c) for n, c in self.caps.items()}
+        self.busy = {n: 0 for n in names}
+
+    def pick(self, candidates: List[VideoProvider]) -> VideoProvider:
+        return min(candidates, key=lambda p: self.busy.get(p.name, 0) / self.caps.get(p.name, 1))
+
+
+class BatchRunner:
+    def __init__(self, out_dir, providers: Optional[List[str]] = None, concurrency: int = BATCH_CONCURRENCY,
+                 caps: Optional[Dict[str, int]] = None, retries: int = BATCH_RETRIES):
+        self.out_dir = Path(out_dir)
+        self.providers = providers or BATCH_PROVIDERS
+        self.retries = max(0, retries)
+        self.pool = _Pool(list(dict.fromkeys(self.providers + list((caps or {}).keys()))), concurrency, caps or {})
+        self._staged: Dict[tuple, asyncio.Task] = {}
+
+    def _candidates(self, it: Dict[str, Any]) -> List[VideoProvider]:
+        names = [it["provider"]] if it.get("provider") else self.providers
+        req = JobRequest(prompt=it["prompt"], image=it.get("image"), seconds=it["seconds"])
+        return REGISTRY.capable(req, names)
+
+    async def _stage(self, provider: VideoProvider, image: str) -> str:
+        # одно фото — одна заливка на провайдера, даже если строк с ним много
+        key = (provider.name, os.path.realpath(image) if os.path.exists(image) else image)
+        task = self._staged.get(key)
+        if task is None or (task.done() and task.exception() is not None):
+            task = self._staged[key] = asyncio.ensure_future(provider.stage_image(image))
+        return await asyncio.shield(task)
+
+    async def _run_one(self, it: Dict[str, Any]) -> Dict[str, Any]:
+        new_job("batch", row=it["row"], id=it["id"])
+        tried: List[str] = []
+        error = "no capable provider"
+        async with self.pool.total:
+            for _ in range(self.retries + 1):
+                cands = [p for p in self._candidates(it) if p.name not in tried]
+                if not cands:
+                    break
+                provider = self.pool.pick(cands)
+                tried.append(provider.name)
+                sem = self.pool.sems.setdefault(provider.name, asyncio.Semaphore(1))
+                async with sem:
+                    self.pool.busy[provider.name] = self.pool.busy.get(provider.name, 0) + 1
+                    t0 = time.monotonic()
+                    try:
+                        image = await self._stage(provider, it["image"]) if it.get("image") else None
+                        req = JobRequest(prompt=it["prompt"], image=image, seconds=it["seconds"],
+                                         seed=it.get("seed"), out_dir=str(self.out_dir))
+                        with span("batch.item", provider=provider.name):
+                            path = await provider.run(req)
+                        return {"status": "ok", "provider": provider.name, "path": path,
+                                "elapsed": round(time.monotonic() - t0, 3), "tried": tried}
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        error = f"{provider.name}: {e}"
+                        log.warning("batch row=%s id=%s failed on %s: %s", it["row"], it["id"], provider.name, e)
+                    finally:
+                        self.pool.busy[provider.name] -= 1
+        return {"status": "failed", "error": error, "tried": tried}
+
+    async def run(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        ckpt = Checkpoint(self.out_dir / "checkpoint.jsonl")
+        keys: List[str] = []
+        broken: Dict[str, Dict[str, Any]] = {}
+        for it in items:
+            try:
+                keys.append(item_key(it))
+            except OSError as e:
+                # нет/не читается фото — падает только эта строка, в чекпойнт не пишем:
+                # после исправления её подхватит перезапуск
+                k = f"row{it['row']}"
+                log.warning("batch row=%s id=%s: image %s: %s", it["row"], it["id"], it.get("image"), e)
+                broken[k] = {"status": "failed", "error": f"image: {e}", "tried": []}
+                keys.append(k)
+        first: Dict[str, int] = {}
+        for i, k in enumerate(keys):
+            first.setdefault(k, i)
+        results: Dict[str, Dict[str, Any]] = {k: dict(ckpt.done[k], resumed=True) for k in first if k in ckpt.done}
+        results.update(broken)
+        todo = [k for k in first if k not in results]
+        log.info("batch: %d rows, %d unique, %d from checkpoint, %d to run",
+                 len(items), len(first), len(results), len(todo))
+
+        async def work(k: str) -> None:
+            res = await self._run_one(items[first[k]])
+            res["key"] = k
+            results[k] = res
+            ckpt.write(res)
+
+        try:
+            await asyncio.gather(*(work(k) for k in todo))
+        finally:
+            ckpt.close()
+
+        prices = _quotes(items)
+        rows = []
+        for i, (it, k) in enumerate(zip(items, keys)):
+            res = results.get(k, {"status": "pending"})
+            row = dict(it, key=k, status=res.get("status"), provider=res.get("provider") or it.get("provider"),
+                       path=res.get("path"), error=res.get("error"), elapsed=res.get("elapsed"),
+                       resumed=bool(res.get("resumed")), price=prices[i] if prices else None)
+            if first[k] != i:
+                row["dup_of"] = items[first[k]]["id"]
+            rows.append(row)
+        manifest = self.out_dir / "manifest.json"
+        tmp = manifest.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, manifest)
+        return rows
+
+
+def _quotes(items: List[Dict[str, Any]]) -> Optional[List[int]]:
+    try:
+        from app.pricing import quote_batch
+        return quote_batch([{"duration": it["seconds"], "sound": 0, "provider": it.get("provider")} for it in items])
+    except Exception as e:
+        log.debug("batch: no price estimate: %s", e)
+        return None
+
+
+async def run_batch(items: Iterable[Dict[str, Any]], out_dir, **kw) -> List[Dict[str, Any]]:
+    return await BatchRunner(out_dir, **kw).run(list(items))
+
+
+def _caps(values: List[str]) -> Dict[str, int]:
+    caps = {}
+    for v in values or []:
+        name, _, n = v.partition("=")
+        caps[name.strip()] = int(n)
+    return caps
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    ap = argparse.ArgumentParser(description="batch video generation")
+    ap.add_argument("input", help="CSV или JSONL: prompt, image, seconds, provider, seed, id")
+    ap.add_argument("--out", required=True, help="папка для checkpoint.jsonl и manifest.json")
+    ap.add_argument("--providers", default=",".join(BATCH_PROVIDERS))
+    ap.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    ap.add_argument("--cap", action="append", default=[], help="provider=N, можно несколько")
+    ap.add_argument("--retries", type=int, default=BATCH_RETRIES)
+    a = ap.parse_args()
+
+    rows = asyncio.run(run_batch(
+        load_items(a.input), a.out, providers=[p.strip() for p in a.providers.split(",") if p.strip()],
+        concurrency=a.concurrency, caps=_caps(a.cap), retries=a.retries))
+    ok = sum(1 for r in rows if r["status"] == "ok")
+    print(f"{ok}/{len(rows)} ok, manifest: {Path(a.out) / 'manifest.json'}")
+    sys.exit(0 if ok == len(rows) else 1)
@@ -39,7 +39,7 @@ def _migrate(con):
         status TEXT,
         created_at TEXT DEFAULT CURRENT_TIMESTAMP
     );""")
-    # tariffs (не используется напрямую, но схема сохранена)
+    # tariffs: читает app.pricing.TariffEngine (provider/resolution '*' = любой)
     cur.execute("""CREATE TABLE IF NOT EXISTS tariffs (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         duration REAL,
@@ -60,6 +60,19 @@ def _migrate(con):
         cur.execute("ALTER TABLE users ADD COLUMN preview_free_used INTEGER DEFAULT 0;")
     except Exception:
         pass
+    # тарифы по провайдеру и разрешению
+    for col in ("provider TEXT DEFAULT '*'", "resolution TEXT DEFAULT '*'"):
+        try:
+            cur.execute(f"ALTER TABLE tariffs ADD COLUMN {col};")
+        except Exception:
+            pass
+    # пустая таблица -> прежние тарифы из app.pricing (5с: 55/75, 10с: 110/150)
+    if cur.execute("SELECT COUNT(*) FROM tariffs").fetchone()[0] == 0:
+        from app.pricing import DEFAULT_TARIFFS
+        cur.executemany(
+            "INSERT INTO tariffs(duration, sound, price, active, provider, resolution) VALUES (?,?,?,1,'*','*')",
+            DEFAULT_TARIFFS,
+        )
     con.commit()
 
 
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
@@ -9,59 +9,61 @@ from aiogram import Bot, Dispatcher, executor, types
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher.middlewares import BaseMiddleware
 
-from app.bot_handlers_patch import setup_handlers
+from app.admission import ADMISSION, AdmissionMiddleware
+from app.jobs import JOBS
+from app.renderfarm import FARM
+from app.speculative import SPEC
+from app.tts import TTS
+from app.tracing import register_collector
+from app.state_store import StateStore
 from app.billing import init_billing
 
-# ---------- ИНИЦИАЛИЗАЦИЯ BILLING ----------
-try:
-    init_billing()
-    print("✅ Billing initialized.")
-except Exception as e:
-    print(f"⚠️ Billing init failed: {e}")
+# Импорт модуля ничего не создаёт: база, логи, Dispatcher и Bot — в create_app().
 
 # ---------- ЛОГИ ----------
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
-LOG_DIR = Path("/opt/content_factory/logs")
-LOG_DIR.mkdir(parents=True, exist_ok=True)
+LOG_DIR = Path(os.environ.get("LOG_DIR", "/opt/content_factory/logs"))
 LOG_FILE = LOG_DIR / "bot.log"
 
-_formatter = logging.Formatter(
-    fmt="%(asctime)s %(levelname)s:%(name)s:%(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
-
-root_logger = logging.getLogger()
-root_logger.setLevel(LOG_LEVEL)
-
-_console = logging.StreamHandler()
-_console.setFormatter(_formatter)
-_console.setLevel(LOG_LEVEL)
-root_logger.addHandler(_console)
-
-_file = RotatingFileHandler(
-    str(LOG_FILE),
-    maxBytes=5 * 1024 * 1024,
-    backupCount=5,
-    encoding="utf-8"
-)
-_file.setFormatter(_formatter)
-_file.setLevel(LOG_LEVEL)
-root_logger.addHandler(_file)
-
 log = logging.getLogger("bot")
-log.info("Logging configured.")
+
+
+def setup_logging() -> None:
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+    _formatter = logging.Formatter(
+        fmt="%(asctime)s %(levelname)s:%(name)s:%(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(LOG_LEVEL)
+
+    _console = logging.StreamHandler()
+    _console.setFormatter(_formatter)
+    _console.setLevel(LOG_LEVEL)
+    root_logger.addHandler(_console)
+
+    _file = RotatingFileHandler(
+        str(LOG_FILE),
+        maxBytes=5 * 1024 * 1024,
+        backupCount=5,
+        encoding="utf-8"
+    )
+    _file.setFormatter(_formatter)
+    _file.setLevel(LOG_LEVEL)
+    root_logger.addHandler(_file)
+
+    log.info("Logging configured.")
 
 # ---------- ГЛОБАЛЬНОЕ СОСТОЯНИЕ ----------
-BOT_STATE: Dict[str, Dict[int, Any]] = {
-    "last_prompt": {},
-    "last_image": {},
-    "last_dur": {},
-    "last_sound": {},
-}
+# last_prompt / last_image / last_dur / last_sound: TTL + LRU, опционально SQLite (STATE_DB);
+# создаётся при сборке бота (build_dp)
+BOT_STATE: Optional[StateStore] = None
 
 # ---------- MIDDLEWARE ----------
 class StateMiddleware(BaseMiddleware):
-    def __init__(self, state_obj: Dict[str, Dict[int, Any]]):
+    def __init__(self, state_obj: StateStore):
         super().__init__()
         self.state_obj = state_obj
 
@@ -73,6 +75,7 @@ class StateMiddleware(BaseMiddleware):
 
 # ---------- DP / BOT ----------
 def build_dp():
+    global BOT_STATE
     token = os.environ.get("BOT_TOKEN", "").strip()
     if not token:
         raise RuntimeError("BOT_TOKEN not set in environment")
@@ -81,12 +84,52 @@ def build_dp():
     storage = MemoryStorage()
     dp = Dispatcher(bot, storage=storage)
 
+    if BOT_STATE is None:
+        BOT_STATE = StateStore.from_env()
+
     dp.middleware.setup(StateMiddleware(BOT_STATE))
+    dp.middleware.setup(AdmissionMiddleware())
+
+    register_collector(lambda: {f"admission_{k}": v for k, v in ADMISSION.snapshot().items()})
+    register_collector(lambda: {f"jobs_{k}": v for k, v in JOBS.stats.items()})
+    register_collector(lambda: {f"farm_{k}": v for k, v in FARM.snapshot().items()})
+    register_collector(lambda: {f"state_{k}": v for k, v in BOT_STATE.snapshot().items()})
+    register_collector(lambda: {f"tts_{k}": v for k, v in TTS.snapshot().items()})
+    register_collector(lambda: {f"spec_{k}": v for k, v in SPEC.snapshot().items()})
+    # хендлеры тянут за собой UI, провайдеры и billing — только когда собираем бота
+    from app.bot_handlers_patch import setup_handlers
     setup_handlers(dp)
 
     return dp, bot
 
-dp, bot = build_dp()
+_app: Optional[Tuple[Dispatcher, Bot]] = None
+
+
+def create_app() -> Tuple[Dispatcher, Bot]:
+    """
+    Фабрика приложения: billing, логи, папки, состояние, Dispatcher + Bot.
+    Один раз на процесс; повторный вызов отдаёт то же самое.
+    """
+    global _app
+    if _app is not None:
+        return _app
+    setup_logging()
+    try:
+        init_billing()
+        log.info("Billing initialized.")
+    except Exception as e:
+        log.warning("Billing init failed: %s", e)
+    Path(os.environ.get("OUT_DIR", "/opt/content_factory/out")).mkdir(parents=True, exist_ok=True)
+    _app = build_dp()
+    return _app
+
+
+def __getattr__(name):
+    # совместимость: `from app.bot import dp` собирает приложение при первом обращении
+    if name in ("dp", "bot"):
+        dp, bot = create_app()
+        return dp if name == "dp" else bot
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ---------- STARTUP ----------
 async def on_startup(dispatcher: Dispatcher):
@@ -98,5 +141,6 @@ async def on_startup(dispatcher: Dispatcher):
 
 # ---------- MAIN ----------
 if __name__ == "__main__":
+    dp, _ = create_app()
     log.info("Polling…")
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+    executor.start_polling(dp, skip_updates=False, on_startup=on_startup)
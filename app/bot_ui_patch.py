@@ -2,76 +2,124 @@
 import os
 import asyncio
 import logging
-import tempfile
-import subprocess
 from pathlib import Path
 
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.exceptions import InvalidQueryID
 
-from app.adapters.replicate_adapter import ReplicateClient
+from adapters.providers import REGISTRY, JobRequest
+from app.admission import ADMISSION
 from app.billing import ensure_user, plan_preview, commit_preview_charge
+from app.jobs import JOBS, JobCancelled
+from app.renderfarm import FARM, FINAL, PREVIEW
+from app.speculative import SPEC
+from app.state_store import using_file
+from app.storage import new_tempdir, store_final, discard
+from app.tracing import new_job, span
 
 log = logging.getLogger("ui")
 
+# папку создаёт app.bot.create_app
 OUT_DIR = os.environ.get("OUT_DIR", "/opt/content_factory/out")
-Path(OUT_DIR).mkdir(parents=True, exist_ok=True)
 
 DEFAULT_DURATION = int(os.environ.get("DEFAULT_DURATION", "5"))
 FPS_FINAL = 24
 CUT_START = 0.20
 
-_replicate = None
+# провайдер из adapters.providers.REGISTRY; по умолчанию "wan-ui" — тот же клиент
+# app/adapters/replicate_adapter, что и раньше (свои праймеры, негативы и кадры).
+# "wan" — app/replicate_adapter через submit/poll, включается только явно
+UI_PROVIDER = os.environ.get("UI_PROVIDER", "wan-ui")
 
 
-def _ensure_clients():
-    """Гарантируем создание клиента Replicate один раз."""
-    global _replicate
-    if _replicate is None:
-        _replicate = ReplicateClient()
-
-
-def _postprocess(path: str) -> str:
-    """Обрезаем первые кадры + нормализуем до 24fps + 720p."""
-    src = Path(path)
-    final = src.with_suffix(".fx.mp4")
-
-    cmd = (
+def _postprocess_cmd(src, dst) -> str:
+    return (
         f"ffmpeg -y -i \"{src}\" "
         f"-ss {CUT_START} "
         f"-vf scale=-2:720:flags=lanczos "
         f"-r {FPS_FINAL} "
         f"-c:v libx264 -preset veryfast -movflags +faststart "
-        f"\"{final}\""
+        f"\"{dst}\""
     )
 
+
+def _preview_cmd(seconds: int, dst) -> str:
+    return (
+        f"ffmpeg -y -f lavfi -i color=c=black:s=720x720:d={seconds} "
+        f"-c:v libx264 -pix_fmt yuv420p \"{dst}\""
+    )
+
+
+async def _postprocess(path: str) -> str:
+    """Обрезаем первые кадры + нормализуем до 24fps + 720p."""
+    src = Path(path)
+    final = new_tempdir("fx") / "fx.mp4"
+    cmd = _postprocess_cmd(src, final)
+
     try:
-        subprocess.run(cmd, shell=True, check=True)
+        with span("ffmpeg.postprocess"):
+            await FARM.run(cmd, FINAL)
     except Exception as e:
         log.error("postprocess: %s", e)
+        discard(final)
         return str(src)
 
-    return str(final)
+    stored = await asyncio.to_thread(store_final, final, "ui_fx")
+    if stored != src:
+        src.unlink(missing_ok=True)
+    return str(stored)
 
 
 async def _generate(prompt: str, seconds: int, image: str | None):
-    """WAN 2.2 генерация через Replicate."""
-    _ensure_clients()
-
-    if image:
-        out = _replicate.generate_from_image(
-            image=image,
-            prompt=prompt,
-            seconds=seconds,
-        )
-    else:
-        out = _replicate.generate_from_text(
-            prompt=prompt,
-            seconds=seconds,
-        )
+    """WAN 2.2 генерация через Replicate. Отмена корутины отменяет и предсказание."""
+    provider = REGISTRY.get(UI_PROVIDER)
+    with span("generate.total", provider=UI_PROVIDER):
+        out = await provider.run(JobRequest(prompt=prompt, image=image, seconds=seconds, out_dir=OUT_DIR))
+    return await _postprocess(out)
+
+
+def _render_key(prompt: str, img: str | None):
+    return (prompt, img, DEFAULT_DURATION)
+
+
+def is_render_running(user: int, bot_state) -> bool:
+    """Кнопка рендера сейчас присоединится к идущей задаче (для app.admission)."""
+    prompt = bot_state["last_prompt"].get(user)
+    return bool(prompt) and JOBS.is_duplicate(user, _render_key(prompt, bot_state["last_image"].get(user)))
+
 
-    return _postprocess(out)
+async def _generate_slot(prompt: str, seconds: int, image: str | None):
+    # слот рендера — внутри задачи JOBS: дубли его не занимают, отмена освобождает
+    async with ADMISSION.render_slot():
+        return await _generate(prompt, seconds, image)
+
+
+async def _generate_for_user(message: types.Message, user: int, prompt: str, img: str | None):
+    """
+    Генерация через JOBS: повторный тап присоединяется к идущей задаче,
+    новый запрос отменяет старую (у провайдера и локальный ffmpeg).
+    """
+    key = _render_key(prompt, img)
+    if JOBS.is_duplicate(user, key):
+        await message.answer("⏳ Уже генерирую, подожди немного.")
+        return
+    new_job("generate", user=user, i2v=bool(img))
+    try:
+        # новое фото от пользователя не удалит это, пока задача его читает
+        with using_file(img):
+            # фото обычно уже залито в handle_photo; нет — провайдер зальёт сам
+            staged = await SPEC.take(user, "image", img, default=img) if img else None
+            pos = ADMISSION.queue_position()
+            if pos > 0:
+                await message.answer(f"🕒 Ты в очереди: {pos}-й.")
+            out = await JOBS.run(user, key, lambda: _generate_slot(prompt, DEFAULT_DURATION, staged))
+    except JobCancelled as e:
+        log.info("job user=%s cancelled: %s", user, e)
+        if "timeout" in str(e):
+            await message.answer("⌛ Генерация заняла слишком долго и отменена.")
+        return
+    await _send_preview(message, out)
 
 
 def _menu():
@@ -95,15 +143,12 @@ async def _preview(user_id: int, prompt: str, seconds: int, sound: int):
     if not ok:
         return f"❌ Не хватает средств. Нужно {cost} ₽, нехватает {need} ₽."
 
-    tmp = Path(tempfile.mkdtemp()) / "preview.mp4"
-
-    cmd = (
-        f"ffmpeg -y -f lavfi -i color=c=black:s=720x720:d={seconds} "
-        f"-c:v libx264 -pix_fmt yuv420p \"{tmp}\""
-    )
+    tmp = new_tempdir("preview") / "preview.mp4"
+    cmd = _preview_cmd(seconds, tmp)
 
     try:
-        subprocess.run(cmd, shell=True, check=True)
+        with span("preview.encode"):
+            await FARM.run(cmd, PREVIEW)
     except Exception as e:
         log.error("preview fail: %s", e)
         return "Ошибка предпросмотра."
@@ -117,7 +162,8 @@ async def _preview(user_id: int, prompt: str, seconds: int, sound: int):
 async def _send_preview(message: types.Message, path: str):
     """Отправка предпросмотра пользователю."""
     try:
-        await message.answer_video(open(path, "rb"), caption="🎬 Предпросмотр.")
+        with span("telegram.upload"), open(path, "rb") as f:
+            await message.answer_video(f, caption="🎬 Предпросмотр.")
     except Exception as e:
         log.error("send_preview: %s", e)
         await message.answer("Ошибка отправки.")
@@ -130,13 +176,17 @@ async def handle_text(message: types.Message, bot_state):
 
     prompt = message.text.strip()
     bot_state["last_prompt"][user] = prompt
+    new_job("preview", user=user)
 
-    await message.answer("🟡 Готовлю предпросмотр…", reply_markup=_menu())
-
-    prev = await _preview(user, prompt, DEFAULT_DURATION, 0)
+    # ответ в телеграм и кодирование превью — параллельно
+    _, prev = await asyncio.gather(
+        message.answer("🟡 Готовлю предпросмотр…", reply_markup=_menu()),
+        _preview(user, prompt, DEFAULT_DURATION, 0),
+    )
 
     if prev.endswith(".mp4"):
         await _send_preview(message, prev)
+        discard(prev)
     else:
         await message.answer(prev)
 
@@ -147,14 +197,30 @@ async def handle_photo(message: types.Message, bot_state):
     ensure_user(user)
 
     ph = message.photo[-1]
-    tmp = Path(tempfile.mkdtemp()) / "img.jpg"
+    tmp = new_tempdir("photo") / "img.jpg"
     await ph.download(tmp)
 
     bot_state["last_image"][user] = str(tmp)
+    # пока пользователь пишет описание — заливаем фото туда, откуда его возьмёт провайдер
+    provider = REGISTRY.try_get(UI_PROVIDER)
+    if provider is not None and provider.capabilities.i2v:
+        SPEC.start(user, "image", str(tmp), lambda: provider.stage_image(str(tmp)))
 
     await message.answer("🟡 Фото получено. Введи описание сцены.", reply_markup=_menu())
 
 
+async def _last_image(message: types.Message, user: int, bot_state):
+    """
+    (path | None, ok). Фото удалено с диска (TTL, квота) — ссылка уже забыта,
+    говорим пользователю и генерацию не запускаем: он ждёт ролик по фото.
+    """
+    img = bot_state["last_image"].get(user)
+    if img is None and bot_state.file_gone(user, "last_image"):
+        await message.answer("⚠️ Фото устарело и удалено. Пришли его ещё раз.")
+        return None, False
+    return img, True
+
+
 async def _sora2(message: types.Message, bot_state):
     """Усиленный режим SORA 2."""
     user = message.from_user.id
@@ -165,12 +231,13 @@ async def _sora2(message: types.Message, bot_state):
         await message.answer("Сначала текст.")
         return
 
-    img = bot_state["last_image"].get(user)
+    img, ok = await _last_image(message, user, bot_state)
+    if not ok:
+        return
     await message.answer("🧩 Генерирую SORA 2…")
 
     try:
-        out = await _generate(prompt, DEFAULT_DURATION, img)
-        await _send_preview(message, out)
+        await _generate_for_user(message, user, prompt, img)
     except Exception as e:
         log.error("sora2: %s", e)
         await message.answer("Ошибка генерации.")
@@ -188,16 +255,18 @@ async def handle_callback(query: types.CallbackQuery, bot_state):
             await query.answer()
 
             prompt = bot_state["last_prompt"].get(user)
-            img = bot_state["last_image"].get(user)
-
             if not prompt:
                 await query.message.answer("Сначала текст.")
                 return
 
-            await query.message.answer("🔁 Генерирую…")
+            img, ok = await _last_image(query.message, user, bot_state)
+            if not ok:
+                return
+
+            if not JOBS.is_duplicate(user, _render_key(prompt, img)):
+                await query.message.answer("🔁 Генерирую…")
 
-            out = await _generate(prompt, DEFAULT_DURATION, img)
-            await _send_preview(query.message, out)
+            await _generate_for_user(query.message, user, prompt, img)
             return
 
         if data == "sora2_go":
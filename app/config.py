@@ -2,13 +2,21 @@ from pydantic import BaseModel
 from dotenv import load_dotenv
 import os
 
-load_dotenv()
-
 class Settings(BaseModel):
-    bot_token: str = os.getenv("BOT_TOKEN", "")
-    openai_key: str = os.getenv("OPENAI_API_KEY", "")
-    openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    prompt_style: str = os.getenv("PROMPT_STYLE", "cinematic-v1")
+    bot_token: str = ""
+    openai_key: str = ""
+    openai_model: str = "gpt-4o-mini"
+    prompt_style: str = "cinematic-v1"
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        load_dotenv()
+        return cls(
+            bot_token=os.getenv("BOT_TOKEN", ""),
+            openai_key=os.getenv("OPENAI_API_KEY", ""),
+            openai_model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+            prompt_style=os.getenv("PROMPT_STYLE", "cinematic-v1"),
+        )
 
     def validate(self):
         miss = []
@@ -18,4 +26,17 @@ class Settings(BaseModel):
             raise SystemExit(f"Отсутствуют переменные: {', '.join(miss)}")
         return self
 
-settings = Settings().validate()
+_settings = None
+
+def get_settings() -> Settings:
+    """.env читается и проверяется при первом обращении, а не при импорте."""
+    global _settings
+    if _settings is None:
+        _settings = Settings.from_env().validate()
+    return _settings
+
+def __getattr__(name):
+    # старый импорт `from app.config import settings` — тоже лениво
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик (num_frames, fps) для генерации.
+
+Провайдеры вроде WAN считают (и берут деньги) за сгенерированные кадры, а не за секунды:
+5 с как 100 кадров @ 20 fps стоят на четверть дороже, чем 81 @ 16 fps, при той же
+длительности. Недостающие до 24 fps кадры дешевле досчитать локально в ffmpeg.
+
+    plan = plan_frames(5, max_frames=100, fps_range=(5, 24), frames=WAN_FRAMES)
+    plan.num_frames, plan.fps        # что просить у провайдера: 81, 16
+    interp_filter(plan)              # "framerate=fps=24" / "minterpolate=..." / ""
+
+Правила:
+- длительность честная: не короче заказанной и не длиннее на FRAMEPLAN_TOL_SEC;
+- fps генерации не ниже FRAMEPLAN_MIN_FPS (ниже интерполяция заметно мылит движение),
+  среди подходящих — минимум кадров, при равенстве — выше fps;
+- если при таком fps длительность не влезает в max_frames (10 с у WAN) — берём самый
+  высокий fps, при котором влезает (как раньше: 100 @ 10);
+- fps задан явно — он и остаётся, подбирается только число кадров;
+- интерполяция до FRAMEPLAN_TARGET_FPS: FRAMEPLAN_INTERP = blend (framerate, дёшево) |
+  minterpolate (motion-compensated, дорого по CPU) | none (как раньше, дублирование -r).
+"""
+import os
+import sys
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+FRAMEPLAN_MIN_FPS = int(os.environ.get("FRAMEPLAN_MIN_FPS", "16"))
+FRAMEPLAN_TOL_SEC = float(os.environ.get("FRAMEPLAN_TOL_SEC", "0.3"))
+_SHORT_SEC = 0.05                   # короче заказанного — только на округление
+FRAMEPLAN_TARGET_FPS = int(os.environ.get("FRAMEPLAN_TARGET_FPS", "24"))
+FRAMEPLAN_INTERP = os.environ.get("FRAMEPLAN_INTERP", "blend").strip().lower()
+
+# WAN 2.2 (Replicate): устойчивые значения num_frames
+WAN_FRAMES = (81, 84, 88, 92, 96, 100)
+
+
+@dataclass
+class FramePlan:
+    num_frames: int
+    fps: int
+    out_fps: int
+    interpolate: str = ""           # "" | "blend" | "minterpolate"
+
+    @property
+    def seconds(self) -> float:
+        return self.num_frames / float(self.fps)
+
+    @property
+    def frames_per_second(self) -> float:
+        """Сгенерированных кадров на секунду готового видео — то, за что платим."""
+        return self.num_frames / self.seconds if self.seconds else 0.0
+
+
+def _fps_values(fps_range: Sequence[int]) -> Tuple[int, ...]:
+    fps_range = tuple(int(x) for x in fps_range) or (FRAMEPLAN_TARGET_FPS,)
+    if len(fps_range) == 2 and fps_range[0] < fps_range[1]:
+        return tuple(range(fps_range[0], fps_range[1] + 1))
+    return fps_range
+
+
+def _frame_values(max_frames: int, frames: Sequence[int], seconds: float, fps_hi: int) -> Tuple[int, ...]:
+    if frames:
+        return tuple(sorted(int(n) for n in frames if not max_frames or n <= max_frames))
+    top = max_frames or int(round(seconds * fps_hi)) + 1
+    return tuple(range(1, top + 1))
+
+
+def _interp(fps: int, target: int, method: Optional[str]) -> Tuple[int, str]:
+    method = FRAMEPLAN_INTERP if method is None else method
+    if fps >= target or method not in ("blend", "minterpolate"):
+        return fps, ""
+    return target, method
+
+
+def plan_frames(seconds: float, max_frames: int = 0, fps_range: Sequence[int] = (5, 24),
+                frames: Sequence[int] = (), fps: Optional[int] = None,
+                min_fps: int = FRAMEPLAN_MIN_FPS, tol: float = FRAMEPLAN_TOL_SEC,
+                target_fps: int = FRAMEPLAN_TARGET_FPS, interp: Optional[str] = None) -> FramePlan:
+    seconds = max(0.1, float(seconds))
+    fps_vals = _fps_values(fps_range)
+    if fps:
+        # явный fps — в пределах допустимого, кадры под длительность
+        fps_vals = (min(fps_vals, key=lambda f: abs(f - int(fps))),)
+    n_vals = _frame_values(max_frames, frames, seconds, max(fps_vals))
+
+    feasible = [(n, f) for f in fps_vals for n in n_vals if -_SHORT_SEC <= n / f - seconds <= tol]
+    good = [c for c in feasible if c[1] >= min_fps]
+    if good:
+        n, f = min(good, key=lambda c: (c[0], -c[1]))
+    elif feasible:
+        n, f = min(feasible, key=lambda c: (-c[1], c[0]))
+    else:
+        # длительность не достижима в допуске: ближайшая по длительности, при равенстве — выше fps
+        n, f = min(((n, f) for f in fps_vals for n in n_vals),
+                   key=lambda c: (abs(c[0] / c[1] - seconds), -c[1]))
+    out_fps, method = _interp(f, target_fps, interp)
+    return FramePlan(num_frames=n, fps=f, out_fps=out_fps, interpolate=method)
+
+
+def plan_for(caps, seconds: float, fps: Optional[int] = None, **kw) -> FramePlan:
+    """План по adapters.providers.Capabilities (max_frames, fps, frames)."""
+    return plan_frames(seconds, max_frames=getattr(caps, "max_frames", 0), fps_range=getattr(caps, "fps", (24,)),
+                       frames=getattr(caps, "frames", ()), fps=fps, **kw)
+
+
+def interp_filter(plan_or_method, out_fps: int = FRAMEPLAN_TARGET_FPS) -> str:
+    """Фильтр ffmpeg (-vf) для досчёта кадров до out_fps; пустая строка — не нужно."""
+    if isinstance(plan_or_method, FramePlan):
+        method, out_fps = plan_or_method.interpolate, plan_or_method.out_fps
+    else:
+        method = plan_or_method or ""
+    if method == "minterpolate":
+        return f"minterpolate=fps={out_fps}:mi_mode=mci:mc_mode=aobmc:me_mode=bidir:vsbmc=1"
+    if method == "blend":
+        return f"framerate=fps={out_fps}"
+    return ""
+
+
+if __name__ == "__main__":
+    # python -m app.frameplan 5 [max_frames] [fps]
+    secs = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    mf = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    p = plan_frames(secs, max_frames=mf, frames=WAN_FRAMES if mf == 100 else (),
+                    fps=int(sys.argv[3]) if len(sys.argv) > 3 else None)
+    print(f"{p.num_frames} frames @ {p.fps} fps = {p.seconds:.2f}s -> {p.out_fps} fps "
+          f"({p.interpolate or 'no interpolation'}), {p.frames_per_second:.1f} frames/delivered s")
+    print(interp_filter(p))
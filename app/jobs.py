@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Реестр генераций по пользователям.
+
+- повторный тап с тем же запросом (prompt/фото/длительность) не запускает новую
+  генерацию, а присоединяется к уже идущей;
+- новый запрос того же пользователя отменяет старый (supersede);
+- таймаут JOB_TIMEOUT_SEC тоже отменяет задачу.
+Отмена идёт через asyncio.CancelledError: провайдер (adapters.providers.VideoProvider.run)
+отменяет предсказание у себя, app.utils.proc.run_async убивает ffmpeg/curl.
+"""
+import os
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+log = logging.getLogger("jobs")
+
+JOB_TIMEOUT_SEC = float(os.environ.get("JOB_TIMEOUT_SEC", "600"))
+
+
+class JobCancelled(RuntimeError):
+    """Задачу отменили: её заменил более новый запрос или истёк таймаут."""
+
+
+@dataclass
+class Job:
+    user_id: int
+    key: Hashable
+    task: asyncio.Task
+    reason: str = ""
+    waiters: int = field(default=1)
+
+
+class JobManager:
+    def __init__(self, timeout: float = JOB_TIMEOUT_SEC):
+        self.timeout = timeout
+        self._jobs: Dict[int, Job] = {}
+        self.stats = {"started": 0, "coalesced": 0, "superseded": 0, "timeouts": 0}
+
+    def running(self, user_id: int) -> Optional[Job]:
+        job = self._jobs.get(user_id)
+        if job is not None and job.task.done():
+            return None
+        return job
+
+    def is_duplicate(self, user_id: int, key: Hashable) -> bool:
+        job = self.running(user_id)
+        return job is not None and job.key == key
+
+    def cancel(self, user_id: int, reason: str = "cancelled") -> bool:
+        job = self.running(user_id)
+        if job is None:
+            return False
+        job.reason = reason
+        job.task.cancel()
+        return True
+
+    async def run(self, user_id: int, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        job = self.running(user_id)
+        if job is not None and job.key == key:
+            # дубль — ждём ту же задачу
+            job.waiters += 1
+            self.stats["coalesced"] += 1
+            log.info("job user=%s coalesced (waiters=%d)", user_id, job.waiters)
+        else:
+            if job is not None:
+                self.stats["superseded"] += 1
+                log.info("job user=%s superseded", user_id)
+                self.cancel(user_id, "superseded")
+            task = asyncio.ensure_future(self._with_timeout(user_id, factory))
+            job = self._jobs[user_id] = Job(user_id, key, task)
+            self.stats["started"] += 1
+            task.add_done_callback(lambda t, u=user_id, j=job: self._done(u, j))
+
+        try:
+            # shield: отмена одного ожидающего (например, хендлера) не рушит общую задачу
+            return await asyncio.shield(job.task)
+        except asyncio.CancelledError:
+            if job.task.cancelled():
+                raise JobCancelled(job.reason or "cancelled")
+            raise
+
+    async def _with_timeout(self, user_id: int, factory: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await asyncio.wait_for(factory(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise JobCancelled(f"timeout after {self.timeout:.0f}s")
+
+    def _done(self, user_id: int, job: Job) -> None:
+        if self._jobs.get(user_id) is job:
+            self._jobs.pop(user_id, None)
+
+
+JOBS = JobManager()
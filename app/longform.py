@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Длинные ролики (20–30 с) из коротких сегментов провайдера.
+
+    path = await generate_long(JobRequest(prompt="...", seconds=24), provider="wan")
+    python -m app.longform "неоновый город ночью" --seconds 24 [--image photo.jpg] [--mode chain]
+
+WAN держит ~100 кадров на клип, поэтому 10 с — это уже 10 fps. Здесь длительность
+режется на сегменты по LONG_SEGMENT_SEC с перекрытием LONG_XFADE_SEC, сегменты
+генерируются провайдером и склеиваются локально одним проходом ffmpeg (цепочка xfade).
+
+Режимы (LONG_MODE):
+- parallel — все сегменты отправляются сразу: время ≈ один сегмент, а не N.
+  Общий seed и промпт; фото (если есть) заливается один раз и служит опорой для
+  каждого i2v-сегмента, стыки сглаживает crossfade;
+- chain — каждый следующий сегмент — i2v от последнего кадра предыдущего (непрерывное
+  движение), но по природе последовательно: время растёт линейно. Провайдер без i2v —
+  откат на parallel.
+
+Сегмент, упавший у провайдера, перезапускается (LONG_RETRIES); если не вышло —
+остальные отменяются (VideoProvider.run отменяет и задачу у провайдера).
+В реестре adapters.providers — как провайдер "wan-long".
+"""
+import os
+import sys
+import math
+import random
+import shutil
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from adapters.providers import REGISTRY, JobRequest, ProviderError, VideoProvider
+from app.tracing import span
+
+log = logging.getLogger("longform")
+
+LONG_PROVIDER = os.environ.get("LONG_PROVIDER", "wan")
+LONG_MODE = os.environ.get("LONG_MODE", "parallel").strip().lower()
+LONG_SEGMENT_SEC = float(os.environ.get("LONG_SEGMENT_SEC", "5"))
+LONG_XFADE_SEC = float(os.environ.get("LONG_XFADE_SEC", "0.5"))
+LONG_MAX_SEC = float(os.environ.get("LONG_MAX_SEC", "30"))
+LONG_RETRIES = int(os.environ.get("LONG_RETRIES", "1"))
+LONG_FPS = 24
+LONG_HEIGHT = 720
+
+
+def split_segments(seconds: float, segment: float = LONG_SEGMENT_SEC, xfade: float = LONG_XFADE_SEC) -> List[float]:
+    """
+    Длины сегментов: поровну, не длиннее segment; каждый стык съедает xfade,
+    так что sum - (n - 1) * xfade == seconds.  20 с -> 5 x 4.4 с.
+    """
+    seconds = max(0.1, float(seconds))
+    if seconds <= segment:
+        return [round(seconds, 3)]
+    n = math.ceil((seconds - xfade) / (segment - xfade) - 1e-9)
+    return [round((seconds + (n - 1) * xfade) / n, 3)] * n
+
+
+# ---------- ffmpeg ----------
+
+def last_frame_cmd(src, out_jpg) -> List[str]:
+    # -sseof: декодируется только хвост, -update 1: в файле остаётся последний кадр
+    return ["ffmpeg", "-y", "-v", "error", "-sseof", "-0.5", "-i", str(src),
+            "-update", "1", "-q:v", "2", str(out_jpg)]
+
+
+def stitch_cmd(paths: Sequence[str], durations: Sequence[float], out, seconds: float,
+               xfade: float = LONG_XFADE_SEC, width: int = 0) -> List[str]:
+    """
+    Один проход: все сегменты -> общий размер/fps/timebase -> цепочка xfade -> обрезка
+    до заказанной длительности. Смещения — от реальных длительностей сегментов.
+    """
+    size = f"{width}:{LONG_HEIGHT}" if width else f"-2:{LONG_HEIGHT}"
+    cmd = ["ffmpeg", "-y"]
+    parts = []
+    for i, p in enumerate(paths):
+        cmd += ["-i", str(p)]
+        parts.append(f"[{i}:v]fps={LONG_FPS},scale={size}:flags=lanczos,setsar=1,format=yuv420p,settb=AVTB[v{i}]")
+    prev, offset = "v0", 0.0
+    for i in range(1, len(paths)):
+        xf = max(0.0, min(xfade, durations[i - 1] / 2, durations[i] / 2))
+        offset += durations[i - 1] - xf
+        parts.append(f"[{prev}][v{i}]xfade=transition=fade:duration={xf:.3f}:offset={offset:.3f}[x{i}]")
+        prev = f"x{i}"
+    cmd += ["-filter_complex", ";".join(parts), "-map", f"[{prev}]", "-t", f"{seconds:.3f}",
+            "-c:v", "libx264", "-crf", "18", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-movflags", "+faststart", "-an", str(out)]
+    return cmd
+
+
+async def _last_frame(src: str, workdir: Path, k: int) -> str:
+    from app.renderfarm import FARM, FINAL
+    out = workdir / f"seg{k}_last.jpg"
+    await FARM.run(last_frame_cmd(src, out), FINAL)
+    return str(out)
+
+
+async def _stitch(paths: List[str], seconds: float, xfade: float, workdir: Path) -> Path:
+    from app.mediainfo import try_probe
+    from app.renderfarm import FARM, FINAL
+    infos = [await asyncio.to_thread(try_probe, p) for p in paths]
+    durs = [i.duration if i and i.duration > 0 else LONG_SEGMENT_SEC for i in infos]
+    width = 0
+    if infos[0] and infos[0].height:
+        width = int(round(infos[0].width * LONG_HEIGHT / infos[0].height / 2)) * 2
+    total = sum(durs) - (len(durs) - 1) * xfade
+    out = workdir / "long.mp4"
+    with span("long.stitch", segments=len(paths)):
+        await FARM.run(stitch_cmd(paths, durs, out, min(seconds, total), xfade, width), FINAL)
+    return out
+
+
+# ---------- сегменты ----------
+
+async def _segment(provider: VideoProvider, req: JobRequest, k: int, retries: int) -> str:
+    error: Optional[Exception] = None
+    for attempt in range(retries + 1):
+        try:
+            with span("long.segment", provider=provider.name, seg=k, attempt=attempt):
+                return await provider.run(req)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+            log.warning("long: segment %d attempt %d on %s failed: %s", k, attempt, provider.name, e)
+    raise ProviderError(f"long: segment {k} failed: {error}")
+
+
+def _drop_segment(path: str) -> None:
+    from app.storage import FINAL_DIR, discard, is_temp
+    p = Path(path)
+    try:
+        if is_temp(p):
+            discard(p)
+        elif p.resolve().is_relative_to(FINAL_DIR.resolve()):
+            p.unlink(missing_ok=True)
+    except OSError as e:
+        log.debug("long: segment %s not removed: %s", path, e)
+
+
+async def _gather(coros) -> List[str]:
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        # один сегмент не получился — остальные не жгут GPU зря
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def generate_long(req: JobRequest, provider: str = LONG_PROVIDER, mode: Optional[str] = None,
+                        prompts: Optional[Sequence[str]] = None, segment: float = LONG_SEGMENT_SEC,
+                        xfade: float = LONG_XFADE_SEC, retries: int = LONG_RETRIES) -> str:
+    """
+    Ролик req.seconds (не больше LONG_MAX_SEC) из сегментов провайдера provider.
+    prompts — свой промпт на сегмент (по кругу), иначе req.prompt у всех.
+    Возвращает путь в FINAL_DIR (app.storage).
+    """
+    from app.storage import new_tempdir, store_final
+    prov = REGISTRY.get(provider)
+    seconds = min(float(req.seconds), LONG_MAX_SEC)
+    lengths = split_segments(seconds, segment, xfade)
+    mode = (mode or LONG_MODE).lower()
+    if mode == "chain" and not prov.capabilities.i2v:
+        log.warning("long: %s has no i2v, chain -> parallel", prov.name)
+        mode = "parallel"
+    # общий seed — сегменты в одной манере
+    seed = req.seed if req.seed is not None else random.randint(1, 2_147_483_646)
+    log.info("long: %.1fs -> %d x %.2fs on %s (%s)", seconds, len(lengths), lengths[0], prov.name, mode)
+
+    def seg_req(k: int, image: Optional[str], out_dir: str) -> JobRequest:
+        prompt = prompts[k % len(prompts)] if prompts else req.prompt
+        return JobRequest(prompt=prompt, image=image, seconds=lengths[k], fps=req.fps, seed=seed,
+                          out_dir=out_dir, extra=dict(req.extra))
+
+    if len(lengths) == 1:
+        # один сегмент — он и есть результат
+        return await _segment(prov, seg_req(0, req.image, req.out_dir), 0, retries)
+
+    workdir = new_tempdir("long")
+    made: Dict[int, str] = {}
+
+    async def seg(k: int, image: Optional[str]) -> str:
+        made[k] = await _segment(prov, seg_req(k, image, str(workdir)), k, retries)
+        return made[k]
+
+    try:
+        if mode == "chain":
+            image = req.image
+            for k in range(len(lengths)):
+                await seg(k, image)
+                if k + 1 < len(lengths):
+                    image = await _last_frame(made[k], workdir, k)
+        else:
+            image = await prov.stage_image(req.image) if req.image else None
+            await _gather(seg(k, image) for k in range(len(lengths)))
+
+        out = await _stitch([made[k] for k in range(len(lengths))], seconds, xfade, workdir)
+        final = await asyncio.to_thread(store_final, out, f"long_{prov.name}")
+    finally:
+        # сегменты промежуточные: "wan" кладёт их в FINAL_DIR мимо out_dir — убираем и оттуда,
+        # в том числе готовые сегменты упавшей склейки
+        for path in made.values():
+            _drop_segment(path)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return str(final)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    ap = argparse.ArgumentParser(description="long video from parallel provider segments")
+    ap.add_argument("prompt")
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--image")
+    ap.add_argument("--provider", default=LONG_PROVIDER)
+    ap.add_argument("--mode", choices=("parallel", "chain"), default=LONG_MODE)
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--segment", type=float, default=LONG_SEGMENT_SEC)
+    ap.add_argument("--xfade", type=float, default=LONG_XFADE_SEC)
+    a = ap.parse_args()
+    path = asyncio.run(generate_long(JobRequest(prompt=a.prompt, image=a.image, seconds=a.seconds, seed=a.seed),
+                                     provider=a.provider, mode=a.mode, segment=a.segment, xfade=a.xfade))
+    print(path)
+    sys.exit(0)
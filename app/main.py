@@ -1,14 +1,24 @@
 # -*- coding: utf-8 -*-
+import os
 import logging
 import asyncio
 
 from aiogram import Dispatcher, executor
-from app.bot import dp  # dp уже включает bot, middleware, handlers
+from app.bot import create_app  # dp: bot, middleware, handlers
+from app.storage import sweeper
+from app.tracing import start_metrics_server
 
 log = logging.getLogger("main")
 
+# polling | webhook
+BOT_MODE = os.environ.get("BOT_MODE", "polling").strip().lower()
+# накопившиеся за рестарт апдейты по умолчанию обрабатываем, а не выбрасываем
+SKIP_UPDATES = os.environ.get("SKIP_UPDATES", "0") == "1"
+
 
 async def on_startup(dispatcher: Dispatcher):
+    asyncio.ensure_future(sweeper())
+    await start_metrics_server()
     try:
         me = await dispatcher.bot.get_me()
         log.info("Bot launched: %s (@%s)", me.first_name, me.username)
@@ -17,5 +27,14 @@ async def on_startup(dispatcher: Dispatcher):
 
 
 if __name__ == "__main__":
-    log.info("Starting polling…")
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+    dp, _ = create_app()
+    # aiohttp/uvloop нужны только здесь
+    from app.webhook import install_uvloop, run_webhook
+    if BOT_MODE == "webhook":
+        log.info("Starting webhook…")
+        run_webhook(dp)
+    else:
+        if install_uvloop():
+            asyncio.set_event_loop(asyncio.new_event_loop())
+        log.info("Starting polling…")
+        executor.start_polling(dp, skip_updates=SKIP_UPDATES, on_startup=on_startup)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Сведения о медиафайле (ffprobe) с кэшем.
+
+    info = probe(path)            # ffprobe один раз на (path, size, mtime)
+    info.has_audio, info.duration, info.height, info.fps, info.faststart
+    is_normalized(info, 720, 24)  # уже 720p/24fps/h264/yuv420p/faststart -> перекодировать не нужно
+
+Кэш двухуровневый: LRU в памяти + SQLite (MEDIAINFO_DB, по умолчанию OUT_DIR/mediainfo.sqlite,
+пустая строка — только память). Ключ — реальный путь, запись валидна, пока совпадают
+размер и mtime_ns; файлы в OUT_DIR/final названы по хэшу содержимого и не меняются.
+
+CLI: python -m app.mediainfo <file>...
+"""
+import os
+import sys
+import json
+import shlex
+import struct
+import sqlite3
+import asyncio
+import logging
+import subprocess
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+log = logging.getLogger("mediainfo")
+
+MEDIAINFO_DB = os.environ.get(
+    "MEDIAINFO_DB", str(Path(os.environ.get("OUT_DIR", "/opt/content_factory/out")) / "mediainfo.sqlite"))
+MEDIAINFO_CACHE_SIZE = int(os.environ.get("MEDIAINFO_CACHE_SIZE", "2048"))
+_PRUNE_EVERY = 256
+
+
+@dataclass
+class MediaInfo:
+    path: str
+    size: int
+    mtime_ns: int
+    duration: float = 0.0
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    vcodec: str = ""
+    pix_fmt: str = ""
+    has_audio: bool = False
+    acodec: str = ""
+    faststart: bool = False
+
+    @property
+    def has_video(self) -> bool:
+        return bool(self.vcodec)
+
+
+class ProbeError(RuntimeError):
+    pass
+
+
+# ---------- низкий уровень ----------
+
+def _fps(rate: str) -> float:
+    try:
+        num, _, den = (rate or "0/1").partition("/")
+        return round(float(num) / float(den or 1), 3) if float(den or 1) else 0.0
+    except ValueError:
+        return 0.0
+
+
+def _faststart(path: str) -> bool:
+    """moov раньше mdat — по заголовкам верхнеуровневых MP4-атомов, без чтения данных."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                hdr = f.read(8)
+                if len(hdr) < 8:
+                    return False
+                size, kind = struct.unpack(">I4s", hdr)
+                if kind == b"moov":
+                    return True
+                if kind == b"mdat":
+                    return False
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                    f.seek(size - 16, os.SEEK_CUR)
+                elif size == 0:
+                    return False
+                else:
+                    f.seek(size - 8, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return False
+
+
+def _ffprobe(path: str, st: os.stat_result) -> MediaInfo:
+    cmd = ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise ProbeError(f"ffprobe failed [{p.returncode}]: {path}\n{p.stderr.decode(errors='ignore')[-400:]}")
+    js = json.loads(p.stdout or b"{}")
+    info = MediaInfo(path=path, size=st.st_size, mtime_ns=st.st_mtime_ns)
+    try:
+        info.duration = float((js.get("format") or {}).get("duration") or 0.0)
+    except ValueError:
+        pass
+    for s in js.get("streams") or []:
+        if s.get("codec_type") == "video" and not info.vcodec:
+            if (s.get("disposition") or {}).get("attached_pic"):
+                continue
+            info.vcodec = s.get("codec_name", "")
+            info.width = int(s.get("width") or 0)
+            info.height = int(s.get("height") or 0)
+            info.pix_fmt = s.get("pix_fmt", "")
+            info.fps = _fps(s.get("avg_frame_rate")) or _fps(s.get("r_frame_rate"))
+        elif s.get("codec_type") == "audio" and not info.has_audio:
+            info.has_audio = True
+            info.acodec = s.get("codec_name", "")
+    info.faststart = _faststart(path) if path.lower().endswith((".mp4", ".m4v", ".mov")) else False
+    return info
+
+
+# ---------- кэш ----------
+
+class _Cache:
+    def __init__(self, db_path: str = MEDIAINFO_DB, size: int = MEDIAINFO_CACHE_SIZE):
+        self.size = max(1, size)
+        self._mem: "OrderedDict[str, MediaInfo]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_path = db_path
+        self._con: Optional[sqlite3.Connection] = None
+        self.stats = {"hits": 0, "misses": 0, "probes": 0}
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if self._con is None and self._db_path:
+            try:
+                Path(self._db_path).parent.mkdir(parents=True, exist_ok=True)
+                self._con = sqlite3.connect(self._db_path, check_same_thread=False)
+                self._con.execute("CREATE TABLE IF NOT EXISTS media (path TEXT PRIMARY KEY, info TEXT)")
+                self._con.commit()
+            except sqlite3.Error as e:
+                log.warning("mediainfo: sqlite disabled: %s", e)
+                self._db_path = ""
+        return self._con
+
+    def get(self, key: str, st: os.stat_result) -> Optional[MediaInfo]:
+        with self._lock:
+            info = self._mem.get(key)
+            if info is None and self._db() is not None:
+                row = self._con.execute("SELECT info FROM media WHERE path=?", (key,)).fetchone()
+                if row:
+                    info = MediaInfo(**json.loads(row[0]))
+            if info is None or info.size != st.st_size or info.mtime_ns != st.st_mtime_ns:
+                self.stats["misses"] += 1
+                return None
+            self._remember(key, info)
+            self.stats["hits"] += 1
+            return info
+
+    def put(self, key: str, info: MediaInfo) -> None:
+        with self._lock:
+            self.stats["probes"] += 1
+            self._remember(key, info)
+            if self._db() is not None:
+                self._con.execute("INSERT OR REPLACE INTO media(path, info) VALUES (?, ?)",
+                                  (key, json.dumps(asdict(info))))
+                self._con.commit()
+                if self.stats["probes"] % _PRUNE_EVERY == 0:
+                    self._prune()
+
+    def _prune(self) -> None:
+        # временные файлы (скачанное, tmp) живут недолго — их записи тоже не нужны
+        gone = [(p,) for (p,) in self._con.execute("SELECT path FROM media") if not os.path.exists(p)]
+        if gone:
+            self._con.executemany("DELETE FROM media WHERE path=?", gone)
+            self._con.commit()
+
+    def _remember(self, key: str, info: MediaInfo) -> None:
+        self._mem[key] = info
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.size:
+            self._mem.popitem(last=False)
+
+
+CACHE = _Cache()
+
+
+def probe(path) -> MediaInfo:
+    key = os.path.realpath(str(path))
+    try:
+        st = os.stat(key)
+    except OSError as e:
+        raise ProbeError(f"not found: {path}") from e
+    info = CACHE.get(key, st)
+    if info is None:
+        info = _ffprobe(key, st)
+        CACHE.put(key, info)
+    return info
+
+
+async def probe_async(path) -> MediaInfo:
+    return await asyncio.to_thread(probe, path)
+
+
+def try_probe(path) -> Optional[MediaInfo]:
+    """probe() без исключений: нет ffprobe / битый файл -> None (вызывающий делает как раньше)."""
+    try:
+        return probe(path)
+    except (ProbeError, OSError, ValueError) as e:
+        log.debug("probe %s: %s", path, e)
+        return None
+
+
+# ---------- решения для стадий ----------
+
+def is_normalized(info: Optional[MediaInfo], height: int = 720, fps: float = 24,
+                  need_faststart: bool = True) -> bool:
+    """Клип уже в целевом формате: h264/yuv420p, нужная высота и fps (и faststart)."""
+    if info is None or not info.has_video:
+        return False
+    return (info.vcodec == "h264" and info.pix_fmt == "yuv420p" and info.height == height
+            and abs(info.fps - fps) < 0.01 and (info.faststart or not need_faststart))
+
+
+def remux_cmd(src, dst) -> str:
+    """Без перекодирования: только перепаковка с moov в начале (миллисекунды вместо секунд)."""
+    return f"ffmpeg -y -i {shlex.quote(str(src))} -c copy -movflags +faststart {shlex.quote(str(dst))}"
+
+
+def duration_or(path, default: float) -> float:
+    info = try_probe(path)
+    return info.duration if info and info.duration > 0 else default
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m app.mediainfo <file>...")
+        sys.exit(2)
+    for p in sys.argv[1:]:
+        info = try_probe(p)
+        print(json.dumps(asdict(info) if info else {"path": p, "error": "probe failed"}, ensure_ascii=False))
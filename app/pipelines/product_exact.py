@@ -2,20 +2,34 @@
 import os, sys, subprocess, tempfile, uuid, shutil
 from pathlib import Path
 from typing import Optional
-from PIL import Image
+
+# скрипт запускается и напрямую (product_exact.py ...), поэтому корень проекта — в sys.path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.audiobeds import ASSETS_MUSIC, find_music, music_bed, silent_track
+from app.mediainfo import duration_or, try_probe
+from app.renderfarm import FARM, BATCH
+from app.scene_builder import timeline
+from app.storage import new_tempdir, store_final
+from app.tts import TTS
 
 OUT_DIR = Path(os.environ.get("OUT_DIR", "/opt/content_factory/out"))
-ASSETS_MUSIC = Path("/opt/content_factory/assets/music")
 ASSETS_OVER = Path("/opt/content_factory/assets/overlays")
-OUT_DIR.mkdir(parents=True, exist_ok=True)
+XFADE_SEC = 0.6
 
 def run(cmd: list[str]) -> None:
+    if Path(cmd[0]).name == "ffmpeg":
+        # ffmpeg — через общий планировщик: пакетный приоритет, -threads по слотам
+        p = FARM.run_sync(cmd, BATCH, check=False)
+        if p.returncode != 0:
+            raise RuntimeError(f"cmd failed: {' '.join(cmd)}\n{p.stderr.decode(errors='ignore')}")
+        return
     p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
     if p.returncode != 0:
         raise RuntimeError(f"cmd failed: {' '.join(cmd)}\n{p.stdout}")
 
-def ensure_image_1080p(src_path: str) -> str:
+def ensure_image_1080p(src_path: str, workdir: Optional[Path] = None) -> str:
     """Подготовка кадра под 16:9, 1080p. Делаем letterbox без растяжения."""
+    from PIL import Image  # PIL — только когда реально готовим кадр
     im = Image.open(src_path).convert("RGB")
     W, H = 1920, 1080
     # вписываем по меньшей стороне
@@ -33,7 +47,7 @@ def ensure_image_1080p(src_path: str) -> str:
     im_resized = im.resize((new_w, new_h), Image.LANCZOS)
     canvas = Image.new("RGB", (W, H), (0, 0, 0))
     canvas.paste(im_resized, ((W - new_w)//2, (H - new_h)//2))
-    tmp = Path(tempfile.gettempdir()) / f"pex_{uuid.uuid4().hex}_base.jpg"
+    tmp = Path(workdir or tempfile.gettempdir()) / f"pex_{uuid.uuid4().hex}_base.jpg"
     canvas.save(tmp, quality=95)
     return str(tmp)
 
@@ -80,19 +94,28 @@ def concat_with_xfade(mp4_list: list[str], out_mp4: str) -> None:
     """
     assert len(mp4_list) >= 2
     # Приведём все к одинаковому аудиотракту (пустой), чтобы xfade не ругался.
-    fixed = []
+    # Шоты, где звук уже есть, не трогаем; тишина — ровно на длину шота.
+    fixed, durs = [], []
     for p in mp4_list:
+        info = try_probe(p)
+        dur = info.duration if info and info.duration > 0 else 5.0
+        durs.append(dur)
+        if info is not None and info.has_audio:
+            fixed.append(p)
+            continue
         q = p.replace(".mp4", "_fix.mp4")
-        run(["ffmpeg", "-y", "-i", p, "-c:v", "copy", "-f", "lavfi", "-t", "0.1", "-i", "anullsrc=channel_layout=stereo:sample_rate=48000",
-             "-shortest", "-c:a", "aac", q])
+        run(["ffmpeg", "-y", "-i", p, "-i", silent_track(dur), "-map", "0:v:0", "-map", "1:a:0",
+             "-c", "copy", "-shortest", q])
         fixed.append(q)
 
+    # смещения переходов — от реальных длительностей, а не 4.4/8.8 под шоты по 5 с
+    xf = XFADE_SEC
     # первый переход
     mid1 = fixed[0].replace(".mp4", "_xf1.mp4")
     run([
         "ffmpeg", "-y",
         "-i", fixed[0], "-i", fixed[1],
-        "-filter_complex", "xfade=transition=smooth:duration=0.6:offset=4.4",
+        "-filter_complex", f"xfade=transition=smooth:duration={xf}:offset={durs[0] - xf:.3f}",
         "-c:v", "libx264", "-crf", "18", "-preset", "veryfast",
         "-c:a", "aac", mid1
     ])
@@ -102,10 +125,11 @@ def concat_with_xfade(mp4_list: list[str], out_mp4: str) -> None:
         # второй переход
         mid2 = fixed[2]
         out2 = fixed[0].replace(".mp4", "_xf2.mp4")
+        off2 = duration_or(final_src, durs[0] + durs[1] - xf) - xf
         run([
             "ffmpeg", "-y",
             "-i", final_src, "-i", mid2,
-            "-filter_complex", "xfade=transition=smooth:duration=0.6:offset=8.8",
+            "-filter_complex", f"xfade=transition=smooth:duration={xf}:offset={off2:.3f}",
             "-c:v", "libx264", "-crf", "18", "-preset", "veryfast",
             "-c:a", "aac", out2
         ])
@@ -117,18 +141,23 @@ def add_audio_mix(src_mp4: str, tts_wav: Optional[str], out_mp4: str) -> None:
     """
     Микс звука: TTS (если есть) + фоновая музыка (если есть).
     Громкость музыки тише, чтобы не перебивала голос.
+    Музыка — готовая подложка из app.audiobeds (уже нормализована, приглушена и нужной длины).
     """
-    music = None
-    for cand in ["bg1.mp3", "bg.mp3", "music.mp3"]:
-        p = ASSETS_MUSIC / cand
-        if p.exists():
-            music = str(p); break
+    music = find_music(ASSETS_MUSIC)
+    if music is not None:
+        music = music_bed(duration_or(src_mp4, 5.0), music)
 
     # Без звука — просто копия
     if not tts_wav and not music:
         shutil.copy(src_mp4, out_mp4)
         return
 
+    # Только музыка — подложка кладётся как есть, без перекодирования
+    if not tts_wav:
+        run(["ffmpeg", "-y", "-i", src_mp4, "-i", music, "-map", "0:v:0", "-map", "1:a:0",
+             "-c", "copy", "-shortest", out_mp4])
+        return
+
     # Собираем filter_complex под разные случаи
     inputs = ["-i", src_mp4]
     fc_parts = []
@@ -143,7 +172,7 @@ def add_audio_mix(src_mp4: str, tts_wav: Optional[str], out_mp4: str) -> None:
         amix_label += "[a1]"
     if music:
         inputs += ["-i", music]
-        fc_parts.append(f"[{idx}:a]volume=0.25,aloop=loop=-1:size=2e+09[a2]")
+        fc_parts.append(f"[{idx}:a]anull[a2]")
         idx += 1
         amix_label += "[a2]"
 
@@ -158,20 +187,16 @@ def add_audio_mix(src_mp4: str, tts_wav: Optional[str], out_mp4: str) -> None:
     cmd += ["-c:v", "copy", "-c:a", "aac", "-shortest", out_mp4]
     run(cmd)
 
-def maybe_build_tts(tts_text: Optional[str]) -> Optional[str]:
+def maybe_build_tts(tts_text: Optional[str], workdir: Optional[Path] = None) -> Optional[str]:
     """
     Если установлен piper — озвучим. Иначе вернём None.
-    piper ставится отдельно: бинарь piper + модель ru.
+    piper ставится отдельно: бинарь piper + модель ru (PIPER_MODEL).
+    Озвучка идёт через app.tts: тёплый piper и кэш, повторные слоганы — мгновенно.
+    Возвращаемый WAV лежит в кэше TTS — только читать, не удалять.
     """
     if not tts_text:
         return None
-    piper = shutil.which("piper")
-    model = os.environ.get("PIPER_MODEL")  # напр. /opt/piper/ru_RU-dmitry-medium.onnx
-    if not piper or not model or not Path(model).exists():
-        return None
-    out = Path(tempfile.gettempdir()) / f"pex_{uuid.uuid4().hex}_tts.wav"
-    run([piper, "-m", model, "-f", str(out), "-q", "--text", tts_text])
-    return str(out)
+    return TTS.synth(tts_text)
 
 def main():
     if len(sys.argv) < 3:
@@ -181,21 +206,22 @@ def main():
     duration = int(sys.argv[2])  # 5/10/15
     tts = " ".join(sys.argv[3:]) if len(sys.argv) > 3 else None
 
-    base = ensure_image_1080p(img_in)
-    # делим 15 сек на три по 5; для 5/10 — корректируем:
-    if duration <= 5:
-        parts = [duration]
-    elif duration <= 10:
-        parts = [5, duration - 5]
-    else:
-        parts = [5, 5, duration - 10]
+    # всё промежуточное — в одной tmp-папке OUT_DIR/tmp, удаляется в конце
+    tmpdir = new_tempdir("pex")
+    try:
+        out_path = _render(img_in, duration, tts, tmpdir, os.environ.get("PEX_PROMPT"))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    print(str(out_path))
 
-    tmpdir = Path(tempfile.mkdtemp(prefix="pex_"))
+def _render(img_in: str, duration: int, tts: Optional[str], tmpdir: Path, prompt: Optional[str] = None) -> Path:
+    base = ensure_image_1080p(img_in, tmpdir)
+    # делим 15 сек на три по 5 (для 5/10 — корректируем), движения камеры — из раскадровки
+    # app.scene_builder по тексту сцены (нет — по тексту озвучки)
     shots = []
-    modes = ["a", "b", "c"]
-    for i, d in enumerate(parts):
+    for i, (d, mode) in enumerate(timeline(prompt or tts or "", duration)):
         out = tmpdir / f"shot{i}.mp4"
-        build_zoompan_shot(base, str(out), d, modes[i % len(modes)])
+        build_zoompan_shot(base, str(out), d, mode)
         shots.append(str(out))
 
     merged = tmpdir / "merged.mp4"
@@ -204,10 +230,10 @@ def main():
     else:
         concat_with_xfade(shots, str(merged))
 
-    tts_wav = maybe_build_tts(tts)
-    out_path = OUT_DIR / f"product_exact_{uuid.uuid4().hex}_{duration}s.mp4"
-    add_audio_mix(str(merged), tts_wav, str(out_path))
-    print(str(out_path))
+    tts_wav = maybe_build_tts(tts, tmpdir)
+    mixed = tmpdir / "mixed.mp4"
+    add_audio_mix(str(merged), tts_wav, str(mixed))
+    return store_final(mixed, f"product_exact_{duration}s")
 
 if __name__ == "__main__":
     main()
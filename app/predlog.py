@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only журнал предсказаний (JSON lines) вместо одного файла на событие.
+
+На горячем пути — только put_nowait в очередь; пишет фоновый поток пачками.
+Файлы: PRED_DIR/events-YYYY-MM-DD.jsonl, при превышении PREDLOG_MAX_MB —
+events-YYYY-MM-DD.1.jsonl и т.д.; старше PREDLOG_KEEP_DAYS удаляются.
+
+Запросы:
+  python -m app.predlog latency  [--days 7]   # p50/p95 по моделям
+  python -m app.predlog failures [--days 7]   # ошибки по моделям
+  python -m app.predlog retries  [--days 7]   # ретраи по дням
+  python -m app.predlog tail     [-n 20]
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import argparse
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+PRED_DIR = Path(os.environ.get("OUT_DIR", "/opt/content_factory/out")) / "predictions"
+PREDLOG_MAX_MB = float(os.environ.get("PREDLOG_MAX_MB", "64"))
+PREDLOG_KEEP_DAYS = int(os.environ.get("PREDLOG_KEEP_DAYS", "90"))
+PREDLOG_QUEUE = int(os.environ.get("PREDLOG_QUEUE", "10000"))
+
+
+class PredLog:
+    def __init__(self, root: Path = PRED_DIR, max_mb: float = PREDLOG_MAX_MB, keep_days: int = PREDLOG_KEEP_DAYS):
+        self.root = Path(root)
+        self.max_bytes = int(max_mb * (1 << 20))
+        self.keep_days = keep_days
+        self._q: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=PREDLOG_QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._fh = None
+        self._path: Optional[Path] = None
+        self.dropped = 0
+
+    # ---- горячий путь ----
+    def log(self, event: Dict[str, Any]) -> None:
+        event.setdefault("ts", time.time())
+        self._ensure_thread()
+        try:
+            self._q.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    # ---- фоновый писатель ----
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="predlog", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._write([e for e in batch if e is not None])
+            except Exception as e:
+                sys.stderr.write(f"predlog: write failed: {e}\n")
+            for _ in batch:
+                self._q.task_done()
+            if stop:
+                break
+
+    def _target(self, ts: float) -> Path:
+        day = time.strftime("%Y-%m-%d", time.localtime(ts))
+        if self._path is not None and self._path.name.startswith(f"events-{day}") \
+                and self._fh is not None and self._fh.tell() < self.max_bytes:
+            return self._path
+        n = 0
+        while True:
+            name = f"events-{day}.jsonl" if n == 0 else f"events-{day}.{n}.jsonl"
+            p = self.root / name
+            if not p.exists() or p.stat().st_size < self.max_bytes:
+                return p
+            n += 1
+
+    def _write(self, events: List[Dict[str, Any]]) -> None:
+        if not events:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        for ev in events:
+            p = self._target(ev["ts"])
+            if p != self._path:
+                if self._fh is not None:
+                    self._fh.close()
+                    self._cleanup()
+                self._fh = open(p, "a", encoding="utf-8")
+                self._path = p
+            self._fh.write(json.dumps(ev, ensure_ascii=False, default=str) + "\n")
+        self._fh.flush()
+
+    def _cleanup(self) -> None:
+        cutoff = time.time() - self.keep_days * 86400
+        for p in self.root.glob("events-*.jsonl"):
+            try:
+                if p.stat().st_mtime < cutoff:
+                    p.unlink()
+            except OSError:
+                pass
+
+    def flush(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        t_end = time.monotonic() + timeout
+        while self._q.unfinished_tasks and time.monotonic() < t_end:
+            time.sleep(0.01)
+
+    def close(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._q.put(None)
+        self._thread.join(timeout=5)
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+PREDLOG = PredLog()
+
+
+def log_event(event: Dict[str, Any]) -> None:
+    PREDLOG.log(event)
+
+
+# ---------- чтение / CLI ----------
+
+def _order(p: Path):
+    """events-D.jsonl, events-D.1.jsonl, ..., events-D.10.jsonl -> (D, 0), (D, 1), ..., (D, 10)."""
+    day, _, part = p.name[len("events-"):-len(".jsonl")].partition(".")
+    return day, int(part) if part.isdigit() else 0
+
+
+def iter_events(root: Path = PRED_DIR, days: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    cutoff = time.time() - days * 86400 if days else 0
+    # хронологически: имя сортировало бы .1 раньше основного файла и .10 раньше .2
+    for p in sorted(Path(root).glob("events-*.jsonl"), key=_order):
+        if cutoff and p.stat().st_mtime < cutoff:
+            continue
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    ev = json.loads(line)
+                except ValueError:
+                    continue
+                if ev.get("ts", 0) >= cutoff:
+                    yield ev
+
+
+def _pct(xs: List[float], q: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))]
+
+
+def q_latency(days: Optional[int]) -> Dict[str, Dict[str, float]]:
+    by_model: Dict[str, List[float]] = defaultdict(list)
+    for ev in iter_events(days=days):
+        if ev.get("event") == "success" and ev.get("latency_sec") is not None:
+            by_model[ev.get("model", "?")].append(float(ev["latency_sec"]))
+    return {m: {"n": len(v), "p50": round(_pct(v, 0.5), 2), "p95": round(_pct(v, 0.95), 2)}
+            for m, v in by_model.items()}
+
+
+def q_failures(days: Optional[int]) -> Dict[str, Dict[str, int]]:
+    out: Dict[str, Dict[str, int]] = defaultdict(lambda: {"success": 0, "failure": 0, "timeout": 0})
+    for ev in iter_events(days=days):
+        kind = ev.get("event")
+        if kind in ("success", "failure", "timeout"):
+            out[ev.get("model", "?")][kind] += 1
+    return dict(out)
+
+
+def q_retries(days: Optional[int]) -> Dict[str, int]:
+    out: Dict[str, int] = defaultdict(int)
+    for ev in iter_events(days=days):
+        if ev.get("event") == "retry":
+            out[time.strftime("%Y-%m-%d", time.localtime(ev.get("ts", 0)))] += 1
+    return dict(sorted(out.items()))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    p = argparse.ArgumentParser(prog="python -m app.predlog")
+    p.add_argument("query", choices=["latency", "failures", "retries", "tail"])
+    p.add_argument("--days", type=int, default=7)
+    p.add_argument("-n", type=int, default=20)
+    a = p.parse_args(argv)
+    if a.query == "tail":
+        evs = list(iter_events(days=a.days))[-a.n:]
+        for ev in evs:
+            print(json.dumps(ev, ensure_ascii=False))
+        return
+    res = {"latency": q_latency, "failures": q_failures, "retries": q_retries}[a.query](a.days)
+    print(json.dumps(res, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,172 @@
 # -*- coding: utf-8 -*-
-def price(duration_sec, sound_flag: int) -> int:
+"""
+Цены: таблица tariffs (app.billing) -> словарь в памяти.
+
+    price(5, 1)                                   # как раньше: 75
+    price(10, 0, provider="wan", resolution="720p")
+    quote_batch([(5, 0), {"duration": 10, "sound": 1, "provider": "kie"}])  # корзина / опт
+
+Ключ — (корзина длительности, звук, провайдер, разрешение); провайдер и разрешение
+'*' = любой, точное совпадение важнее '*'. Корзины — длительности из таблицы:
+клип попадает в первую корзину b, для которой duration < b + 1 (5.9 -> 5, 6 -> 10),
+длиннее всех — в старшую (как раньше «>= 6 с — 10-секундный тариф»).
+
+Таблица перечитывается сама: раз в TARIFF_RELOAD_SEC проверяется PRAGMA data_version,
+так что новая строка в tariffs (python -m app.pricing set ...) работает без деплоя.
+Нет базы/тарифов — считаем по DEFAULT_TARIFFS.
+"""
+import os
+import sys
+import time
+import bisect
+import logging
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+log = logging.getLogger("pricing")
+
+TARIFF_RELOAD_SEC = float(os.getenv("TARIFF_RELOAD_SEC", "5"))
+
+# (duration, sound, price)
+DEFAULT_TARIFFS = [(5, 0, 55), (5, 1, 75), (10, 0, 110), (10, 1, 150)]
+
+ANY = "*"
+Key = Tuple[float, int, str, str]
+Spec = Union[dict, tuple, list]
+
+
+def _norm_duration(duration_sec) -> float:
+    try:
+        return float(duration_sec)
+    except Exception:
+        return 5.0
+
+
+def _norm_sound(sound_flag) -> int:
+    try:
+        return 1 if int(sound_flag) == 1 else 0
+    except Exception:
+        return 0
+
+
+class TariffEngine:
+    def __init__(self, reload_sec: float = TARIFF_RELOAD_SEC):
+        self.reload_sec = reload_sec
+        self._lock = threading.Lock()
+        self._con: Optional[sqlite3.Connection] = None
+        self._version: Optional[int] = None
+        self._checked = 0.0
+        self._index: Dict[Key, int] = {}
+        self._buckets: List[float] = []
+        self._build(DEFAULT_TARIFFS, source="defaults")
+
+    # ---- загрузка ----
+    def _build(self, rows, source: str) -> None:
+        index: Dict[Key, int] = {}
+        for row in rows:
+            dur, snd, cost = row[0], row[1], row[2]
+            prov = (row[3] if len(row) > 3 else None) or ANY
+            res = (row[4] if len(row) > 4 else None) or ANY
+            index[(float(dur), _norm_sound(snd), prov, res)] = int(cost)
+        if not index:
+            log.warning("pricing: no active tariffs in %s, keeping previous", source)
+            return
+        self._index = index
+        self._buckets = sorted({k[0] for k in index})
+        log.info("pricing: %d tariffs loaded from %s", len(index), source)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._con is None:
+            from app.billing import _connect
+            self._con = _connect()
+        return self._con
+
+    def _maybe_reload(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_sec:
+            return
+        with self._lock:
+            if not force and now - self._checked < self.reload_sec:
+                return
+            self._checked = now
+            try:
+                con = self._db()
+                version = con.execute("PRAGMA data_version").fetchone()[0]
+                if version == self._version and not force:
+                    return
+                rows = con.execute(
+                    "SELECT duration, sound, price, provider, resolution FROM tariffs WHERE active=1").fetchall()
+            except sqlite3.Error as e:
+                log.debug("pricing: tariffs unavailable: %s", e)
+                return
+            self._version = version
+            self._build(rows, source="db")
+
+    def reload(self) -> None:
+        self._maybe_reload(force=True)
+
+    # ---- расчёт ----
+    def bucket(self, duration_sec) -> float:
+        dur = _norm_duration(duration_sec)
+        buckets = self._buckets
+        # первая корзина b с dur < b + 1
+        i = bisect.bisect_right(buckets, dur - 1)
+        return buckets[i] if i < len(buckets) else buckets[-1]
+
+    def _lookup(self, bucket: float, snd: int, provider: str, resolution: str) -> int:
+        idx = self._index
+        # корзины нет для этого звука — ближайшая старшая, потом младшая
+        i = self._buckets.index(bucket)
+        for b in [bucket] + self._buckets[i + 1:] + self._buckets[:i][::-1]:
+            for key in ((b, snd, provider, resolution), (b, snd, provider, ANY),
+                        (b, snd, ANY, resolution), (b, snd, ANY, ANY)):
+                cost = idx.get(key)
+                if cost is not None:
+                    return cost
+        raise KeyError(f"no tariff for {bucket}s sound={snd} provider={provider} resolution={resolution}")
+
+    def quote(self, duration_sec, sound_flag: int = 0, provider: Optional[str] = None,
+              resolution: Optional[str] = None) -> int:
+        self._maybe_reload()
+        return self._lookup(self.bucket(duration_sec), _norm_sound(sound_flag), provider or ANY, resolution or ANY)
+
+    def quote_batch(self, specs: Iterable[Spec]) -> List[int]:
+        """
+        Цены для пачки заданий: dict(duration, sound, provider, resolution) или
+        кортеж в том же порядке. Одинаковые ключи считаются один раз.
+        """
+        self._maybe_reload()
+        memo: Dict[Key, int] = {}
+        out = []
+        for spec in specs:
+            if isinstance(spec, dict):
+                d, s = spec.get("duration", 5), spec.get("sound", 0)
+                p, r = spec.get("provider"), spec.get("resolution")
+            else:
+                d, s, p, r = (list(spec) + [None, None])[:4]
+            key = (self.bucket(d), _norm_sound(s), p or ANY, r or ANY)
+            cost = memo.get(key)
+            if cost is None:
+                cost = memo[key] = self._lookup(*key)
+            out.append(cost)
+        return out
+
+    def table(self) -> List[Tuple[Key, int]]:
+        self._maybe_reload()
+        return sorted(self._index.items())
+
+
+ENGINE = TariffEngine()
+
+
+def price(duration_sec, sound_flag: int, provider: Optional[str] = None, resolution: Optional[str] = None) -> int:
     """
     duration_sec: логически 5 или 10 (секунд).
     sound_flag: 0 = без озвучки, 1 = с озвучкой
+    provider / resolution: если для них есть свой тариф — он, иначе общий.
 
-    Тарифы:
+    Тарифы по умолчанию (DEFAULT_TARIFFS, пока таблица tariffs пуста):
       - 5с без звука  =  55₽
       - 5с со звуком  =  75₽
       - 10с без звука = 110₽
@@ -14,13 +176,39 @@ def price(duration_sec, sound_flag: int) -> int:
       - всё, что < 6 секунд, считаем как «короткий» (5с-тариф),
       - всё, что ≥ 6 секунд, считаем как «длинный» (10с-тариф).
     """
-    try:
-        dur = float(duration_sec)
-    except Exception:
-        dur = 5.0
-    snd = 1 if int(sound_flag) == 1 else 0
+    return ENGINE.quote(duration_sec, sound_flag, provider, resolution)
+
+
+def quote_batch(specs: Iterable[Spec]) -> List[int]:
+    return ENGINE.quote_batch(specs)
+
 
-    if dur < 6.0:  # трактуем как 5с
-        return 75 if snd else 55
-    else:          # трактуем как 10с (старший тариф)
-        return 150 if snd else 110
+if __name__ == "__main__":
+    # python -m app.pricing list
+    # python -m app.pricing set <duration> <sound> <price> [provider] [resolution]
+    # python -m app.pricing off <duration> <sound> [provider] [resolution]
+    # python -m app.pricing quote 5:0 10:1:wan 10:1:wan:1080p
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if cmd in ("set", "off"):
+        from app.billing import _connect, init_billing
+        init_billing()
+        a = sys.argv[2:]
+        dur, snd = float(a[0]), _norm_sound(a[1])
+        rest = a[3:] if cmd == "set" else a[2:]
+        prov, res = (rest + [ANY, ANY])[:2]
+        con = _connect()
+        con.execute("UPDATE tariffs SET active=0 WHERE duration=? AND sound=? AND provider=? AND resolution=?",
+                    (dur, snd, prov, res))
+        if cmd == "set":
+            con.execute("INSERT INTO tariffs(duration, sound, price, active, provider, resolution) VALUES (?,?,?,1,?,?)",
+                        (dur, snd, int(a[2]), prov, res))
+        con.commit()
+        con.close()
+        ENGINE.reload()
+    if cmd == "quote":
+        specs = [tuple(x.split(":")) for x in sys.argv[2:]]
+        for spec, cost in zip(specs, quote_batch(specs)):
+            print(":".join(spec), cost)
+    else:
+        for (dur, snd, prov, res), cost in ENGINE.table():
+            print(f"{dur:g}s sound={snd} provider={prov} resolution={res}: {cost}")
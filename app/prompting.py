@@ -1,23 +1,89 @@
-import httpx
-from .config import settings
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from .config import get_settings
+from .tracing import span
+
+# Один httpx-клиент на процесс (keep-alive, без TCP/TLS на каждый вызов) +
+# кэш раскрытых промптов по (модель, system, нормализованный текст, стиль)
+# с TTL/LRU; одинаковые запросы в полёте склеиваются в один вызов.
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1").rstrip("/")
+PROMPT_CACHE_TTL_SEC = float(os.getenv("PROMPT_CACHE_TTL_SEC", str(24 * 3600)))
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "1024"))
+LLM_TIMEOUT_SEC = float(os.getenv("LLM_TIMEOUT_SEC", "60"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
 
 SYSTEM_CINEMATIC = (
     "You are a film director. Turn a short idea into a vivid, grounded, realistic video prompt. "
     "Structure the output with: [Scene], [Setting], [Subjects], [Action], [Camera], [Lighting], [Mood], [Details]. "
     "Keep it compact but concrete; avoid brand names unless given."
 )
+STYLES: Dict[str, str] = {"cinematic-v1": SYSTEM_CINEMATIC}
+FALLBACK_TEXT = "Не смог построить промпт: проверь OPENAI_API_KEY/квоты/модель."
 
-async def build_director_prompt(user_text: str) -> str:
-    # Можно расширить стилями через settings.prompt_style
-    return await _llm_complete(user_text, SYSTEM_CINEMATIC, settings.openai_model)
+Key = Tuple[str, str, str, str]
 
-async def _llm_complete(user_text: str, system_prompt: str, model: str) -> str:
-    # Минимальный вызов Chat Completions (без сторонних SDK)
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {settings.openai_key}",
-        "Content-Type": "application/json",
-    }
+_client = None                  # httpx.AsyncClient, создаётся при первом запросе
+_cache: "OrderedDict[Key, Tuple[float, str]]" = OrderedDict()
+_inflight: Dict[Key, asyncio.Future] = {}
+STATS = {"hits": 0, "misses": 0, "joined": 0, "errors": 0}
+
+
+def _client_get():
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+        settings = get_settings()
+        _client = httpx.AsyncClient(
+            timeout=LLM_TIMEOUT_SEC,
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                                keepalive_expiry=60),
+            headers={"Authorization": f"Bearer {settings.openai_key}", "Content-Type": "application/json"},
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _norm(text: str) -> str:
+    return " ".join((text or "").split()).casefold()
+
+
+def _key(user_text: str, system_prompt: str, model: str, style: str) -> Key:
+    return (model, system_prompt, _norm(user_text), style)
+
+
+def _cache_get(key: Key) -> Optional[str]:
+    item = _cache.get(key)
+    if item is None:
+        return None
+    expires, text = item
+    if expires < time.monotonic():
+        _cache.pop(key, None)
+        return None
+    _cache.move_to_end(key)
+    return text
+
+
+def _cache_put(key: Key, text: str) -> None:
+    if PROMPT_CACHE_SIZE <= 0 or PROMPT_CACHE_TTL_SEC <= 0:
+        return
+    _cache[key] = (time.monotonic() + PROMPT_CACHE_TTL_SEC, text)
+    _cache.move_to_end(key)
+    while len(_cache) > PROMPT_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _payload(user_text: str, system_prompt: str, model: str, stream: bool = False) -> dict:
     payload = {
         "model": model,
         "messages": [
@@ -27,11 +93,139 @@ async def _llm_complete(user_text: str, system_prompt: str, model: str) -> str:
         "temperature": 0.8,
         "max_tokens": 600,
     }
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(url, headers=headers, json=payload)
-        r.raise_for_status()
-        data = r.json()
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def _system_for(style: str) -> str:
+    return STYLES.get(style, SYSTEM_CINEMATIC)
+
+
+async def build_director_prompt(user_text: str, style: Optional[str] = None) -> str:
+    # Стиль -> system prompt через STYLES (по умолчанию settings.prompt_style)
+    settings = get_settings()
+    style = style or settings.prompt_style
+    return await _llm_complete(user_text, _system_for(style), settings.openai_model, style)
+
+
+async def stream_director_prompt(user_text: str, style: Optional[str] = None) -> AsyncIterator[str]:
+    """Тот же промпт, но кусками по мере генерации — следующие стадии могут стартовать раньше."""
+    settings = get_settings()
+    style = style or settings.prompt_style
+    async for chunk in _llm_stream(user_text, _system_for(style), settings.openai_model, style):
+        yield chunk
+
+
+def _claim(key: Key) -> Tuple[Optional[str], Optional[asyncio.Future], bool]:
+    """(готовый текст | None, future, мы ли владелец вызова)."""
+    cached = _cache_get(key)
+    if cached is not None:
+        STATS["hits"] += 1
+        return cached, None, False
+    fut = _inflight.get(key)
+    if fut is not None:
+        STATS["joined"] += 1
+        return None, fut, False
+    STATS["misses"] += 1
+    fut = _inflight[key] = asyncio.get_running_loop().create_future()
+    fut.add_done_callback(lambda f: f.cancelled() or f.exception())  # без "exception never retrieved"
+    return None, fut, True
+
+
+async def _join(fut: asyncio.Future) -> Optional[str]:
+    """
+    Ждём чужой вызов. None — владельца отменили (или бросили его поток): это не наша
+    отмена, вызывающий идёт на новый _claim и, скорее всего, сам становится владельцем.
+    """
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        if fut.cancelled():
+            return None
+        raise
+
+
+def _settle(key: Key, fut: asyncio.Future, text: Optional[str] = None, exc: Optional[BaseException] = None) -> None:
+    _inflight.pop(key, None)
+    if fut.done():
+        return
+    if exc is not None:
+        STATS["errors"] += 1
+        if isinstance(exc, Exception):
+            fut.set_exception(exc)
+        else:
+            fut.cancel()                 # владелец отменён / поток брошен
+    else:
+        if text and text != FALLBACK_TEXT:
+            _cache_put(key, text)
+        fut.set_result(text)
+
+
+async def _llm_complete(user_text: str, system_prompt: str, model: str, style: str = "") -> str:
+    key = _key(user_text, system_prompt, model, style)
+    while True:
+        cached, fut, owner = _claim(key)
+        if cached is not None:
+            return cached
+        if owner:
+            break
+        text = await _join(fut)
+        if text is not None:
+            return text
+    # Минимальный вызов Chat Completions (без сторонних SDK)
+    try:
+        with span("llm.complete", provider=model):
+            r = await _client_get().post(f"{OPENAI_API_BASE}/chat/completions",
+                                         json=_payload(user_text, system_prompt, model))
+            r.raise_for_status()
+            data = r.json()
         try:
-            return data["choices"][0]["message"]["content"].strip()
+            text = data["choices"][0]["message"]["content"].strip()
         except Exception:
-            return "Не смог построить промпт: проверь OPENAI_API_KEY/квоты/модель."
+            text = FALLBACK_TEXT
+    except BaseException as e:
+        _settle(key, fut, exc=e)
+        raise
+    _settle(key, fut, text)
+    return text
+
+
+async def _llm_stream(user_text: str, system_prompt: str, model: str, style: str = "") -> AsyncIterator[str]:
+    key = _key(user_text, system_prompt, model, style)
+    while True:
+        cached, fut, owner = _claim(key)
+        if cached is not None:
+            yield cached
+            return
+        if owner:
+            break
+        text = await _join(fut)
+        if text is not None:
+            yield text
+            return
+    parts = []
+    try:
+        with span("llm.stream", provider=model):
+            async with _client_get().stream("POST", f"{OPENAI_API_BASE}/chat/completions",
+                                            json=_payload(user_text, system_prompt, model, stream=True)) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        delta = json.loads(data)["choices"][0]["delta"].get("content") or ""
+                    except (ValueError, KeyError, IndexError):
+                        continue
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+    except BaseException as e:
+        # GeneratorExit (потребитель бросил поток) — тоже сюда: кэш не пишем
+        _settle(key, fut, exc=e)
+        raise
+    text = "".join(parts).strip()
+    _settle(key, fut, text or FALLBACK_TEXT)
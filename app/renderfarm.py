@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Единый планировщик локальных ffmpeg.
+
+Раньше каждый хендлер/адаптер/пайплайн запускал ffmpeg сам: десять одновременных
+финалов = десять libx264, каждый на все ядра, и они толкаются. Теперь:
+
+    await FARM.run(cmd, PREVIEW)          # из корутин
+    FARM.run_sync(cmd, BATCH)             # из потоков / синхронных пайплайнов
+
+- слотов столько, сколько тянут ядра и память (RENDER_SLOTS, 0 = авто);
+- каждому ffmpeg добавляется -threads = ядра / слоты (если своего -threads нет);
+- освободившийся слот отдаётся самому приоритетному ожидающему:
+  PREVIEW (интерактив) < FINAL (готовый ролик) < BATCH (пайплайны, пакетные);
+- ожидание в очереди и время работы пишутся в app.tracing и в snapshot().
+
+Планировщик — на процесс: отдельно запущенный product_exact.py имеет свой.
+"""
+import os
+import sys
+import time
+import heapq
+import shlex
+import asyncio
+import logging
+import itertools
+import threading
+import subprocess
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from app.utils.proc import ProcError, run_async
+
+log = logging.getLogger("renderfarm")
+
+PREVIEW, FINAL, BATCH = 0, 1, 2
+PRIORITY_NAMES = {PREVIEW: "preview", FINAL: "final", BATCH: "batch"}
+
+RENDER_SLOTS = int(os.environ.get("RENDER_SLOTS", "0"))
+RENDER_THREADS = int(os.environ.get("RENDER_THREADS", "0"))
+RENDER_MEM_PER_JOB_MB = int(os.environ.get("RENDER_MEM_PER_JOB_MB", "700"))
+RENDER_THREADS_PER_JOB = int(os.environ.get("RENDER_THREADS_PER_JOB", "2"))
+
+Cmd = Union[str, List[str]]
+_TRAILING_FLAGS = ("-y", "-n", "-nostdin", "-hide_banner")
+
+
+def _mem_available_mb() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def plan_capacity(cores: Optional[int] = None, mem_mb: Optional[int] = None):
+    """(slots, threads): по ~RENDER_THREADS_PER_JOB ядра на ffmpeg, но не больше, чем влезет в память."""
+    cores = cores or os.cpu_count() or 1
+    slots = RENDER_SLOTS or max(1, cores // max(1, RENDER_THREADS_PER_JOB))
+    mem_mb = _mem_available_mb() if mem_mb is None else mem_mb
+    if mem_mb and RENDER_MEM_PER_JOB_MB > 0 and not RENDER_SLOTS:
+        slots = max(1, min(slots, mem_mb // RENDER_MEM_PER_JOB_MB))
+    threads = RENDER_THREADS or max(1, cores // slots)
+    return slots, threads
+
+
+def with_threads(cmd: Cmd, threads: int) -> List[str]:
+    """Добавляет `-threads N` перед выходным файлом, если это ffmpeg и лимита ещё нет."""
+    args = shlex.split(cmd) if isinstance(cmd, str) else [str(x) for x in cmd]
+    if not args or Path(args[0]).name != "ffmpeg" or "-threads" in args or len(args) < 2:
+        return args
+    # ffmpeg-python (.compile()) кладёт -y после выходного файла
+    i = len(args) - 1
+    while i > 1 and args[i] in _TRAILING_FLAGS:
+        i -= 1
+    return args[:i] + ["-threads", str(threads)] + args[i:]
+
+
+class _Waiter:
+    __slots__ = ("fut", "loop", "event", "granted")
+
+    def __init__(self, fut=None, loop=None, event=None):
+        self.fut = fut
+        self.loop = loop
+        self.event = event
+        self.granted = False
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.fut.done():
+            self.fut.set_result(None)
+
+
+class _ClassStats:
+    def __init__(self, window: int = 500):
+        self.wait = deque(maxlen=window)
+        self.run = deque(maxlen=window)
+        self.jobs = 0
+        self.failed = 0
+
+
+def _pct(xs, q: float) -> Optional[float]:
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return round(xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))], 3)
+
+
+class RenderFarm:
+    def __init__(self, slots: Optional[int] = None, threads: Optional[int] = None):
+        auto_slots, auto_threads = plan_capacity()
+        self.slots = max(1, slots or auto_slots)
+        self.threads = max(1, threads or auto_threads)
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._heap: List[Any] = []
+        self._seq = itertools.count()
+        self._stats = {p: _ClassStats() for p in PRIORITY_NAMES}
+
+    # ---- слоты ----
+    def _try_take(self) -> bool:
+        if self._busy < self.slots and not self._heap:
+            self._busy += 1
+            return True
+        return False
+
+    def _release(self) -> None:
+        with self._lock:
+            while self._heap:
+                _, _, w = heapq.heappop(self._heap)
+                if w.event is None and w.fut.cancelled():
+                    continue
+                w.grant()            # слот переходит к ожидающему, _busy не меняется
+                return
+            self._busy -= 1
+
+    async def _acquire(self, priority: int) -> None:
+        with self._lock:
+            if self._try_take():
+                return
+            loop = asyncio.get_running_loop()
+            w = _Waiter(fut=loop.create_future(), loop=loop)
+            heapq.heappush(self._heap, (priority, next(self._seq), w))
+        try:
+            await w.fut
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = w.granted
+                if not granted:
+                    self._heap = [x for x in self._heap if x[2] is not w]
+                    heapq.heapify(self._heap)
+            if granted:
+                self._release()
+            raise
+
+    def _acquire_sync(self, priority: int) -> None:
+        with self._lock:
+            if self._try_take():
+                return
+            w = _Waiter(event=threading.Event())
+            heapq.heappush(self._heap, (priority, next(self._seq), w))
+        w.event.wait()
+
+    # ---- запуск ----
+    async def run(self, cmd: Cmd, priority: int = FINAL, tail: int = 800) -> bytes:
+        args = with_threads(cmd, self.threads)
+        t0 = time.monotonic()
+        await self._acquire(priority)
+        t1 = time.monotonic()
+        ok = False
+        try:
+            out = await run_async(args, tail=tail)
+            ok = True
+            return out
+        finally:
+            self._release()
+            self._account(priority, t1 - t0, time.monotonic() - t1, ok)
+
+    def run_sync(self, cmd: Cmd, priority: int = BATCH, check: bool = True,
+                 tail: int = 800) -> subprocess.CompletedProcess:
+        args = with_threads(cmd, self.threads)
+        t0 = time.monotonic()
+        self._acquire_sync(priority)
+        t1 = time.monotonic()
+        try:
+            p = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        finally:
+            self._release()
+        self._account(priority, t1 - t0, time.monotonic() - t1, p.returncode == 0)
+        if check and p.returncode != 0:
+            raise ProcError(f"Command failed [{p.returncode}]: {args[0]}\n{p.stderr.decode(errors='ignore')[-tail:]}")
+        return p
+
+    def _account(self, priority: int, wait: float, run: float, ok: bool) -> None:
+        st = self._stats[priority]
+        with self._lock:
+            st.jobs += 1
+            st.failed += 0 if ok else 1
+            st.wait.append(wait)
+            st.run.append(run)
+        name = PRIORITY_NAMES[priority]
+        if wait > 5:
+            log.info("renderfarm: %s waited %.1fs for a slot", name, wait)
+        try:
+            from app.tracing import record
+            record("farm.wait", wait, provider=name)
+            record("farm.run", run, provider=name, ok=ok)
+        except Exception:
+            pass
+
+    # ---- метрики ----
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            snap: Dict[str, Any] = {"slots": self.slots, "threads": self.threads,
+                                    "busy": self._busy, "queued": len(self._heap)}
+            for p, st in self._stats.items():
+                name = PRIORITY_NAMES[p]
+                snap[f"{name}_jobs"] = st.jobs
+                snap[f"{name}_failed"] = st.failed
+                snap[f"{name}_wait_p50"] = _pct(st.wait, 0.5)
+                snap[f"{name}_wait_p95"] = _pct(st.wait, 0.95)
+                snap[f"{name}_run_p95"] = _pct(st.run, 0.95)
+        return snap
+
+
+FARM = RenderFarm()
+
+
+if __name__ == "__main__":
+    slots, threads = plan_capacity()
+    print(f"cores={os.cpu_count()} mem_available_mb={_mem_available_mb()} -> slots={slots} threads={threads}")
+    if len(sys.argv) > 1:
+        print(" ".join(with_threads(sys.argv[1:], threads)))
@@ -1,23 +1,30 @@
 # -*- coding: utf-8 -*-
-import os, sys, json, shlex, time, subprocess, uuid, random
+import os, sys, json, shlex, time, subprocess, uuid, random, threading
 from pathlib import Path
 from typing import Dict, Any, Optional, List
 
-API_BASE = "https://api.replicate.com/v1"
+from app.frameplan import FramePlan, WAN_FRAMES, interp_filter, plan_frames
+from app.mediainfo import is_normalized, remux_cmd, try_probe
+from app.renderfarm import FARM, FINAL
+from app.tracing import span, record
+
+API_BASE = os.environ.get("REPLICATE_API_BASE", "https://api.replicate.com/v1").rstrip("/")
+CATBOX_URL = os.environ.get("CATBOX_UPLOAD_URL", "https://catbox.moe/user/api.php")
 T2V_MODEL = os.environ.get("REPLICATE_MODEL_T2V", "wan-video/wan-2.2-t2v-fast")
 I2V_MODEL = os.environ.get("REPLICATE_MODEL_I2V", "wan-video/wan-2.2-i2v-fast")
 
 ROOT = Path("/opt/content_factory")
 OUT_DIR = Path(os.environ.get("OUT_DIR", str(ROOT / "out")))
 PRED_DIR = OUT_DIR / "predictions"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
-PRED_DIR.mkdir(parents=True, exist_ok=True)
 
 ENV_PATH = ROOT / ".env"
 DEFAULT_SECONDS = float(os.environ.get("DEFAULT_DURATION", "5"))
-DEFAULT_FPS = int(os.environ.get("REPLICATE_FPS", "24"))
+# fps генерации: не задан — выбирает app.frameplan (минимум кадров на длительность)
+DEFAULT_FPS = int(os.environ["REPLICATE_FPS"]) if os.environ.get("REPLICATE_FPS") else None
 MAX_FRAMES_HARD = 100  # Wan 2.2: безопасный верх
 
+SLA_SEC = float(os.environ.get("REPLICATE_SLA_SEC", "600"))
+POLL_SEC = float(os.environ.get("REPLICATE_POLL_SEC", "1.5"))
 WARMUP_SEC = float(os.environ.get("REPLICATE_WARMUP_SEC", "0.5"))
 FIXED_SEED = int(os.environ.get("REPLICATE_FIXED_SEED", "123456789"))
 
@@ -43,6 +50,10 @@ class ReplicateError(RuntimeError):
     pass
 
 
+class ReplicateCancelled(ReplicateError):
+    pass
+
+
 def _run(cmd: str, stdin: Optional[bytes] = None, check=True) -> subprocess.CompletedProcess:
     p = subprocess.run(cmd, input=stdin, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     if check and p.returncode != 0:
@@ -95,39 +106,39 @@ def _get_json(url: str, tok: str) -> Dict[str, Any]:
     return _curl_json("GET", url, {"Authorization": f"Token {tok}"})
 
 
+def _download_cmd(url: str, dst: Path) -> str:
+    return f"curl -fsSL --retry 3 -o {shlex.quote(str(dst))} {shlex.quote(url)}"
+
+
 def _download(url: str, dst: Path):
-    _run(f"curl -fsSL --retry 3 -o {shlex.quote(str(dst))} {shlex.quote(url)}", check=True)
+    with span("download"):
+        _run(_download_cmd(url, dst), check=True)
+
+
+def _cancel_prediction(pred_id: str, tok: str) -> None:
+    """POST /predictions/{id}/cancel — останавливаем GPU-время у брошенных задач."""
+    try:
+        _post_json(f"{API_BASE}/predictions/{pred_id}/cancel", {}, tok)
+    except Exception as e:
+        _log_json({"event": "cancel_failed", "id": pred_id, "error": str(e), "ts": time.time()})
 
 
 def _upload_catbox(local_path: Path) -> str:
-    out = _run(
-        f"curl -k -fsS -F 'reqtype=fileupload' -F 'fileToUpload=@{shlex.quote(str(local_path))}' https://catbox.moe/user/api.php",
-        check=True,
-    ).stdout.decode().strip()
+    with span("upload.catbox"):
+        out = _run(
+            f"curl -k -fsS -F 'reqtype=fileupload' -F 'fileToUpload=@{shlex.quote(str(local_path))}' {shlex.quote(CATBOX_URL)}",
+            check=True,
+        ).stdout.decode().strip()
     if not out.startswith("http"):
         raise ReplicateError(f"catbox upload failed: {out}")
     return out
 
 
-def _quantize_frames(n: int) -> int:
-    safe = [100, 96, 92, 88, 84, 81]
-    n = max(1, min(n, MAX_FRAMES_HARD))
-    for s in safe:
-        if s <= n:
-            return s
-    return 81
-
-
-def _calc_frames(sec: float, fps: int) -> int:
-    n = int(round(float(sec) * fps))
-    n = max(1, min(n, MAX_FRAMES_HARD))
-    return _quantize_frames(n)
-
-
 def _log_json(js: Dict[str, Any]):
+    # только кладём в очередь: пишет фоновый поток app.predlog (JSONL с ротацией)
     try:
-        fname = PRED_DIR / f"{uuid.uuid4().hex[:10]}.json"
-        fname.write_text(json.dumps(js, ensure_ascii=False, indent=2))
+        from app.predlog import log_event
+        log_event(js)
     except Exception:
         pass
 
@@ -144,32 +155,105 @@ def _make_seed(seed: Optional[int]) -> int:
     return base % 2_147_483_647 or FIXED_SEED
 
 
-def _predict_with_sla(model: str, base_payload: Dict[str, Any], tok: str) -> str:
+def _frame_plan(seconds: float, fps: Optional[int] = None) -> FramePlan:
+    # Честные длительности при минимуме кадров (app.frameplan):
+    #   5 секунд  => 81 кадр @ 16 fps, до 24 fps досчитывает ffmpeg при нормализации
+    #   10 секунд => 100 кадров @ 10 fps (больше 100 кадров WAN не держит)
+    # fps задан явно — генерируем с ним
+    return plan_frames(seconds, max_frames=MAX_FRAMES_HARD, fps_range=(5, 24), frames=WAN_FRAMES, fps=fps)
+
+
+def _frames_fps(seconds: float, fps: Optional[int] = None):
+    plan = _frame_plan(seconds, fps)
+    return plan.num_frames, plan.fps
+
+
+def _image_url(image: str) -> str:
+    if image.lower().startswith("http://") or image.lower().startswith("https://"):
+        return image
+    p = Path(image)
+    if not p.exists():
+        raise ReplicateError(f"Image not found: {image}")
+    return _upload_catbox(p)
+
+
+def _t2v_payload(prompt: str, seconds: float, seed: Optional[int] = None,
+                 fps: Optional[int] = None) -> Dict[str, Any]:
+    total_frames, fps = _frames_fps(seconds, fps)
+    return {
+        "prompt": f"{PROMPT_PRIMER}{prompt}",
+        "negative_prompt": NEGATIVE_PROMPT,
+        "num_frames": int(total_frames),
+        "frames_per_second": int(fps),
+        "seed": int(_make_seed(seed)),
+    }
+
+
+def _i2v_payload(img_url: str, prompt: str, seconds: float, seed: Optional[int] = None,
+                 fps: Optional[int] = None) -> Dict[str, Any]:
+    total_frames, fps = _frames_fps(seconds, fps)
+    full_prompt = (
+        f"{PROMPT_PRIMER}{prompt}".strip()
+        + " Use the input image as the strict reference and base. Keep exactly the same main person, face, body, outfit, background and lighting as in the input image. "
+        + "The resulting video must clearly show that it is the same person and the same jacket or clothing from the input image, only modified exactly as described in the prompt (for example, the jacket removed from the body and visible nearby). "
+        + "Do not change the outfit style or color unless explicitly requested, do not change the background, do not add any lights, garlands, decorations or extra people. "
+        + "Only do what is explicitly described in the prompt (pose, action, removal of the jacket) while preserving identity and scene."
+    )
+    return {
+        "prompt": full_prompt,
+        "image": img_url,
+        "negative_prompt": NEGATIVE_PROMPT,
+        "num_frames": int(total_frames),
+        "frames_per_second": int(fps),
+        "seed": int(_make_seed(seed)),
+    }
+
+
+def _predict_with_sla(model: str, base_payload: Dict[str, Any], tok: str,
+                      cancel: Optional[threading.Event] = None) -> str:
     """
     Упрощённый предикт без лестниц fps/кадров.
     Делаем до 3 сетевых попыток с теми же параметрами.
+    Если выставлен cancel или вышло SLA_SEC — предсказание отменяется у Replicate.
     """
     attempts: List[Dict[str, Any]] = []
     payload = dict(base_payload)
 
     for net_try in range(1, 3 + 1):
         try:
-            r = _post_json(f"{API_BASE}/models/{model}/predictions", {"input": payload}, tok)
+            t_create = time.monotonic()
+            with span("replicate.create", provider=model):
+                r = _post_json(f"{API_BASE}/models/{model}/predictions", {"input": payload}, tok)
             get_url = (r.get("urls") or {}).get("get", "")
             if not get_url:
                 raise RuntimeError("No urls.get in create response")
+            pred_id = r.get("id") or get_url.rstrip("/").rsplit("/", 1)[-1]
+            deadline = time.monotonic() + SLA_SEC
 
             while True:
+                if cancel is not None and cancel.is_set():
+                    _cancel_prediction(pred_id, tok)
+                    raise ReplicateCancelled(f"prediction {pred_id} cancelled")
+                if time.monotonic() > deadline:
+                    _cancel_prediction(pred_id, tok)
+                    _log_json({"event": "timeout", "ok": False, "model": model, "timeout": SLA_SEC,
+                               "id": pred_id, "ts": time.time()})
+                    raise ReplicateCancelled(f"prediction {pred_id} timeout after {SLA_SEC:.0f}s")
                 s = _get_json(get_url, tok)
                 st = s.get("status")
                 if st == "succeeded":
+                    record("replicate.poll", time.monotonic() - t_create, provider=model)
                     out = s.get("output")
                     url = out[-1] if isinstance(out, list) and out else (out if isinstance(out, str) else "")
                     if not url:
                         raise RuntimeError("No output url")
                     _log_json(
                         {
+                            "event": "success",
                             "ok": True,
+                            "id": pred_id,
+                            "net_try": net_try,
+                            "latency_sec": round(time.monotonic() - t_create, 2),
                             "model": model,
                             "payload": payload,
                             "url": url,
@@ -177,13 +261,16 @@ def _predict_with_sla(model: str, base_payload: Dict[str, Any], tok: str) -> str
                         }
                     )
                     return url
-                if st == "failed":
-                    attempts.append({"net_try": net_try, "status": "failed"})
+                if st in ("failed", "canceled"):
+                    attempts.append({"net_try": net_try, "status": st})
                     break
-                time.sleep(1.5)
+                time.sleep(POLL_SEC)
+        except ReplicateCancelled:
+            raise
         except Exception as e:
             if net_try < 3:
-                _log_json({"retry": True, "error": str(e), "ts": time.time()})
+                _log_json({"event": "retry", "retry": True, "model": model, "net_try": net_try,
+                           "error": str(e), "ts": time.time()})
                 time.sleep(0.8)
                 continue
             if _is_422(e) or "validation" in str(e).lower():
@@ -192,30 +279,44 @@ def _predict_with_sla(model: str, base_payload: Dict[str, Any], tok: str) -> str
             attempts.append({"net_try": net_try, "status": "error", "error": str(e)})
             break
 
-    _log_json({"ok": False, "model": model, "base_payload": base_payload, "attempts": attempts, "ts": time.time()})
+    _log_json({"event": "failure", "ok": False, "model": model, "base_payload": base_payload,
+               "attempts": attempts, "ts": time.time()})
     raise ReplicateError("provider overloaded or unavailable")
 
 
-def _ffmpeg_norm(src: Path, fps: int) -> Path:
+def _norm_cmd(src: Path, fps: int, interp: str = ""):
+    """fps — выходной; interp — "blend"/"minterpolate", если кадры надо досчитать (app.frameplan)."""
     out = src.with_suffix(".final.mp4")
-    vf = "scale=-2:720:flags=lanczos"
+    if not interp and is_normalized(try_probe(src), 720, fps, need_faststart=False):
+        # провайдер уже отдал 720p/нужный fps/h264 — не перекодируем
+        return remux_cmd(src, out), out
+    vf = ",".join(x for x in ("scale=-2:720:flags=lanczos", interp_filter(interp, int(fps))) if x)
     cmd = (
         f"ffmpeg -y -i {shlex.quote(str(src))} -vf {shlex.quote(vf)} -r {int(fps)} "
         f"-c:v libx264 -preset veryfast -movflags +faststart {shlex.quote(str(out))}"
     )
-    _run(cmd, check=True)
+    return cmd, out
+
+
+def _ffmpeg_norm(src: Path, fps: int, interp: str = "") -> Path:
+    cmd, out = _norm_cmd(src, fps, interp)
+    with span("ffmpeg.norm"):
+        FARM.run_sync(cmd, FINAL)
     return out
 
 
 class ReplicateClient:
     def __init__(self, token: Optional[str] = None):
         self.token = token or _ensure_token()
+        # папки — при создании клиента, не при импорте модуля
+        OUT_DIR.mkdir(parents=True, exist_ok=True)
+        PRED_DIR.mkdir(parents=True, exist_ok=True)
 
-    def _finalize(self, downloaded_path: Path, prefix: str, fps: int) -> Path:
-        normalized = _ffmpeg_norm(downloaded_path, fps=fps)
-        final = OUT_DIR / f"{prefix}_{int(time.time())}.mp4"
-        normalized.rename(final)
-        return final
+    def _finalize(self, downloaded_path: Path, prefix: str, fps: int, interp: str = "") -> Path:
+        from app.storage import store_final
+        normalized = _ffmpeg_norm(downloaded_path, fps=fps, interp=interp)
+        downloaded_path.unlink(missing_ok=True)
+        return store_final(normalized, prefix)
 
     def generate_from_text(
         self,
@@ -223,38 +324,19 @@ class ReplicateClient:
         seconds: float = DEFAULT_SECONDS,
         fps: Optional[int] = None,
         seed: Optional[int] = None,
+        cancel: Optional[threading.Event] = None,
     ) -> str:
         if not isinstance(prompt, str) or not prompt.strip():
             raise ReplicateError("prompt is required")
 
-        # Честные длительности:
-        #   5 секунд  => 100 кадров @ 20 fps
-        #   10 секунд => 100 кадров @ 10 fps
-        if float(seconds) >= 9.0:
-            fps = 10
-            total_frames = 100
-        else:
-            fps = 20
-            total_frames = 100
-
-        fps = int(fps)
-        fps = max(5, min(fps, 24))
-
-        use_seed = _make_seed(seed)
-
-        payload = {
-            "prompt": f"{PROMPT_PRIMER}{prompt}",
-            "negative_prompt": NEGATIVE_PROMPT,
-            "num_frames": int(total_frames),
-            "frames_per_second": int(fps),
-            "seed": int(use_seed),
-        }
+        plan = _frame_plan(seconds, fps)
+        payload = _t2v_payload(prompt, seconds, seed, fps)
 
         tok = self.token
-        url = _predict_with_sla(T2V_MODEL, payload, tok)
-        tmp = OUT_DIR / f"replicate_t2v_{int(time.time())}.dl.tmp.mp4"
+        url = _predict_with_sla(T2V_MODEL, payload, tok, cancel)
+        tmp = OUT_DIR / f"replicate_t2v_{uuid.uuid4().hex[:12]}.dl.tmp.mp4"
         _download(url, tmp)
-        final_path = self._finalize(tmp, "replicate_wanA_t2v", fps=fps)
+        final_path = self._finalize(tmp, "replicate_wanA_t2v", fps=plan.out_fps, interp=plan.interpolate)
         return str(final_path)
 
     def generate_from_image(
@@ -266,52 +348,17 @@ class ReplicateClient:
         seed: Optional[int] = None,
         strength: Optional[float] = None,
         denoise: Optional[float] = None,
+        cancel: Optional[threading.Event] = None,
     ) -> str:
-        # Те же правила длительности, что и для текста:
-        #   5 секунд  => 100 кадров @ 20 fps
-        #   10 секунд => 100 кадров @ 10 fps
-        if float(seconds) >= 9.0:
-            fps = 10
-            total_frames = 100
-        else:
-            fps = 20
-            total_frames = 100
-
-        fps = int(fps)
-        fps = max(5, min(fps, 24))
-
-        use_seed = _make_seed(seed)
-
-        if image.lower().startswith("http://") or image.lower().startswith("https://"):
-            img_url = image
-        else:
-            p = Path(image)
-            if not p.exists():
-                raise ReplicateError(f"Image not found: {image}")
-            img_url = _upload_catbox(p)
-
-        full_prompt = (
-            f"{PROMPT_PRIMER}{prompt}".strip()
-            + " Use the input image as the strict reference and base. Keep exactly the same main person, face, body, outfit, background and lighting as in the input image. "
-            + "The resulting video must clearly show that it is the same person and the same jacket or clothing from the input image, only modified exactly as described in the prompt (for example, the jacket removed from the body and visible nearby). "
-            + "Do not change the outfit style or color unless explicitly requested, do not change the background, do not add any lights, garlands, decorations or extra people. "
-            + "Only do what is explicitly described in the prompt (pose, action, removal of the jacket) while preserving identity and scene."
-        )
-
-        payload = {
-            "prompt": full_prompt,
-            "image": img_url,
-            "negative_prompt": NEGATIVE_PROMPT,
-            "num_frames": int(total_frames),
-            "frames_per_second": int(fps),
-            "seed": int(use_seed),
-        }
+        img_url = _image_url(image)
+        plan = _frame_plan(seconds, fps)
+        payload = _i2v_payload(img_url, prompt, seconds, seed, fps)
 
         tok = self.token
-        url = _predict_with_sla(I2V_MODEL, payload, tok)
-        tmp = OUT_DIR / f"replicate_t2v_{int(time.time())}.dl.tmp.mp4"
+        url = _predict_with_sla(I2V_MODEL, payload, tok, cancel)
+        tmp = OUT_DIR / f"replicate_i2v_{uuid.uuid4().hex[:12]}.dl.tmp.mp4"
         _download(url, tmp)
-        final_path = self._finalize(tmp, "replicate_wanA_t2v", fps=fps)
+        final_path = self._finalize(tmp, "replicate_wanA_i2v", fps=plan.out_fps, interp=plan.interpolate)
         return str(final_path)
 
     def text(self, prompt: str) -> str:
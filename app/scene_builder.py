@@ -1,5 +1,27 @@
-from dataclasses import dataclass
-from typing import List
+"""
+Раскадровка по тексту: правила тем — в данных (SCENE_RULES, по умолчанию app/scene_rules.json).
+
+    {"base":   [{"duration", "camera", "composition", "action", "mode"}, ...],
+     "themes": [{"name", "keywords": [...], "weight": 1.0, "shots": {"<i>": {поле: значение}}}, ...]}
+
+Все ключевые слова всех тем собраны в одну регулярку-бор (общие префиксы вынесены,
+как в автомате Ахо–Корасик): текст проходится один раз, независимо от числа тем. Семантика — как у прежних `w in p` (подстрока), включая
+слова, вложенные в более длинные. Очки темы = weight * число вхождений; если темы
+правят одно поле одного шота, берётся тема с большими очками (при равенстве — та,
+что ниже в файле, как раньше последний if перетирал предыдущие).
+
+mode — движение камеры для product_exact.build_zoompan_shot (a/b/c); timeline()
+отдаёт готовые (секунды, mode) для его таймлайна.
+"""
+import os
+import re
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SCENE_RULES = Path(os.environ.get("SCENE_RULES", str(Path(__file__).with_name("scene_rules.json"))))
 
 @dataclass
 class Shot:
@@ -7,23 +29,146 @@ class Shot:
     camera: str
     composition: str
     action: str
+    mode: str = "a"
+
+@dataclass
+class Plan:
+    shots: List[Shot]
+    scores: Dict[str, float] = field(default_factory=dict)
+
+class Rules:
+    """Скомпилированные правила: одна регулярка-бор на все ключевые слова."""
+
+    def __init__(self, data: dict):
+        self.base = [dict(s) for s in data.get("base") or []]
+        self.themes = [dict(t, weight=float(t.get("weight", 1.0))) for t in data.get("themes") or []]
+        owners: Dict[str, List[int]] = {}
+        for ti, t in enumerate(self.themes):
+            for kw in t.get("keywords") or []:
+                kw = kw.lower()
+                if kw and ti not in owners.setdefault(kw, []):
+                    owners[kw].append(ti)
+        trie = _trie(owners)
+        # в каждой позиции regex берёт самое длинное слово; вложенные в него слова
+        # (короче, в той же или другой позиции) засчитываем сразу — как `w in p` по всем
+        self._hits: Dict[str, List[int]] = {
+            kw: sorted({ti for other in _nested(trie, kw) for ti in owners[other]}) for kw in owners
+        }
+        self._rx = re.compile(_trie_pattern(trie)) if owners else None
+
+    @classmethod
+    def load(cls, path: Path) -> "Rules":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def scores(self, text: str) -> Dict[int, float]:
+        if self._rx is None:
+            return {}
+        counts: Dict[int, int] = {}
+        p = (text or "").lower()
+        search = self._rx.search
+        last_end = -1
+        m = search(p)
+        while m is not None:
+            kw = m.group()
+            # слово внутри уже найденного длинного — уже посчитано через _hits
+            if m.end() > last_end:
+                last_end = m.end()
+                for ti in self._hits[kw]:
+                    counts[ti] = counts.get(ti, 0) + 1
+            # следующий поиск — со следующего символа: слова, начатые внутри
+            # найденного и выходящие за него, тоже находятся
+            m = search(p, m.start() + 1)
+        return {ti: n * self.themes[ti]["weight"] for ti, n in counts.items()}
+
+    def plan(self, text: str) -> Plan:
+        shots = [Shot(**{k: s[k] for k in ("duration", "camera", "composition", "action", "mode") if k in s})
+                 for s in self.base]
+        scores = self.scores(text)
+        best: Dict[Tuple[int, str], Tuple[float, int]] = {}
+        for ti, score in scores.items():
+            for idx, patch in (self.themes[ti].get("shots") or {}).items():
+                i = int(idx)
+                if not 0 <= i < len(shots):
+                    continue
+                for fld, value in patch.items():
+                    cur = best.get((i, fld))
+                    if cur is None or (score, ti) >= cur:
+                        best[(i, fld)] = (score, ti)
+                        setattr(shots[i], fld, value)
+        return Plan(shots, {self.themes[ti]["name"]: sc for ti, sc in scores.items()})
+
+def _trie(words) -> dict:
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = w
+    return trie
+
+def _nested(trie: dict, text: str) -> set:
+    """Все слова бора, входящие в text (с любой позиции)."""
+    found = set()
+    for i in range(len(text)):
+        node = trie
+        for ch in text[i:]:
+            node = node.get(ch)
+            if node is None:
+                break
+            if "" in node:
+                found.add(node[""])
+    return found
+
+def _trie_pattern(trie: dict) -> str:
+    """
+    Регулярка-бор: общие префиксы вынесены (`sea(?:s|shore)?`), так что движок re
+    в каждой позиции проверяет одну ветку на букву, а не все слова подряд.
+    Жадные ветки дают самое длинное слово в позиции.
+    """
+    def build(node: dict) -> str:
+        end = "" in node
+        alts = [re.escape(ch) + build(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if end:
+            body = ("(?:" + body + ")?") if len(alts) == 1 else body + "?"
+        return body
+
+    return build(trie)
+
+_lock = threading.Lock()
+_cached: Optional[Tuple[Tuple[str, int], Rules]] = None
+
+def rules(path: Path = SCENE_RULES) -> Rules:
+    """Правила из файла; перечитываются, если файл поменялся (mtime)."""
+    global _cached
+    key = (str(path), os.stat(path).st_mtime_ns)
+    with _lock:
+        if _cached is None or _cached[0] != key:
+            _cached = (key, Rules.load(path))
+        return _cached[1]
+
+def plan(prompt: str) -> Plan:
+    return rules().plan(prompt)
 
 def build_shots(prompt: str) -> List[Shot]:
-    p = (prompt or "").lower()
-    base = [
-        Shot(1.5, "медленный съезд", "средний план", "установочный ритм"),
-        Shot(2.0, "наезд", "крупный план", "выделяем главный объект"),
-        Shot(1.5, "панорама", "общий план", "контекст сцены"),
-    ]
-    if any(w in p for w in ["море","пляж","ocean","sea"]):
-        base[0].action = "волны, ветер; установочный шот"
-        base[1].action = "наезд на персонажа у кромки воды"
-    if any(w in p for w in ["камин","огонь","fire"]):
-        base[0].action = "тёплый свет, камин; уютный сеттинг"
-        base[1].action = "крупно: лицо/руки в свете огня"
-    if any(w in p for w in ["ветер","буря","wind"]):
-        base[2].action = "панорама: качание волос/тканей"
-    return base
+    return plan(prompt).shots
+
+def timeline(prompt: str, duration: int) -> List[Tuple[int, str]]:
+    """
+    (секунды, mode) для product_exact: шоты по 5 с, как раньше
+    (5 -> [5], 10 -> [5, 5], 15 -> [5, 5, 5]), движения — из плана.
+    """
+    if duration <= 5:
+        parts = [duration]
+    elif duration <= 10:
+        parts = [5, duration - 5]
+    else:
+        parts = [5, 5, duration - 10]
+    modes = [s.mode for s in build_shots(prompt)] or ["a", "b", "c"]
+    return [(d, modes[i % len(modes)]) for i, d in enumerate(parts)]
 
 def summarize_plan(shots: List[Shot]) -> str:
     lines = []
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Спекулятивные стадии: начинаем работу, как только есть её вход, не дожидаясь,
+пока пользователь дойдёт до кнопки.
+
+    SPEC.start(user, "image", path, lambda: provider.stage_image(path))   # фото пришло — сразу заливаем
+    url = await SPEC.take(user, "image", path, default=path)              # "Ещё раз" — берём готовое
+
+- на (пользователь, стадия) — одна задача; новый вход отменяет старую (пришло новое фото);
+- take() с другим входом, ошибка стадии или истёкший SPEC_TTL_SEC -> default,
+  вызывающий делает всё как раньше, только без выигрыша;
+- результат живёт до замены или SPEC_TTL_SEC (sweep() из start()); если его так и не
+  взяли — задача отменяется и считается в wasted;
+- выигрыш — сколько секунд стадии уже было выполнено к моменту take():
+  пишется в app.tracing ("spec.saved") и в snapshot() для /metrics.
+"""
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+log = logging.getLogger("speculative")
+
+SPECULATE = os.environ.get("SPECULATE", "1") == "1"
+SPEC_TTL_SEC = float(os.environ.get("SPEC_TTL_SEC", "1800"))
+
+
+@dataclass
+class _Spec:
+    inp: Hashable
+    task: asyncio.Task
+    started: float
+    finished: Optional[float] = None
+    used: bool = False
+
+
+class Speculator:
+    def __init__(self, ttl: float = SPEC_TTL_SEC, enabled: bool = SPECULATE):
+        self.ttl = ttl
+        self.enabled = enabled
+        self._specs: Dict[Tuple[Hashable, str], _Spec] = {}
+        self.stats = {"started": 0, "used": 0, "missed": 0, "wasted": 0, "failed": 0, "saved_sec": 0.0}
+
+    def start(self, owner: Hashable, stage: str, inp: Hashable,
+              factory: Callable[[], Awaitable[Any]]) -> None:
+        """Запустить стадию в фоне. Тот же вход уже в работе — ничего не делаем."""
+        if not self.enabled:
+            return
+        self.sweep()
+        key = (owner, stage)
+        cur = self._specs.get(key)
+        if cur is not None:
+            failed = cur.task.done() and (cur.task.cancelled() or cur.task.exception() is not None)
+            if cur.inp == inp and not failed:
+                return
+            self._drop(key, "replaced")
+        spec = _Spec(inp, asyncio.ensure_future(factory()), time.monotonic())
+        spec.task.add_done_callback(lambda t, s=spec, st=stage: self._finished(s, st, t))
+        self._specs[key] = spec
+        self.stats["started"] += 1
+
+    def _finished(self, spec: _Spec, stage: str, task: asyncio.Task) -> None:
+        spec.finished = time.monotonic()
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["failed"] += 1
+            log.info("speculative %s failed: %s", stage, task.exception())
+
+    async def take(self, owner: Hashable, stage: str, inp: Hashable, default: Any = None) -> Any:
+        """Результат спекулятивной стадии для этого входа или default."""
+        spec = self._specs.get((owner, stage))
+        if spec is None or spec.inp != inp:
+            self.stats["missed"] += 1
+            return default
+        now = time.monotonic()
+        saved = (spec.finished or now) - spec.started
+        try:
+            result = await asyncio.shield(spec.task)
+        except asyncio.CancelledError:
+            if spec.task.cancelled():
+                self.stats["missed"] += 1
+                return default
+            raise
+        except Exception:
+            self.stats["missed"] += 1
+            return default
+        # результат остаётся до замены/TTL: повторный тап с тем же фото тоже берёт готовое
+        spec.used = True
+        self.stats["used"] += 1
+        self.stats["saved_sec"] += saved
+        try:
+            from app.tracing import record
+            record("spec.saved", saved, provider=stage)
+        except Exception:
+            pass
+        return result
+
+    def cancel(self, owner: Hashable, stage: Optional[str] = None) -> None:
+        for key in [k for k in self._specs if k[0] == owner and (stage is None or k[1] == stage)]:
+            self._drop(key, "cancelled")
+
+    def sweep(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, s in self._specs.items() if now - s.started > self.ttl]:
+            self._drop(key, "expired")
+
+    def _drop(self, key, why: str) -> None:
+        spec = self._specs.pop(key, None)
+        if spec is None:
+            return
+        if not spec.task.done():
+            spec.task.cancel()
+        if not spec.used:
+            self.stats["wasted"] += 1
+        log.debug("speculative %s %s", key, why)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats, pending=len(self._specs), saved_sec=round(self.stats["saved_sec"], 3))
+
+
+SPEC = Speculator()
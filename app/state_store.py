@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище состояния диалога вместо BOT_STATE-словарей.
+
+- запись на пользователя: {"last_prompt": ..., "last_image": ..., ...};
+- TTL (STATE_TTL_SEC) и лимит пользователей в памяти (STATE_MAX_USERS, LRU);
+- при вытеснении/замене удаляются временные картинки из last_image; картинку, которую
+  читает задача (using_file), удаляем, когда задача её отпустит;
+- опционально SQLite (STATE_DB): состояние переживает рестарт/деплой. Чтение тоже
+  продлевает TTL в базе (не чаще раза в _TOUCH_EVERY_SEC на пользователя).
+
+Совместимо со старым кодом: bot_state["last_prompt"][user], .get(user),
+bot_state.setdefault("last_dur", {})[user] = ... работают как раньше.
+"""
+import os
+import json
+import time
+import shutil
+import sqlite3
+import logging
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from app import storage
+
+log = logging.getLogger("state")
+
+STATE_TTL_SEC = float(os.environ.get("STATE_TTL_SEC", str(14 * 24 * 3600)))
+STATE_MAX_USERS = int(os.environ.get("STATE_MAX_USERS", "5000"))
+STATE_DB = os.environ.get("STATE_DB", "")
+
+FIELDS = ("last_prompt", "last_image", "last_dur", "last_sound")
+FILE_FIELDS = ("last_image",)
+_SWEEP_EVERY = 500
+_TOUCH_EVERY_SEC = 60.0
+
+# файлы, которые сейчас читают задачи: удаление откладывается до release
+_pins_lock = threading.Lock()
+_pins: "Counter[str]" = Counter()
+_pending_drop: set = set()
+
+
+def _is_temp_file(path: Any) -> bool:
+    if not isinstance(path, str) or not path:
+        return False
+    if storage.is_temp(path):
+        return True
+    try:
+        return Path(path).resolve().is_relative_to(Path(tempfile.gettempdir()).resolve())
+    except Exception:
+        return False
+
+
+@contextmanager
+def using_file(path: Any) -> Iterator[None]:
+    """
+    Задача читает path (например, last_image для i2v): замена/TTL/LRU в это время
+    файл не удаляют, удаление выполняется при выходе последнего пользователя.
+    """
+    if not isinstance(path, str) or not path:
+        yield
+        return
+    with _pins_lock:
+        _pins[path] += 1
+    try:
+        yield
+    finally:
+        with _pins_lock:
+            _pins[path] -= 1
+            drop = _pins[path] <= 0 and path in _pending_drop
+            if _pins[path] <= 0:
+                del _pins[path]
+                _pending_drop.discard(path)
+        if drop:
+            _remove_temp(path)
+
+
+def _defer_if_used(path: str) -> bool:
+    with _pins_lock:
+        if _pins.get(path, 0) > 0:
+            _pending_drop.add(path)
+            return True
+        return False
+
+
+def _remove_temp(path: Any) -> None:
+    """Удаляем временный файл; пустую mkdtemp-папку — вместе с ним."""
+    if not _is_temp_file(path):
+        return
+    if storage.is_temp(path):
+        storage.discard(path)
+        return
+    p = Path(path)
+    try:
+        p.unlink(missing_ok=True)
+        parent = p.parent
+        if parent != Path(tempfile.gettempdir()) and parent.name.startswith("tmp") and not any(parent.iterdir()):
+            shutil.rmtree(parent, ignore_errors=True)
+    except Exception as e:
+        log.debug("state: temp cleanup %s: %s", path, e)
+
+
+class _SqliteBackend:
+    def __init__(self, path: str):
+        self.path = path
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute("""CREATE TABLE IF NOT EXISTS bot_state (
+            user_id INTEGER,
+            field TEXT,
+            value TEXT,
+            ts REAL,
+            PRIMARY KEY (user_id, field)
+        );""")
+        self._con.commit()
+
+    def load(self, user_id: int, newer_than: float) -> Dict[str, Any]:
+        # просроченные строки не поднимаем: их вместе с файлами уберёт expire()
+        rows = self._con.execute(
+            "SELECT field, value FROM bot_state WHERE user_id=? AND ts >= ?", (user_id, newer_than),
+        ).fetchall()
+        return {f: json.loads(v) for f, v in rows}
+
+    def touch(self, user_id: int, ts: float, newer_than: float) -> None:
+        self._con.execute(
+            "UPDATE bot_state SET ts=? WHERE user_id=? AND ts >= ?", (ts, user_id, newer_than),
+        )
+        self._con.commit()
+
+    def save(self, user_id: int, field: str, value: Any, ts: float) -> None:
+        self._con.execute(
+            "INSERT OR REPLACE INTO bot_state(user_id, field, value, ts) VALUES (?,?,?,?)",
+            (user_id, field, json.dumps(value, ensure_ascii=False), ts),
+        )
+        self._con.commit()
+
+    def delete(self, user_id: int, field: Optional[str] = None) -> None:
+        if field is None:
+            self._con.execute("DELETE FROM bot_state WHERE user_id=?", (user_id,))
+        else:
+            self._con.execute("DELETE FROM bot_state WHERE user_id=? AND field=?", (user_id, field))
+        self._con.commit()
+
+    def expire(self, older_than: float):
+        rows = self._con.execute(
+            "SELECT user_id, value FROM bot_state WHERE ts < ? AND field IN (%s)" % ",".join("?" * len(FILE_FIELDS)),
+            (older_than, *FILE_FIELDS),
+        ).fetchall()
+        self._con.execute("DELETE FROM bot_state WHERE ts < ?", (older_than,))
+        self._con.commit()
+        return [json.loads(v) for _, v in rows]
+
+
+class _FieldView:
+    """dict-подобный вид на одно поле для всех пользователей."""
+
+    def __init__(self, store: "StateStore", field: str):
+        self._store = store
+        self._field = field
+
+    def get(self, user_id: int, default: Any = None) -> Any:
+        return self._store.get(user_id, self._field, default)
+
+    def __getitem__(self, user_id: int) -> Any:
+        sentinel = object()
+        v = self._store.get(user_id, self._field, sentinel)
+        if v is sentinel:
+            raise KeyError(user_id)
+        return v
+
+    def __setitem__(self, user_id: int, value: Any) -> None:
+        self._store.set(user_id, self._field, value)
+
+    def __delitem__(self, user_id: int) -> None:
+        self._store.delete(user_id, self._field)
+
+    def __contains__(self, user_id: int) -> bool:
+        return self.get(user_id) is not None
+
+    def pop(self, user_id: int, default: Any = None) -> Any:
+        v = self.get(user_id, default)
+        self._store.delete(user_id, self._field)
+        return v
+
+
+class StateStore:
+    def __init__(self, ttl: float = STATE_TTL_SEC, max_users: int = STATE_MAX_USERS, db_path: str = ""):
+        self.ttl = float(ttl)
+        self.max_users = int(max_users)
+        self._lock = threading.RLock()
+        self._users: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._ts: Dict[int, float] = {}
+        self._db_ts: Dict[int, float] = {}
+        self._gone: Dict[tuple, str] = {}
+        self._ops = 0
+        self._db = _SqliteBackend(db_path) if db_path else None
+        self.stats = {"evicted": 0, "expired": 0, "files_removed": 0}
+
+    @classmethod
+    def from_env(cls) -> "StateStore":
+        return cls(db_path=STATE_DB)
+
+    # ---- mapping-совместимость со старым BOT_STATE ----
+    def __getitem__(self, field: str) -> _FieldView:
+        return _FieldView(self, field)
+
+    def setdefault(self, field: str, default: Any = None) -> _FieldView:
+        return _FieldView(self, field)
+
+    def get(self, user_id: int, field: str, default: Any = None) -> Any:
+        with self._lock:
+            rec = self._touch(user_id)
+            if rec is None or field not in rec:
+                return default
+            v = rec[field]
+            if field in FILE_FIELDS and isinstance(v, str) and not os.path.exists(v):
+                # файл уже удалён (рестарт, чистка tmp) — ссылку тоже забываем
+                self.delete(user_id, field)
+                self._gone[(user_id, field)] = v
+                return default
+            return v
+
+    def file_gone(self, user_id: int, field: str) -> bool:
+        """Был ли файл в field, который get() забыл, потому что его уже нет на диске (один раз)."""
+        with self._lock:
+            return self._gone.pop((user_id, field), None) is not None
+
+    def set(self, user_id: int, field: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._gone.pop((user_id, field), None)
+            rec = self._touch(user_id, create=True)
+            old = rec.get(field)
+            rec[field] = value
+            if field in FILE_FIELDS and old and old != value:
+                self._drop_file(old)
+            if self._db is not None:
+                self._db.save(user_id, field, value, now)
+            self._evict_over_cap()
+            self._maybe_sweep()
+
+    def delete(self, user_id: int, field: Optional[str] = None) -> None:
+        with self._lock:
+            rec = self._users.get(user_id)
+            if rec is not None:
+                if field is None:
+                    self._users.pop(user_id, None)
+                    self._ts.pop(user_id, None)
+                    self._db_ts.pop(user_id, None)
+                else:
+                    rec.pop(field, None)
+            if self._db is not None:
+                self._db.delete(user_id, field)
+
+    def sweep(self) -> int:
+        """Выкидываем всё, что не трогали дольше TTL. Возвращает число пользователей."""
+        cutoff = time.time() - self.ttl
+        n = 0
+        with self._lock:
+            for uid in [u for u, ts in self._ts.items() if ts < cutoff]:
+                self._forget(uid)
+                n += 1
+            if self._db is not None:
+                for path in self._db.expire(cutoff):
+                    self._drop_file(path)
+        self.stats["expired"] += n
+        return n
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, users=len(self._users), persistent=self._db is not None)
+
+    # ---- внутреннее ----
+    def _touch(self, user_id: int, create: bool = False) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        rec = self._users.get(user_id)
+        if rec is not None and now - self._ts.get(user_id, now) > self.ttl:
+            self._forget(user_id)
+            self.stats["expired"] += 1
+            rec = None
+        if rec is None and self._db is not None:
+            loaded = self._db.load(user_id, now - self.ttl)
+            if loaded:
+                rec = self._users[user_id] = loaded
+        if rec is None:
+            if not create:
+                return None
+            rec = self._users[user_id] = {}
+        self._users.move_to_end(user_id)
+        self._ts[user_id] = now
+        if self._db is not None and now - self._db_ts.get(user_id, 0.0) >= min(_TOUCH_EVERY_SEC, self.ttl / 10):
+            # иначе expire() удалит строки и last_image у того, кто только читает
+            self._db.touch(user_id, now, now - self.ttl)
+            self._db_ts[user_id] = now
+        return rec
+
+    def _forget(self, user_id: int) -> None:
+        rec = self._users.pop(user_id, None) or {}
+        self._ts.pop(user_id, None)
+        self._db_ts.pop(user_id, None)
+        for f in FILE_FIELDS:
+            self._gone.pop((user_id, f), None)
+        for f in FILE_FIELDS:
+            self._drop_file(rec.get(f))
+        if self._db is not None:
+            self._db.delete(user_id)
+
+    def _evict_over_cap(self) -> None:
+        # из памяти вытесняем LRU; в SQLite запись остаётся до TTL
+        while len(self._users) > self.max_users:
+            uid, rec = self._users.popitem(last=False)
+            self._ts.pop(uid, None)
+            self._db_ts.pop(uid, None)
+            self.stats["evicted"] += 1
+            if self._db is None:
+                for f in FILE_FIELDS:
+                    self._drop_file(rec.get(f))
+
+    def _drop_file(self, path: Any) -> None:
+        if _is_temp_file(path) and os.path.exists(path):
+            if _defer_if_used(path):
+                return
+            _remove_temp(path)
+            self.stats["files_removed"] += 1
+
+    def _maybe_sweep(self) -> None:
+        self._ops += 1
+        if self._ops % _SWEEP_EVERY == 0:
+            self.sweep()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Жизненный цикл OUT_DIR.
+
+  OUT_DIR/final/<ab>/<prefix>_<sha1[:16]>.mp4   — готовые ролики (имя = хэш содержимого,
+                                                   два задания в одну секунду больше не
+                                                   перетирают друг друга)
+  OUT_DIR/tmp/<prefix>_<rand>/                   — временные папки (превью, фото, pex)
+
+gc(): временные старше OUT_TMP_TTL_SEC удаляются всегда (фото пользователей, photo_*, —
+старше OUT_PHOTO_TTL_SEC: на них ссылается last_image, который живёт STATE_TTL_SEC); если OUT_DIR больше
+OUT_QUOTA_GB — удаляем самые давно использованные файлы (final и tmp), пока не
+опустимся до 90% квоты. sweeper() гоняет gc() периодически из event loop,
+для cron есть `python -m app.storage gc`.
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger("storage")
+
+OUT_DIR = Path(os.environ.get("OUT_DIR", "/opt/content_factory/out"))
+FINAL_DIR = OUT_DIR / "final"
+TMP_ROOT = OUT_DIR / "tmp"
+
+OUT_QUOTA_GB = float(os.environ.get("OUT_QUOTA_GB", "20"))
+OUT_TMP_TTL_SEC = float(os.environ.get("OUT_TMP_TTL_SEC", str(6 * 3600)))
+OUT_GC_INTERVAL_SEC = float(os.environ.get("OUT_GC_INTERVAL_SEC", "600"))
+# не меньше TTL состояния диалога (app.state_store.STATE_TTL_SEC), иначе «Ещё раз» найдёт пустоту
+OUT_PHOTO_TTL_SEC = float(os.environ.get("OUT_PHOTO_TTL_SEC",
+                                         os.environ.get("STATE_TTL_SEC", str(14 * 24 * 3600))))
+_PHOTO_PREFIX = "photo_"
+
+
+def _sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def store_final(src: Path, prefix: str = "clip", ext: Optional[str] = None) -> Path:
+    """
+    Переносит готовый файл в FINAL_DIR под content-addressed именем.
+    Если такой же ролик уже лежит — исходник удаляется, возвращается существующий.
+    """
+    src = Path(src)
+    digest = _sha1(src)
+    ext = ext or src.suffix or ".mp4"
+    shard = FINAL_DIR / digest[:2]
+    shard.mkdir(parents=True, exist_ok=True)
+    dst = shard / f"{prefix}_{digest[:16]}{ext}"
+    if dst.exists():
+        src.unlink(missing_ok=True)
+        os.utime(dst)
+        return dst
+    shutil.move(str(src), str(dst))
+    return dst
+
+
+def new_tempdir(prefix: str = "job") -> Path:
+    TMP_ROOT.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=f"{prefix}_", dir=str(TMP_ROOT)))
+
+
+def is_temp(path) -> bool:
+    try:
+        return Path(path).resolve().is_relative_to(TMP_ROOT.resolve())
+    except Exception:
+        return False
+
+
+def discard(path) -> None:
+    """Удалить временный файл (и его tmp-папку, если она опустела)."""
+    if not path or not is_temp(path):
+        return
+    p = Path(path)
+    p.unlink(missing_ok=True)
+    parent = p.parent
+    try:
+        if parent != TMP_ROOT and parent.parent == TMP_ROOT and not any(parent.iterdir()):
+            parent.rmdir()
+    except OSError:
+        pass
+
+
+def _scan(root: Path) -> List[Tuple[float, int, str]]:
+    """(last_used, size, path) по всем файлам; os.scandir — без лишних stat()."""
+    out = []
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except FileNotFoundError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.is_file(follow_symlinks=False):
+                        st = e.stat(follow_symlinks=False)
+                        out.append((max(st.st_atime, st.st_mtime), st.st_size, e.path))
+                except FileNotFoundError:
+                    continue
+    return out
+
+
+def _rm_empty_dirs(root: Path, min_age: float = 60.0) -> None:
+    # свежие пустые папки не трогаем: mkdtemp уже создан, а файл ещё пишется
+    now = time.time()
+    for d, _subdirs, _files in os.walk(root, topdown=False):
+        if d == str(root):
+            continue
+        try:
+            if now - os.stat(d).st_mtime > min_age:
+                os.rmdir(d)
+        except OSError:
+            pass
+
+
+def _is_photo(path: str) -> bool:
+    try:
+        return Path(path).relative_to(TMP_ROOT).parts[0].startswith(_PHOTO_PREFIX)
+    except (ValueError, IndexError):
+        return False
+
+
+def gc(quota_gb: float = OUT_QUOTA_GB, tmp_ttl: float = OUT_TMP_TTL_SEC,
+       photo_ttl: float = OUT_PHOTO_TTL_SEC) -> Dict[str, int]:
+    now = time.time()
+    stats = {"tmp_removed": 0, "lru_removed": 0, "freed_bytes": 0}
+
+    # 1) протухшие временные
+    for used, size, path in _scan(TMP_ROOT):
+        if now - used > (photo_ttl if _is_photo(path) else tmp_ttl):
+            try:
+                os.unlink(path)
+                stats["tmp_removed"] += 1
+                stats["freed_bytes"] += size
+            except OSError:
+                pass
+    _rm_empty_dirs(TMP_ROOT)
+
+    # 2) квота на весь OUT_DIR: LRU по final и tmp
+    quota = int(quota_gb * (1 << 30))
+    if quota > 0:
+        files = _scan(FINAL_DIR) + _scan(TMP_ROOT)
+        total = sum(size for _, size, _ in files)
+        target = int(quota * 0.9)
+        if total > quota:
+            for used, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                stats["lru_removed"] += 1
+                stats["freed_bytes"] += size
+            _rm_empty_dirs(FINAL_DIR)
+    if stats["tmp_removed"] or stats["lru_removed"]:
+        log.info("storage gc: %s", stats)
+    return stats
+
+
+async def sweeper(interval: float = OUT_GC_INTERVAL_SEC) -> None:
+    """Фоновая задача: asyncio.ensure_future(sweeper()) на старте бота."""
+    while True:
+        try:
+            await asyncio.to_thread(gc)
+        except Exception as e:
+            log.error("storage gc failed: %s", e)
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "gc":
+        print(gc())
+    else:
+        print("usage: python -m app.storage gc")
+        sys.exit(2)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Лёгкая трассировка задач: job id + тайминги стадий.
+
+    job_id = new_job("generate", user=uid)      # в handle_text / _sora2 / again
+    with span("upload.catbox"): ...             # работает и в корутинах, и в потоках
+    record("provider.queue", dt, provider="wan")
+
+job id живёт в contextvars: переезжает в asyncio-задачи и asyncio.to_thread.
+Каждый span пишется строкой в TRACE_DIR/events-*.jsonl (тот же фоновый писатель,
+что и app.predlog) и попадает в гистограммы по (stage, provider).
+/metrics — Prometheus-текст: гистограммы, p50/p95 и счётчики из register_collector().
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.predlog import PredLog
+
+log = logging.getLogger("trace")
+
+TRACE_DIR = Path(os.environ.get("OUT_DIR", "/opt/content_factory/out")) / "traces"
+TRACE_ENABLED = os.environ.get("TRACE_ENABLED", "1") == "1"
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180, 300, 600)
+WINDOW = 500
+INF = 'le="+Inf"'
+
+_job: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_job", default=None)
+_writer = PredLog(root=TRACE_DIR)
+
+
+class _Hist:
+    __slots__ = ("counts", "sum", "n", "recent")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.n = 0
+        self.recent = deque(maxlen=WINDOW)
+
+    def add(self, v: float) -> None:
+        for i, b in enumerate(BUCKETS):
+            if v <= b:
+                self.counts[i] += 1
+        self.sum += v
+        self.n += 1
+        self.recent.append(v)
+
+    def quantile(self, q: float) -> Optional[float]:
+        xs = sorted(self.recent)
+        if not xs:
+            return None
+        return xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))]
+
+
+_lock = threading.Lock()
+_hists: Dict[Tuple[str, str], _Hist] = {}
+_errors: Dict[Tuple[str, str], int] = {}
+_collectors: List[Callable[[], Dict[str, float]]] = []
+
+
+def new_job(kind: str, **attrs: Any) -> str:
+    job_id = f"{kind[:3]}-{uuid.uuid4().hex[:10]}"
+    _job.set(job_id)
+    if TRACE_ENABLED:
+        _writer.log({"job": job_id, "event": "job", "kind": kind, **attrs})
+    return job_id
+
+
+def current_job() -> Optional[str]:
+    return _job.get()
+
+
+def record(stage: str, seconds: float, provider: str = "", ok: bool = True, **attrs: Any) -> None:
+    key = (stage, provider)
+    with _lock:
+        h = _hists.get(key)
+        if h is None:
+            h = _hists[key] = _Hist()
+        h.add(seconds)
+        if not ok:
+            _errors[key] = _errors.get(key, 0) + 1
+    if TRACE_ENABLED:
+        ev = {"job": _job.get(), "event": "span", "stage": stage, "sec": round(seconds, 4), "ok": ok}
+        if provider:
+            ev["provider"] = provider
+        ev.update(attrs)
+        _writer.log(ev)
+
+
+@contextmanager
+def span(stage: str, provider: str = "", **attrs: Any):
+    t0 = time.monotonic()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        record(stage, time.monotonic() - t0, provider, ok, **attrs)
+
+
+def register_collector(fn: Callable[[], Dict[str, float]]) -> None:
+    """fn() -> {"metric_name": value} — добавляется в /metrics как gauge."""
+    _collectors.append(fn)
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        return {
+            f"{stage}|{prov}": {"n": h.n, "p50": h.quantile(0.5), "p95": h.quantile(0.95),
+                                "errors": _errors.get((stage, prov), 0)}
+            for (stage, prov), h in _hists.items()
+        }
+
+
+def _labels(stage: str, provider: str, extra: str = "") -> str:
+    s = f'stage="{stage}",provider="{provider}"'
+    return "{" + s + (("," + extra) if extra else "") + "}"
+
+
+def render_metrics() -> str:
+    lines = [
+        "# TYPE cf_stage_seconds histogram",
+    ]
+    with _lock:
+        items = list(_hists.items())
+        errors = dict(_errors)
+        for (stage, prov), h in items:
+            for b, c in zip(BUCKETS, h.counts):
+                le = 'le="%s"' % b
+                lines.append(f"cf_stage_seconds_bucket{_labels(stage, prov, le)} {c}")
+            lines.append(f"cf_stage_seconds_bucket{_labels(stage, prov, INF)} {h.n}")
+            lines.append(f"cf_stage_seconds_sum{_labels(stage, prov)} {h.sum:.4f}")
+            lines.append(f"cf_stage_seconds_count{_labels(stage, prov)} {h.n}")
+        lines.append("# TYPE cf_stage_seconds_quantile gauge")
+        for (stage, prov), h in items:
+            for q in (0.5, 0.95):
+                v = h.quantile(q)
+                if v is not None:
+                    ql = 'quantile="%s"' % q
+                    lines.append(f"cf_stage_seconds_quantile{_labels(stage, prov, ql)} {v:.4f}")
+    lines.append("# TYPE cf_stage_errors_total counter")
+    for (stage, prov), n in errors.items():
+        lines.append(f"cf_stage_errors_total{_labels(stage, prov)} {n}")
+    for fn in list(_collectors):
+        try:
+            for name, value in fn().items():
+                if isinstance(value, bool):
+                    # True/False — не число для Prometheus, весь scrape отвергается
+                    lines.append(f"cf_{name} {int(value)}")
+                elif isinstance(value, (int, float)):
+                    lines.append(f"cf_{name} {value}")
+        except Exception as e:
+            log.debug("metrics collector failed: %s", e)
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_handler(request):
+    from aiohttp import web
+    return web.Response(text=render_metrics(), content_type="text/plain")
+
+
+async def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """Отдельный /metrics для polling-режима (в webhook-режиме он на том же сервере)."""
+    if not port:
+        return None
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("metrics on http://%s:%d/metrics", host, port)
+    return runner
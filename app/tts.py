@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Тёплый TTS: один долгоживущий piper на голос + кэш готового звука.
+
+Раньше каждая озвучка запускала новый piper (модель ONNX грузилась заново)
+или ходила в gTTS по сети. Теперь:
+
+    wav = TTS.synth("Лучший кофе в городе")         # путь к WAV из кэша
+    wav = await TTS.synth_async(text, voice=model)
+    for chunk in TTS.stream(text): ...                # WAV кусками (отдать в HTTP/телеграм)
+    mp3 = TTS.cached("gtts-ru", text, ".mp3", produce)  # тот же кэш для любого движка
+
+- piper запущен с --json-input: модель загружена один раз, запросы идут строками в stdin,
+  на каждую строку piper печатает путь готового файла;
+- воркер-поток на голос забирает из очереди всё, что накопилось, и отдаёт пачкой;
+- кэш TTS_CACHE_DIR (OUT_DIR/tts_cache) по sha1(голос, текст), вытеснение по LRU,
+  когда больше TTS_CACHE_MB; одинаковые запросы в полёте склеиваются.
+"""
+import os
+import json
+import queue
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+import subprocess
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+log = logging.getLogger("tts")
+
+PIPER_BIN = os.environ.get("PIPER_BIN", "piper")
+PIPER_MODEL = os.environ.get("PIPER_MODEL", "")          # напр. /opt/piper/ru_RU-dmitry-medium.onnx
+TTS_CACHE_DIR = Path(os.environ.get("TTS_CACHE_DIR", str(Path(os.environ.get("OUT_DIR", "/opt/content_factory/out")) / "tts_cache")))
+TTS_CACHE_MB = float(os.environ.get("TTS_CACHE_MB", "512"))
+TTS_TIMEOUT_SEC = float(os.environ.get("TTS_TIMEOUT_SEC", "120"))
+TTS_BATCH = int(os.environ.get("TTS_BATCH", "16"))
+
+
+class TTSError(RuntimeError):
+    pass
+
+
+def _norm_text(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def cache_key(voice: str, text: str) -> str:
+    return hashlib.sha1(f"{voice}\0{_norm_text(text)}".encode("utf-8")).hexdigest()
+
+
+class _PiperWorker:
+    """Один процесс piper с загруженной моделью; запросы — пачками из очереди."""
+
+    def __init__(self, model: str, binary: str = PIPER_BIN):
+        self.model = model
+        self.binary = binary
+        self._q: "queue.Queue[Tuple[str, Path, Future]]" = queue.Queue()
+        self._proc: Optional[subprocess.Popen] = None
+        self._thread = threading.Thread(target=self._loop, name=f"piper:{Path(model).stem}", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str, out: Path) -> Future:
+        fut: Future = Future()
+        self._q.put((text, out, fut))
+        return fut
+
+    # ---- процесс ----
+    def _spawn(self) -> subprocess.Popen:
+        log.info("tts: starting piper %s", self.model)
+        return subprocess.Popen(
+            [self.binary, "-m", self.model, "--json-input", "-q"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1,
+        )
+
+    def _ensure_proc(self) -> subprocess.Popen:
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = self._spawn()
+        return self._proc
+
+    def _kill(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+        self._proc = None
+
+    # ---- цикл ----
+    def _loop(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            while len(batch) < TTS_BATCH:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # процесс мог умереть посреди пачки — перезапустим на следующей
+                self._kill()
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(TTSError(f"piper failed: {e}"))
+
+    def _run_batch(self, batch: List[Tuple[str, Path, Future]]) -> None:
+        proc = self._ensure_proc()
+        for text, out, _ in batch:
+            proc.stdin.write(json.dumps({"text": text, "output_file": str(out)}, ensure_ascii=False) + "\n")
+        proc.stdin.flush()
+        for _, out, fut in batch:
+            # зависший piper не должен держать воркер вечно: по таймауту убиваем,
+            # readline вернёт EOF, а _loop перезапустит процесс на следующей пачке
+            hung = threading.Event()
+            watchdog = threading.Timer(TTS_TIMEOUT_SEC, lambda: (hung.set(), proc.kill()))
+            watchdog.daemon = True
+            watchdog.start()
+            try:
+                line = proc.stdout.readline()
+            finally:
+                watchdog.cancel()
+            if not line:
+                raise TTSError(f"piper hung > {TTS_TIMEOUT_SEC:.0f}s, killed" if hung.is_set() else "piper exited")
+            if out.exists() and out.stat().st_size > 44:
+                fut.set_result(out)
+            else:
+                fut.set_exception(TTSError(f"piper produced no audio for {out.name}"))
+
+
+class TTSService:
+    def __init__(self, cache_dir: Path = TTS_CACHE_DIR, max_mb: float = TTS_CACHE_MB,
+                 default_voice: str = PIPER_MODEL):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = int(max_mb * (1 << 20))
+        self.default_voice = default_voice
+        self._workers: Dict[str, _PiperWorker] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "joined": 0, "evicted": 0}
+
+    # ---- piper ----
+    def available(self, voice: Optional[str] = None) -> bool:
+        voice = voice or self.default_voice
+        return bool(voice) and Path(voice).exists() and shutil.which(PIPER_BIN) is not None
+
+    def _worker(self, voice: str) -> _PiperWorker:
+        with self._lock:
+            w = self._workers.get(voice)
+            if w is None:
+                w = self._workers[voice] = _PiperWorker(voice)
+            return w
+
+    def synth(self, text: str, voice: Optional[str] = None, timeout: float = TTS_TIMEOUT_SEC) -> Optional[str]:
+        """WAV из кэша или тёплого piper. None — piper/модель не настроены."""
+        voice = voice or self.default_voice
+        if not _norm_text(text) or not self.available(voice):
+            return None
+
+        def produce(tmp: Path) -> None:
+            self._worker(voice).submit(_norm_text(text), tmp).result(timeout=timeout)
+
+        return self.cached(voice, text, ".wav", produce, timeout=timeout)
+
+    async def synth_async(self, text: str, voice: Optional[str] = None) -> Optional[str]:
+        return await asyncio.to_thread(self.synth, text, voice)
+
+    def stream(self, text: str, voice: Optional[str] = None, chunk: int = 64 * 1024) -> Iterator[bytes]:
+        """WAV кусками. Синтез — целиком (piper пишет файл), дальше отдаём без загрузки в память."""
+        path = self.synth(text, voice)
+        if path is None:
+            return
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk), b""):
+                yield block
+
+    # ---- кэш ----
+    def _path(self, voice: str, text: str, ext: str) -> Path:
+        key = cache_key(voice, text)
+        return self.cache_dir / key[:2] / f"{key}{ext}"
+
+    def cached(self, voice: str, text: str, ext: str, produce: Callable[[Path], None],
+               timeout: float = TTS_TIMEOUT_SEC) -> str:
+        """
+        Готовый файл для (voice, text) или produce(tmp_path) один раз на ключ:
+        параллельные одинаковые запросы ждут первый.
+        """
+        path = self._path(voice, text, ext)
+        if path.exists():
+            os.utime(path)
+            self.stats["hits"] += 1
+            return str(path)
+
+        with self._lock:
+            fut = self._inflight.get(str(path))
+            owner = fut is None
+            if owner:
+                fut = self._inflight[str(path)] = Future()
+        if not owner:
+            self.stats["joined"] += 1
+            return fut.result(timeout=timeout)
+
+        self.stats["misses"] += 1
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.stem}.{os.getpid()}.{threading.get_ident()}{ext}")
+            produce(tmp)
+            os.replace(tmp, path)
+            fut.set_result(str(path))
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(str(path), None)
+        self._evict()
+        return str(path)
+
+    def _evict(self) -> None:
+        if self.max_bytes <= 0 or not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            files = []
+            for p in self.cache_dir.glob("*/*"):
+                if p.name.startswith("."):
+                    # .<key>.<pid>.<tid> — файл, который сейчас пишет produce()
+                    continue
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+            total = sum(s for _, s, _ in files)
+            for _, size, p in sorted(files):
+                if total <= self.max_bytes * 0.9:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
+                self.stats["evicted"] += 1
+        finally:
+            self._evict_lock.release()
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self.stats, voices=len(self._workers))
+
+
+TTS = TTSService()
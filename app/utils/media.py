@@ -1,4 +1,6 @@
 import os,ffmpeg
+from app.mediainfo import try_probe
+from app.renderfarm import FARM, BATCH
 def upscale_4k(src_path,out_dir,crf=22,preset="veryfast",audio_bitrate="128k"):
     if not os.path.isfile(src_path):
         raise FileNotFoundError("Source not found: "+str(src_path))
@@ -7,12 +9,16 @@ def upscale_4k(src_path,out_dir,crf=22,preset="veryfast",audio_bitrate="128k"):
     dst = os.path.join(out_dir,base+"_4k.mp4")
     vf = "scale=w=3840:h=2160:flags=lanczos"
     inp = ffmpeg.input(src_path)
-    (ffmpeg
-      .output(inp.video, inp.audio if audio_bitrate else None, dst, vf=vf,
+    info = try_probe(src_path)
+    if info is not None and not info.has_audio:
+        audio_bitrate = None   # нечего кодировать: inp.audio на немом клипе — ошибка ffmpeg
+    streams = [inp.video] + ([inp.audio] if audio_bitrate else [])
+    stream = (ffmpeg
+      .output(*streams, dst, vf=vf,
               vcodec="libx264",crf=crf,preset=preset,
               acodec="aac" if audio_bitrate else None,
               audio_bitrate=audio_bitrate if audio_bitrate else None,
               movflags="+faststart")
-      .overwrite_output()
-      .run(quiet=True))
+      .overwrite_output())
+    FARM.run_sync(stream.compile(), BATCH)
     return dst
@@ -0,0 +1,27 @@
+import asyncio, shlex
+from typing import List, Union
+
+
+class ProcError(RuntimeError):
+    pass
+
+
+async def run_async(cmd: Union[str, List[str]], tail: int = 800) -> bytes:
+    """
+    Запуск внешней команды (ffmpeg/curl) без блокировки event loop.
+    Если корутину отменили — процесс убивается, CPU не тратится на брошенную работу.
+    Строка разбирается через shlex (без shell, чтобы kill попадал в сам ffmpeg).
+    """
+    args = shlex.split(cmd) if isinstance(cmd, str) else [str(x) for x in cmd]
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        out, err = await proc.communicate()
+    except asyncio.CancelledError:
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise ProcError(f"Command failed [{proc.returncode}]: {args[0]}\n{err.decode(errors='ignore')[-tail:]}")
+    return out
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Webhook-режим бота (aiohttp).
+
+POST WEBHOOK_PATH  -> апдейт кладётся в очередь, Telegram сразу получает 200;
+WEBHOOK_WORKERS воркеров обрабатывают апдейты параллельно через dp.process_update;
+GET  /healthz      -> JSON со счётчиками и p50/p95 латентности обработки.
+
+На остановке новые апдейты получают 503 (Telegram повторит), очередь дорабатывается
+до WEBHOOK_DRAIN_SEC. Что не успели — уже подтверждено Telegram'у, поэтому пишется в
+WEBHOOK_SPOOL и обрабатывается первым при следующем старте.
+Накопившиеся у Telegram апдейты не выбрасываются (drop_pending_updates=False).
+Локально: WEBHOOK_URL не задаём, шлём фейковые апдейты tools/webhook_fake_update.py.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+
+from app.tracing import metrics_handler, register_collector
+
+log = logging.getLogger("webhook")
+
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/tg/webhook")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")          # публичный https://.../tg/webhook
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "16"))
+WEBHOOK_QUEUE_MAX = int(os.environ.get("WEBHOOK_QUEUE_MAX", "1000"))
+WEBHOOK_DRAIN_SEC = float(os.environ.get("WEBHOOK_DRAIN_SEC", "60"))
+WEBHOOK_SPOOL = Path(os.environ.get("WEBHOOK_SPOOL", str(
+    Path(os.environ.get("OUT_DIR", "/opt/content_factory/out")) / "webhook_pending.jsonl")))
+
+
+def install_uvloop() -> bool:
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    xs = sorted(values)
+    return xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))]
+
+
+class UpdateStats:
+    def __init__(self, window: int = 1000):
+        self.handle = deque(maxlen=window)
+        self.wait = deque(maxlen=window)
+        self.counters = {"received": 0, "processed": 0, "failed": 0, "rejected": 0}
+
+    def snapshot(self) -> Dict[str, Any]:
+        h, w = list(self.handle), list(self.wait)
+        return dict(self.counters,
+                    handle_p50=_pct(h, 0.5), handle_p95=_pct(h, 0.95),
+                    queue_wait_p50=_pct(w, 0.5), queue_wait_p95=_pct(w, 0.95))
+
+
+class WebhookServer:
+    def __init__(self, dp: Dispatcher, workers: int = WEBHOOK_WORKERS):
+        self.dp = dp
+        self.workers = max(1, workers)
+        self.stats = UpdateStats()
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+
+    # ---- aiohttp ----
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self._on_update)
+        app.router.add_get("/healthz", self._on_health)
+        app.router.add_get("/metrics", metrics_handler)
+        app.on_startup.append(self._startup)
+        app.on_shutdown.append(self._shutdown)
+        return app
+
+    async def _on_update(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        if not self._accepting or self.queue.full():
+            # Telegram повторит доставку позже — апдейт не потеряется
+            self.stats.counters["rejected"] += 1
+            return web.Response(status=503)
+        data = await request.json()
+        self.stats.counters["received"] += 1
+        self.queue.put_nowait((time.monotonic(), types.Update(**data)))
+        return web.Response(text="ok")
+
+    async def _on_health(self, request: web.Request) -> web.Response:
+        snap = self.stats.snapshot()
+        snap.update(queued=self.queue.qsize() if self.queue else 0, workers=self.workers,
+                    accepting=self._accepting)
+        return web.json_response(snap)
+
+    # ---- воркеры ----
+    async def _worker(self) -> None:
+        while True:
+            t_in, update = await self.queue.get()
+            t0 = time.monotonic()
+            self.stats.wait.append(t0 - t_in)
+            try:
+                Bot.set_current(self.dp.bot)
+                Dispatcher.set_current(self.dp)
+                await self.dp.process_update(update)
+                self.stats.counters["processed"] += 1
+            except Exception as e:
+                self.stats.counters["failed"] += 1
+                log.error("update %s failed: %s", getattr(update, "update_id", "?"), e)
+            finally:
+                dt = time.monotonic() - t0
+                self.stats.handle.append(dt)
+                if dt > 5:
+                    log.info("slow update %s: %.2fs", getattr(update, "update_id", "?"), dt)
+                self.queue.task_done()
+
+    # ---- недоработанные апдейты между рестартами ----
+    def _spool_leftovers(self) -> int:
+        # 200 уже отдан, Telegram их не повторит — сохраняем до следующего старта
+        rows = []
+        while not self.queue.empty():
+            _, update = self.queue.get_nowait()
+            self.queue.task_done()
+            rows.append(json.dumps(update.to_python(), ensure_ascii=False))
+        if rows:
+            WEBHOOK_SPOOL.parent.mkdir(parents=True, exist_ok=True)
+            with open(WEBHOOK_SPOOL, "a", encoding="utf-8") as f:
+                f.write("\n".join(rows) + "\n")
+        return len(rows)
+
+    def _restore_spool(self) -> int:
+        if not WEBHOOK_SPOOL.exists():
+            return 0
+        lines = [ln for ln in WEBHOOK_SPOOL.read_text(encoding="utf-8").splitlines() if ln.strip()]
+        n = 0
+        for ln in lines:
+            if self.queue.full():
+                break
+            try:
+                self.queue.put_nowait((time.monotonic(), types.Update(**json.loads(ln))))
+            except ValueError as e:
+                log.warning("spool: bad line skipped: %s", e)
+            n += 1
+        rest = lines[n:]
+        if rest:
+            WEBHOOK_SPOOL.write_text("\n".join(rest) + "\n", encoding="utf-8")
+        else:
+            WEBHOOK_SPOOL.unlink(missing_ok=True)
+        return n
+
+    async def _startup(self, app: web.Application) -> None:
+        self.queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_MAX)
+        restored = self._restore_spool()
+        if restored:
+            log.info("Restored %d updates from %s", restored, WEBHOOK_SPOOL)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        self._accepting = True
+        register_collector(lambda: {f"webhook_{k}": v for k, v in self.stats.snapshot().items()})
+        from app.storage import sweeper
+        self._tasks.append(asyncio.ensure_future(sweeper()))
+        if WEBHOOK_URL:
+            await self.dp.bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None,
+                                          drop_pending_updates=False)
+            log.info("Webhook set: %s", WEBHOOK_URL)
+        log.info("Webhook server: %s:%s%s, workers=%d", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, self.workers)
+
+    async def _shutdown(self, app: web.Application) -> None:
+        self._accepting = False
+        log.info("Draining %d queued updates…", self.queue.qsize())
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=WEBHOOK_DRAIN_SEC)
+        except asyncio.TimeoutError:
+            log.warning("Drain timeout, %d updates left", self.queue.qsize())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        spooled = self._spool_leftovers()
+        if spooled:
+            log.warning("Saved %d unprocessed updates to %s", spooled, WEBHOOK_SPOOL)
+        log.info("Webhook stats: %s", self.stats.snapshot())
+        await self.dp.storage.close()
+        await self.dp.storage.wait_closed()
+        session = await self.dp.bot.get_session()
+        await session.close()
+
+
+def run_webhook(dp: Dispatcher) -> None:
+    if install_uvloop():
+        log.info("uvloop enabled")
+    web.run_app(WebhookServer(dp).make_app(), host=WEBHOOK_HOST, port=WEBHOOK_PORT)
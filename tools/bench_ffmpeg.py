@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# /opt/content_factory/tools/bench_ffmpeg.py
+# Микробенчмарк ffmpeg-стадий на сгенерированных lavfi-исходниках (без сети).
+# Каждая стадия вызывается через настоящий код/флаги проекта; меряем wall, CPU дочерних
+# ffmpeg, размер результата и SSIM/PSNR против эталона (где эталон осмыслен).
+#
+# usage: bench_ffmpeg.py [--stages norm,postprocess,...] [--repeat 3] [--json out.json]
+#                        [--compare old.json] [--keep]
+#   по умолчанию результат пишется в bench_results/ffmpeg_<git-sha>.json
+#
+# стадии:
+#   norm          app.replicate_adapter._norm_cmd         (клип провайдера -> 720p, fps)
+#   postprocess   app.bot_ui_patch._postprocess_cmd       (cut 0.2s, 720p, 24fps)
+#   preview       app.bot_ui_patch._preview_cmd           (чёрный 720x720)
+#   zoompan       product_exact.build_zoompan_shot        (картинка -> 5s шот)
+#   xfade         product_exact.concat_with_xfade         (3 шота по 5s)
+#   audio_mix     product_exact.add_audio_mix             (TTS-заглушка sine + музыка, если есть)
+#   ensure_audio  app.adapters.ffmpeg_utils.ensure_audio
+#   voiceover     app.adapters.tts_adapter.voiceover_video (gTTS заменён на lavfi-mp3)
+#   upscale_4k    app.utils.media.upscale_4k
+#   render_many   adapters.ffmpeg_stub.render_many / render_many_async (4 шт.)
+
+import os, re, sys, json, time, shutil, asyncio, argparse, platform, resource, subprocess, tempfile, statistics
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+RESULTS_DIR = ROOT / "bench_results"
+
+
+def sh(cmd):
+    """ffmpeg с проверкой кода; cmd — список или строка (как в _norm_cmd)."""
+    p = subprocess.run(cmd, shell=isinstance(cmd, str), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise RuntimeError(p.stderr.decode(errors="ignore")[-600:])
+    return p
+
+
+# ---------- тестовые исходники ----------
+
+def make_media(d: Path, a) -> dict:
+    """Клип «как от провайдера», картинка, TTS/музыка — всё lavfi, детерминированно."""
+    w, h = a.src_size.split("x")
+    m = {
+        "clip": d / "src_clip.mp4",           # как отдаёт WAN: 832x480@20, без звука
+        "clip_audio": d / "src_clip_a.mp4",   # то же со звуком
+        "image": d / "src_image.jpg",
+        "tts": d / "src_tts.wav",
+        "mp3": d / "src_tts.mp3",
+    }
+    src = f"testsrc2=s={w}x{h}:r={a.src_fps}:d={a.seconds}"
+    sh(["ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", src,
+        "-c:v", "libx264", "-crf", "12", "-preset", "veryfast", "-pix_fmt", "yuv420p", str(m["clip"])])
+    sh(["ffmpeg", "-y", "-v", "error", "-i", str(m["clip"]), "-f", "lavfi", "-i", f"sine=f=440:d={a.seconds}",
+        "-c:v", "copy", "-c:a", "aac", "-shortest", str(m["clip_audio"])])
+    sh(["ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", "testsrc2=s=1600x1200:d=1",
+        "-frames:v", "1", "-q:v", "2", str(m["image"])])
+    sh(["ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", f"sine=f=220:d={a.seconds}:sample_rate=22050",
+        str(m["tts"])])
+    sh(["ffmpeg", "-y", "-v", "error", "-i", str(m["tts"]), "-b:a", "64k", str(m["mp3"])])
+    return m
+
+
+# ---------- стадии: (media, workdir) -> (output_path, reference_path | None, ref_seek) ----------
+
+def st_norm(m, d):
+    from app.replicate_adapter import _norm_cmd
+    src = d / "norm_in.mp4"
+    shutil.copy(m["clip"], src)
+    cmd, out = _norm_cmd(src, 24)
+    sh(cmd)
+    return out, m["clip"], 0.0
+
+
+def st_postprocess(m, d):
+    from app.bot_ui_patch import _postprocess_cmd, CUT_START
+    out = d / "fx.mp4"
+    sh(_postprocess_cmd(m["clip"], out))
+    return out, m["clip"], CUT_START
+
+
+def st_preview(m, d):
+    from app.bot_ui_patch import _preview_cmd
+    out = d / "preview.mp4"
+    sh(_preview_cmd(5, out))
+    return out, None, 0.0
+
+
+def st_zoompan(m, d):
+    from app.pipelines.product_exact import build_zoompan_shot, ensure_image_1080p
+    base = ensure_image_1080p(str(m["image"]), d)
+    out = d / "shot.mp4"
+    build_zoompan_shot(base, str(out), 5, "a")
+    return out, None, 0.0
+
+
+def _shots(m, d):
+    from app.pipelines.product_exact import build_zoompan_shot, ensure_image_1080p
+    key = d / "shots.json"
+    if key.exists():
+        return json.loads(key.read_text())
+    base = ensure_image_1080p(str(m["image"]), d)
+    shots = []
+    for i, mode in enumerate("abc"):
+        p = d / f"xshot{i}.mp4"
+        build_zoompan_shot(base, str(p), 5, mode)
+        shots.append(str(p))
+    key.write_text(json.dumps(shots))
+    return shots
+
+
+def setup_xfade(m, d):
+    # шоты готовятся вне замера; копии — concat пишет _fix-файлы рядом с ними
+    shots = []
+    for i, p in enumerate(_shots(m, d.parent)):
+        q = d / f"xin{i}.mp4"
+        shutil.copy(p, q)
+        shots.append(str(q))
+    return {"shots": shots}
+
+
+def st_xfade(m, d, shots):
+    from app.pipelines.product_exact import concat_with_xfade
+    out = d / "merged.mp4"
+    concat_with_xfade(shots, str(out))
+    return out, None, 0.0
+
+
+def st_audio_mix(m, d):
+    from app.pipelines.product_exact import add_audio_mix
+    out = d / "mixed.mp4"
+    add_audio_mix(str(m["clip"]), str(m["tts"]), str(out))
+    return out, m["clip"], 0.0
+
+
+def st_ensure_audio(m, d):
+    from app.adapters.ffmpeg_utils import ensure_audio
+    out = Path(ensure_audio(str(m["clip"])))
+    return out, m["clip"], 0.0
+
+
+def st_voiceover(m, d):
+    from app.adapters import tts_adapter
+    # без сети: gTTS подменяем готовым mp3, меряем только ffmpeg-мукс
+    tts_adapter.tts_to_mp3 = lambda text: str(m["mp3"])
+    src = d / "vo_in.mp4"
+    shutil.copy(m["clip"], src)
+    out = Path(tts_adapter.voiceover_video(str(src), "тест"))
+    return out, m["clip"], 0.0
+
+
+def st_upscale_4k(m, d):
+    from app.utils.media import upscale_4k
+    out = Path(upscale_4k(str(m["clip_audio"]), str(d / "4k")))
+    return out, m["clip"], 0.0
+
+
+def st_render_many(m, d):
+    from adapters.ffmpeg_stub import render_many
+    outs = render_many("кот на пляже", 4, str(d / "rm"))
+    return Path(outs[0]), None, 0.0
+
+
+def st_render_many_async(m, d):
+    from adapters.ffmpeg_stub import render_many_async
+    outs = asyncio.run(render_many_async("кот на пляже", 4, str(d / "rma")))
+    return Path(outs[0]), None, 0.0
+
+
+# подготовка, которая не должна попадать в замер
+SETUP = {
+    "xfade": setup_xfade,
+}
+
+STAGES = {
+    "norm": st_norm,
+    "postprocess": st_postprocess,
+    "preview": st_preview,
+    "zoompan": st_zoompan,
+    "xfade": st_xfade,
+    "audio_mix": st_audio_mix,
+    "ensure_audio": st_ensure_audio,
+    "voiceover": st_voiceover,
+    "upscale_4k": st_upscale_4k,
+    "render_many": st_render_many,
+    "render_many_async": st_render_many_async,
+}
+
+
+# ---------- метрики ----------
+
+_SSIM = re.compile(r"SSIM .*All:([0-9.]+)")
+_PSNR = re.compile(r"PSNR .*average:([0-9.]+|inf)")
+
+
+def quality(out: Path, ref: Path, ref_seek: float = 0.0):
+    """SSIM/PSNR результата против эталона, результат масштабируется к размеру эталона."""
+    fc = ("[0:v][1:v]scale2ref=flags=bicubic[d][r];[d]split[d1][d2];[r]split[r1][r2];"
+          "[d1][r1]ssim;[d2][r2]psnr")
+    cmd = ["ffmpeg", "-v", "info", "-nostats", "-i", str(out)]
+    if ref_seek:
+        cmd += ["-ss", str(ref_seek)]
+    cmd += ["-i", str(ref), "-lavfi", fc, "-f", "null", "-"]
+    err = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).stderr.decode(errors="ignore")
+    s, p = _SSIM.search(err), _PSNR.search(err)
+    return (float(s.group(1)) if s else None,
+            (float(p.group(1)) if p.group(1) != "inf" else 99.0) if p else None)
+
+
+def _children_cpu():
+    r = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return r.ru_utime + r.ru_stime
+
+
+def run_stage(name, fn, media, root: Path, repeat: int):
+    walls, cpus, res = [], [], {}
+    for i in range(repeat):
+        d = root / name / str(i)
+        d.mkdir(parents=True, exist_ok=True)
+        extra = SETUP[name](media, d) if name in SETUP else {}
+        c0, t0 = _children_cpu(), time.perf_counter()
+        out, ref, seek = fn(media, d, **extra)
+        walls.append(time.perf_counter() - t0)
+        cpus.append(_children_cpu() - c0)
+        if i == 0:
+            res["size_bytes"] = Path(out).stat().st_size
+            if ref is not None:
+                res["ssim"], res["psnr"] = quality(Path(out), Path(ref), seek)
+    res.update(ok=True, wall_sec=round(statistics.median(walls), 3), wall_min=round(min(walls), 3),
+               cpu_sec=round(statistics.median(cpus), 3), repeat=repeat)
+    return res
+
+
+def env_info():
+    def _out(cmd):
+        try:
+            return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=ROOT,
+                                  text=True).stdout.strip()
+        except OSError:
+            return ""
+    return {
+        "git": _out(["git", "rev-parse", "--short", "HEAD"]),
+        "ffmpeg": _out(["ffmpeg", "-version"]).split("\n", 1)[0],
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "ts": time.time(),
+    }
+
+
+def compare(cur, old):
+    print(f"{'stage':<18}{'wall':>9}{'Δwall':>9}{'cpu':>9}{'size KB':>10}{'Δsize':>8}{'ssim':>8}{'psnr':>7}")
+    for name, r in cur["stages"].items():
+        o = old.get("stages", {}).get(name, {})
+        if not r.get("ok"):
+            print(f"{name:<18}  {r.get('error', 'failed')[:60]}")
+            continue
+
+        def delta(k):
+            return f"{(r[k] / o[k] - 1) * 100:+.0f}%" if o.get(k) else "—"
+
+        ssim = f"{r['ssim']:.4f}" if r.get("ssim") is not None else "—"
+        psnr = f"{r['psnr']:.1f}" if r.get("psnr") is not None else "—"
+        print(f"{name:<18}{r['wall_sec']:>9.2f}{delta('wall_sec'):>9}{r['cpu_sec']:>9.2f}"
+              f"{r['size_bytes'] / 1024:>10.0f}{delta('size_bytes'):>8}{ssim:>8}{psnr:>7}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="ffmpeg stage micro-benchmarks")
+    p.add_argument("--stages", default=",".join(STAGES), help="через запятую")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--seconds", type=int, default=5)
+    p.add_argument("--src-size", default="832x480")
+    p.add_argument("--src-fps", type=int, default=20)
+    p.add_argument("--json", default="")
+    p.add_argument("--compare", default="", help="JSON прошлого прогона")
+    p.add_argument("--keep", action="store_true")
+    a = p.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        raise SystemExit("ffmpeg not found")
+    root = Path(tempfile.mkdtemp(prefix="cf_ffbench_"))
+    # артефакты стадий (store_final, tmp) — во временном OUT_DIR, не в рабочем
+    os.environ["OUT_DIR"] = str(root / "out")
+    os.environ.setdefault("TMPDIR", str(root))
+    tempfile.tempdir = str(root)
+
+    result = {"env": env_info(), "args": vars(a), "stages": {}}
+    try:
+        media = make_media(root, a)
+        for name in [s.strip() for s in a.stages.split(",") if s.strip()]:
+            fn = STAGES.get(name)
+            if fn is None:
+                result["stages"][name] = {"ok": False, "error": "unknown stage"}
+                continue
+            try:
+                result["stages"][name] = run_stage(name, fn, media, root, max(1, a.repeat))
+            except Exception as e:
+                result["stages"][name] = {"ok": False, "error": f"{type(e).__name__}: {e}"[:500]}
+            r = result["stages"][name]
+            print(f"{name}: " + (f"{r['wall_sec']:.2f}s wall, {r['cpu_sec']:.2f}s cpu" if r["ok"] else r["error"][:120]),
+                  file=sys.stderr)
+    finally:
+        if not a.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    out = Path(a.json) if a.json else RESULTS_DIR / f"ffmpeg_{result['env']['git'] or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2))
+    old = json.loads(Path(a.compare).read_text()) if a.compare else {}
+    compare(result, old)
+    print(f"\nresults: {out}")
+
+
+if __name__ == "__main__":
+    main()
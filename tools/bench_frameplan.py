@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# /opt/content_factory/tools/bench_frameplan.py
+# Сколько кадров мы покупаем у провайдера на секунду готового ролика: прежние (num_frames, fps)
+# против app.frameplan. Без сети; с --render дополнительно меряет локальный досчёт до 24 fps.
+#
+# Сравнивает для каждой длительности:
+#   legacy  — как было: wan    (app/replicate_adapter)          < 9 с -> 100 @ 20, >= 9 с -> 100 @ 10
+#                       wan-ui (app/adapters/replicate_adapter) round(сек * 24) кадров @ 24, не больше 120
+#   plan    — app.frameplan.plan_frames с теми же ограничениями провайдера
+# Цена/время провайдера — линейно по кадрам: --sec-per-frame, --usd-per-frame.
+#
+# usage: bench_frameplan.py [--seconds 3,5,8,10] [--providers wan,wan-ui]
+#                           [--sec-per-frame 1.1] [--usd-per-frame 0.0012]
+#                           [--render [--interp blend,minterpolate]] [--json out.json]
+#   --render: исходник testsrc2 832x480 с fps плана -> scale 720p + фильтр интерполяции,
+#             wall/CPU ffmpeg на секунду готового видео (нужен ffmpeg в PATH)
+
+import sys, json, time, argparse, resource, subprocess, tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.frameplan import WAN_FRAMES, interp_filter, plan_frames  # noqa: E402
+
+# ограничения провайдеров — как в adapters.providers (без импорта клиентов и токенов)
+PROVIDERS = {
+    "wan": {"max_frames": 100, "fps_range": (5, 24), "frames": WAN_FRAMES},
+    "wan-ui": {"max_frames": 120, "fps_range": (5, 24), "frames": tuple(range(81, 121))},
+}
+
+
+def legacy(provider: str, seconds: float):
+    if provider == "wan":
+        return (100, 20) if seconds < 9 else (100, 10)
+    return max(1, min(int(round(seconds * 24)), 120)), 24
+
+
+def render(n: int, fps: int, method: str, out_fps: int):
+    """(wall, cpu) ffmpeg на досчёт клипа n кадров @ fps до out_fps."""
+    vf = ",".join(x for x in ("scale=-2:720:flags=lanczos", interp_filter(method, out_fps)) if x)
+    with tempfile.TemporaryDirectory() as d:
+        src, out = Path(d) / "src.mp4", Path(d) / "out.mp4"
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", f"testsrc2=s=832x480:r={fps}",
+                        "-frames:v", str(n), "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+                        str(src)], check=True)
+        r0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        t0 = time.perf_counter()
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-i", str(src), "-vf", vf, "-r", str(out_fps),
+                        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p",
+                        "-an", str(out)], check=True)
+        wall = time.perf_counter() - t0
+        r1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return wall, (r1.ru_utime - r0.ru_utime) + (r1.ru_stime - r0.ru_stime)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", default="3,5,8,10")
+    ap.add_argument("--providers", default="wan,wan-ui")
+    ap.add_argument("--sec-per-frame", type=float, default=1.1, help="время провайдера на кадр, с")
+    ap.add_argument("--usd-per-frame", type=float, default=0.0012)
+    ap.add_argument("--render", action="store_true")
+    ap.add_argument("--interp", default="blend,minterpolate")
+    ap.add_argument("--json")
+    a = ap.parse_args()
+
+    rows = []
+    for prov in [p.strip() for p in a.providers.split(",") if p.strip()]:
+        caps = PROVIDERS[prov]
+        for secs in [float(x) for x in a.seconds.split(",") if x.strip()]:
+            plans = {"legacy": legacy(prov, secs)}
+            for method in [m.strip() for m in a.interp.split(",") if m.strip()]:
+                p = plan_frames(secs, interp=method, **caps)
+                plans[f"plan/{p.interpolate or 'none'}"] = (p.num_frames, p.fps, p.out_fps, p.interpolate)
+            for name, spec in plans.items():
+                n, fps = spec[0], spec[1]
+                out_fps, method = (spec[2], spec[3]) if len(spec) > 2 else (24, "")
+                delivered = n / fps
+                row = {
+                    "provider": prov, "seconds": secs, "scheme": name, "frames": n, "gen_fps": fps,
+                    "out_fps": out_fps, "interp": method, "delivered_s": round(delivered, 2),
+                    "frames_per_s": round(n / delivered, 1),
+                    "provider_s": round(n * a.sec_per_frame, 1),
+                    "usd": round(n * a.usd_per_frame, 4),
+                }
+                if a.render and method:
+                    wall, cpu = render(n, fps, method, out_fps)
+                    row["render_wall_per_s"] = round(wall / delivered, 3)
+                    row["render_cpu_per_s"] = round(cpu / delivered, 3)
+                rows.append(row)
+
+    print(f"{'provider':>8} {'sec':>5} {'scheme':>18} {'frames':>6} {'fps':>4} {'->':>3} {'out s':>6} "
+          f"{'fr/s':>5} {'prov s':>7} {'usd':>7} {'cpu/s':>6}")
+    for r in rows:
+        print(f"{r['provider']:>8} {r['seconds']:>5g} {r['scheme']:>18} {r['frames']:>6} {r['gen_fps']:>4} "
+              f"{r['out_fps']:>3} {r['delivered_s']:>6} {r['frames_per_s']:>5} {r['provider_s']:>7} "
+              f"{r['usd']:>7} {r.get('render_cpu_per_s', '-'):>6}")
+    if a.json:
+        Path(a.json).write_text(json.dumps(rows, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
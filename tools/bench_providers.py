@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# /opt/content_factory/tools/bench_providers.py
+# Офлайн-бенчмарк генерации: поднимает tools/fake_providers.py отдельным процессом,
+# направляет на него клиентов (REPLICATE_API_BASE, LUMA_BASE_URL, KIE_BASE_URL, CATBOX_UPLOAD_URL)
+# и гоняет синтетических пользователей. Денег и сети не тратит.
+#
+# usage: bench_providers.py <scenario> [--users 8] [--jobs 3] [--latency 8] [--fail-rate 0.05]
+#                           [--json out.json] [--baseline base.json --tolerance 0.2]
+#
+# сценарии:
+#   wan-curl       app.replicate_adapter.ReplicateClient.generate_from_text (curl + поток)
+#   wan            adapters.providers REGISTRY["wan"].run — то, что зовёт UI
+#   sora-aiohttp   adapters.replicate_adapter.ReplicateClient.generate (aiohttp-сессия)
+#   render_videos  adapters.render_videos с цепочкой --providers (по умолчанию luma)
+#   kie            adapters.kie_ai.KIEClient.generate
+#   bot            app.bot_ui_patch: handle_text (превью) + кнопка «again» на пользователя
+#                  (провайдер UI_PROVIDER, по умолчанию wan-ui — тоже через фейковый сервер)
+#
+# Отчёт: jobs/min, p50/p95/max латентности, доля ошибок, CPU (свой и дочерних curl/ffmpeg),
+# пиковый RSS, счётчики фейкового сервера и (для wan/bot) p95 по стадиям из app.tracing.
+# С --baseline: ненулевой код выхода, если jobs/min или p95 хуже базы больше чем на --tolerance.
+
+import os, sys, json, time, random, shutil, asyncio, argparse, resource, subprocess, tempfile, urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+SCENARIOS = ("wan-curl", "wan", "sora-aiohttp", "render_videos", "kie", "bot")
+PROMPTS = ["кот на пляже", "девушка идёт по улице ночью", "дрон над горами", "кофе льётся в чашку"]
+
+
+# ---------- фейковый сервер ----------
+
+def start_server(a):
+    cmd = [sys.executable, str(ROOT / "tools" / "fake_providers.py"), "--port", str(a.port),
+           "--latency", str(a.latency), "--jitter", str(a.jitter), "--fail-rate", str(a.fail_rate),
+           "--http-error-rate", str(a.http_error_rate), "--rtt-ms", str(a.rtt_ms),
+           "--seconds", str(a.seconds), "--seed", str(a.seed)]
+    if a.mp4:
+        cmd += ["--mp4", a.mp4]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{a.port}"
+    for _ in range(200):
+        try:
+            server_stats(base)
+            return proc, base
+        except Exception:
+            if proc.poll() is not None:
+                raise SystemExit("fake_providers.py exited, port busy?")
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("fake_providers.py did not start")
+
+
+def server_stats(base):
+    with urllib.request.urlopen(base + "/stats", timeout=5) as r:
+        return json.loads(r.read())
+
+
+def bench_env(base, out_dir, a):
+    """Всё до импорта app/adapters: базовые URL и OUT_DIR читаются на импорте."""
+    os.environ.update({
+        "OUT_DIR": str(out_dir),
+        "DB_PATH": str(out_dir / "bench.db"),
+        "STATE_DB": "",
+        "REPLICATE_API_BASE": f"{base}/v1",
+        "REPLICATE_API_TOKEN": "r8_bench_" + "0" * 32,
+        "REPLICATE_MODEL_VERSION": "bench",
+        "REPLICATE_POLL_SEC": str(a.poll),
+        "CATBOX_UPLOAD_URL": f"{base}/catbox",
+        "LUMA_BASE_URL": f"{base}/luma",
+        "LUMA_API_KEY": "bench",
+        "LUMA_START_PATH": "/v1/videos",
+        "LUMA_STATUS_PATH": "/v1/videos/{task_id}",
+        "LUMA_POLL_SEC": str(a.poll),
+        "KIE_BASE_URL": f"{base}/kie",
+        "KIE_API_KEY": "bench",
+        "KIE_START_PATH": "/api/v1/video/generate",
+        "KIE_STATUS_PATH": "/api/v1/video/tasks/{task_id}",
+        "KIE_POLL_SEC": str(a.poll),
+        "PROVIDERS": a.providers,
+        "DEFAULT_DURATION": str(a.seconds),
+        "ADMIT_MAX_RENDERS": str(max(a.users, 1)),
+    })
+
+
+# ---------- сценарии: async (user_id, prompt) -> bool ----------
+
+def make_job(name, a, out_dir):
+    if name == "wan-curl":
+        from app.replicate_adapter import ReplicateClient
+        client = ReplicateClient()
+
+        async def job(uid, prompt):
+            return bool(await asyncio.to_thread(client.generate_from_text, prompt, a.seconds))
+        return job
+
+    if name == "wan":
+        from adapters.providers import REGISTRY, JobRequest
+        provider = REGISTRY.get("wan")
+
+        async def job(uid, prompt):
+            return bool(await provider.run(JobRequest(prompt=prompt, seconds=a.seconds, out_dir=str(out_dir))))
+        return job
+
+    if name == "sora-aiohttp":
+        from adapters.replicate_adapter import ReplicateClient
+        client = ReplicateClient.from_env()
+
+        async def job(uid, prompt):
+            return bool(await client.generate(prompt, a.variants, str(out_dir)))
+        return job
+
+    if name == "render_videos":
+        from adapters import render_videos
+
+        async def job(uid, prompt):
+            return bool(await render_videos(prompt, a.variants, str(out_dir)))
+        return job
+
+    if name == "kie":
+        from adapters.kie_ai import KIEClient
+        client = KIEClient()
+
+        async def job(uid, prompt):
+            return bool(await client.generate(prompt, 1, str(out_dir)))
+        return job
+
+    if name == "bot":
+        return make_bot_job()
+
+    raise SystemExit(f"unknown scenario {name}")
+
+
+class _User:
+    def __init__(self, uid):
+        self.id = uid
+        self.is_bot = False
+
+
+class FakeMessage:
+    """Минимум aiogram.types.Message, который трогают хендлеры bot_ui_patch."""
+
+    def __init__(self, uid, text=""):
+        self.from_user = _User(uid)
+        self.text = text
+        self.replies = []
+        self.videos = 0
+
+    async def answer(self, text, **kw):
+        self.replies.append(text)
+
+    async def answer_video(self, f, **kw):
+        f.read()
+        self.videos += 1
+
+
+class FakeQuery:
+    def __init__(self, uid, data, message):
+        self.from_user = _User(uid)
+        self.data = data
+        self.message = message
+
+    async def answer(self, *a, **kw):
+        pass
+
+
+def make_bot_job():
+    from app import billing
+    from app.bot_ui_patch import handle_text, handle_callback
+    from app.state_store import StateStore
+
+    billing.init_billing()
+    state = StateStore()
+    funded = set()
+
+    async def job(uid, prompt):
+        if uid not in funded:
+            billing.ensure_user(uid)
+            billing.add_balance(uid, 10 ** 6, "bench")
+            funded.add(uid)
+        msg = FakeMessage(uid, prompt)
+        await handle_text(msg, state)
+        await handle_callback(FakeQuery(uid, "again", msg), state)
+        # превью + готовый ролик
+        return msg.videos >= 2
+    return job
+
+
+# ---------- прогон ----------
+
+def _pct(xs, q):
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))]
+
+
+def _r(v, nd=3):
+    return None if v is None else round(v, nd)
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _cpu():
+    s, c = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return s.ru_utime + s.ru_stime, c.ru_utime + c.ru_stime
+
+
+async def run_bench(job, a):
+    lat, ok, errors = [], 0, {}
+    rss_peak = [_rss_mb() or 0]
+
+    async def user(uid):
+        nonlocal ok
+        for _ in range(a.jobs):
+            prompt = random.choice(PROMPTS)
+            t0 = time.monotonic()
+            try:
+                good = await job(uid, prompt)
+            except Exception as e:
+                good = False
+                k = type(e).__name__
+                errors[k] = errors.get(k, 0) + 1
+            lat.append(time.monotonic() - t0)
+            ok += bool(good)
+            if a.think:
+                await asyncio.sleep(random.uniform(0, a.think))
+
+    async def sampler():
+        while True:
+            rss_peak[0] = max(rss_peak[0], _rss_mb() or 0)
+            await asyncio.sleep(0.5)
+
+    smp = asyncio.ensure_future(sampler())
+    cpu0, ch0 = _cpu()
+    t0 = time.monotonic()
+    await asyncio.gather(*(user(100000 + i) for i in range(a.users)))
+    wall = time.monotonic() - t0
+    cpu1, ch1 = _cpu()
+    smp.cancel()
+
+    total = len(lat)
+    return {
+        "jobs": total, "ok": ok, "fail_rate": round(1 - ok / total, 3) if total else None,
+        "errors": errors, "wall_sec": round(wall, 2),
+        "jobs_per_min": round(ok / wall * 60, 2) if wall else None,
+        "p50_sec": _r(_pct(lat, 0.5)), "p95_sec": _r(_pct(lat, 0.95)), "max_sec": _r(max(lat) if lat else None),
+        "cpu_self_sec": round(cpu1 - cpu0, 2), "cpu_children_sec": round(ch1 - ch0, 2),
+        "cpu_pct": round((cpu1 - cpu0 + ch1 - ch0) / wall * 100, 1) if wall else None,
+        "rss_mb": round(rss_peak[0], 1),
+        "maxrss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(res, base, tol):
+    """Регрессии относительно прошлого JSON того же сценария."""
+    bad = []
+    if base.get("jobs_per_min") and res["jobs_per_min"] is not None \
+            and res["jobs_per_min"] < base["jobs_per_min"] * (1 - tol):
+        bad.append(f"jobs/min {res['jobs_per_min']} < {base['jobs_per_min']}")
+    if base.get("p95_sec") and res["p95_sec"] is not None and res["p95_sec"] > base["p95_sec"] * (1 + tol):
+        bad.append(f"p95 {res['p95_sec']:.2f}s > {base['p95_sec']:.2f}s")
+    return bad
+
+
+def main():
+    p = argparse.ArgumentParser(description="offline provider benchmark")
+    p.add_argument("scenario", choices=SCENARIOS)
+    p.add_argument("--users", type=int, default=8, help="одновременных пользователей")
+    p.add_argument("--jobs", type=int, default=3, help="задач на пользователя (последовательно)")
+    p.add_argument("--think", type=float, default=0.0, help="пауза между задачами, до N сек")
+    p.add_argument("--variants", type=int, default=1, help="n для generate/render_videos")
+    p.add_argument("--providers", default="luma", help="цепочка для render_videos")
+    p.add_argument("--seconds", type=int, default=5)
+    p.add_argument("--poll", type=float, default=0.5, help="интервал опроса у клиентов")
+    # фейковый сервер
+    p.add_argument("--server", default="", help="уже запущенный fake_providers (http://host:port)")
+    p.add_argument("--port", type=int, default=8099)
+    p.add_argument("--latency", type=float, default=4.0)
+    p.add_argument("--jitter", type=float, default=0.3)
+    p.add_argument("--fail-rate", type=float, default=0.0)
+    p.add_argument("--http-error-rate", type=float, default=0.0)
+    p.add_argument("--rtt-ms", type=float, default=20.0)
+    p.add_argument("--mp4", default="")
+    p.add_argument("--seed", type=int, default=1)
+    # отчёт
+    p.add_argument("--json", default="", help="записать результат в файл")
+    p.add_argument("--baseline", default="", help="JSON прошлого прогона для сравнения")
+    p.add_argument("--tolerance", type=float, default=0.2)
+    p.add_argument("--keep", action="store_true", help="не удалять временный OUT_DIR")
+    a = p.parse_args()
+    random.seed(a.seed)
+
+    proc = None
+    if a.server:
+        base = a.server.rstrip("/")
+    else:
+        proc, base = start_server(a)
+    out_dir = Path(tempfile.mkdtemp(prefix="cf_bench_"))
+    bench_env(base, out_dir, a)
+    try:
+        job = make_job(a.scenario, a, out_dir)
+        s0 = server_stats(base)
+        res = asyncio.run(run_bench(job, a))
+        s1 = server_stats(base)
+        res["server"] = {k: s1[k] - s0.get(k, 0) for k in s1 if isinstance(s1[k], (int, float))}
+        try:
+            from app.tracing import snapshot
+            res["stages"] = {k: dict(v, p50=_r(v["p50"]), p95=_r(v["p95"]))
+                             for k, v in snapshot().items() if v["n"]}
+        except Exception:
+            pass
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=5)
+        if not a.keep:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+    res.update(scenario=a.scenario, users=a.users, jobs_per_user=a.jobs, latency=a.latency,
+               fail_rate_cfg=a.fail_rate, ts=time.time())
+    print(json.dumps(res, ensure_ascii=False, indent=2))
+    if a.json:
+        Path(a.json).write_text(json.dumps(res, ensure_ascii=False, indent=2))
+    if a.baseline:
+        bad = compare(res, json.loads(Path(a.baseline).read_text()), a.tolerance)
+        for b in bad:
+            print("REGRESSION:", b, file=sys.stderr)
+        sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
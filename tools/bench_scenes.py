@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# /opt/content_factory/tools/bench_scenes.py
+# Бенчмарк раскадровщика app.scene_builder на большом корпусе промптов (без сети/ffmpeg).
+#
+# Сравнивает:
+#   legacy  — прежняя схема: по теме `any(w in p for w in keywords)`, N тем = N проходов по тексту
+#   rules   — app.scene_builder.Rules.scores: все слова в одной регулярке-бору, один проход
+#   plan    — Rules.plan целиком (матчинг + сборка Shot), для справки
+# и проверяет, что набор найденных тем у обоих одинаковый.
+#
+# usage: bench_scenes.py [--prompts 20000] [--themes 3,50,300] [--words 30] [--seed 1] [--json out.json]
+#   --themes: 3 = реальные правила (SCENE_RULES), больше — синтетические темы по 8 слов
+#             поверх реальных (так видно, как растёт цена с числом тем)
+
+import sys, json, time, random, argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.scene_builder import Rules, SCENE_RULES  # noqa: E402
+
+FILLER = ("кот девушка город ночь неон дождь улица кофе утро свет камера медленно красиво "
+          "portrait cinematic sunset city street rain neon coffee morning slow motion product "
+          "bottle table studio forest mountain snow car road drone shot close-up").split()
+
+
+def synthetic_rules(n_themes: int, base: dict, rnd: random.Random) -> dict:
+    data = json.loads(json.dumps(base))
+    for i in range(max(0, n_themes - len(data["themes"]))):
+        kws = ["".join(rnd.choice("абвгдежзиклмнопрстуфхцчшэюя") for _ in range(rnd.randint(4, 9)))
+               for _ in range(8)]
+        data["themes"].append({"name": f"syn{i}", "keywords": kws,
+                               "shots": {str(i % 3): {"action": f"synthetic {i}"}}})
+    return data
+
+
+def corpus(n: int, words: int, data: dict, rnd: random.Random):
+    kws = [k for t in data["themes"] for k in t["keywords"]]
+    out = []
+    for _ in range(n):
+        ws = [rnd.choice(FILLER) for _ in range(words)]
+        for _ in range(rnd.randint(0, 3)):
+            ws.insert(rnd.randrange(len(ws) + 1), rnd.choice(kws))
+        out.append(" ".join(ws).capitalize())
+    return out
+
+
+def legacy_themes(data: dict):
+    themes = [(t["name"], [k.lower() for k in t["keywords"]]) for t in data["themes"]]
+
+    def match(prompt: str):
+        p = (prompt or "").lower()
+        return {name for name, kws in themes if any(w in p for w in kws)}
+    return match
+
+
+def timeit(fn, prompts):
+    t0 = time.perf_counter()
+    res = [fn(p) for p in prompts]
+    return time.perf_counter() - t0, res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--prompts", type=int, default=20000)
+    ap.add_argument("--themes", default="3,50,300")
+    ap.add_argument("--words", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json")
+    a = ap.parse_args()
+
+    with open(SCENE_RULES, encoding="utf-8") as f:
+        base = json.load(f)
+    rows = []
+    for n_themes in [int(x) for x in a.themes.split(",") if x.strip()]:
+        rnd = random.Random(a.seed)
+        data = synthetic_rules(n_themes, base, rnd)
+        prompts = corpus(a.prompts, a.words, data, rnd)
+
+        t_compile = time.perf_counter()
+        rules = Rules(data)
+        t_compile = time.perf_counter() - t_compile
+
+        t_legacy, r_legacy = timeit(legacy_themes(data), prompts)
+        names = [t["name"] for t in data["themes"]]
+        t_rules, r_rules = timeit(lambda p: {names[ti] for ti in rules.scores(p)}, prompts)
+        t_plan, _ = timeit(rules.plan, prompts)
+        mismatch = sum(1 for x, y in zip(r_legacy, r_rules) if x != y)
+        rows.append({
+            "themes": len(data["themes"]),
+            "keywords": sum(len(t["keywords"]) for t in data["themes"]),
+            "prompts": len(prompts),
+            "legacy_us": round(t_legacy / len(prompts) * 1e6, 2),
+            "rules_us": round(t_rules / len(prompts) * 1e6, 2),
+            "speedup": round(t_legacy / t_rules, 2) if t_rules else None,
+            "plan_us": round(t_plan / len(prompts) * 1e6, 2),
+            "compile_ms": round(t_compile * 1e3, 2),
+            "mismatch": mismatch,
+        })
+
+    print(f"{'themes':>7} {'keywords':>9} {'legacy µs':>10} {'rules µs':>9} {'speedup':>8} "
+          f"{'plan µs':>8} {'compile ms':>11} {'mismatch':>9}")
+    for r in rows:
+        print(f"{r['themes']:>7} {r['keywords']:>9} {r['legacy_us']:>10} {r['rules_us']:>9} "
+              f"{r['speedup']:>8} {r['plan_us']:>8} {r['compile_ms']:>11} {r['mismatch']:>9}")
+    if a.json:
+        Path(a.json).write_text(json.dumps(rows, ensure_ascii=False, indent=2))
+    sys.exit(1 if any(r["mismatch"] for r in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
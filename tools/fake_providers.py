@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# /opt/content_factory/tools/fake_providers.py
+# Локальный фейк Replicate / Luma / KIE / catbox для офлайн-бенчмарков (без денег и сети).
+# Только stdlib — запускается где угодно, в т.ч. отдельным процессом из bench_providers.py.
+#
+# usage: fake_providers.py [--port 8099] [--latency 8] [--jitter 0.3] [--fail-rate 0.05]
+#                          [--http-error-rate 0.01] [--rtt-ms 30] [--mp4 clip.mp4 | --mp4-kb 800]
+#
+#   Replicate: POST /v1/models/<owner>/<name>/predictions, POST /v1/predictions (version),
+#              GET /v1/predictions/<id>, POST /v1/predictions/<id>/cancel
+#   Luma:      POST /luma/v1/videos,          GET /luma/v1/videos/<id>
+#   KIE:       POST /kie/api/v1/video/generate, GET /kie/api/v1/video/tasks/<id>
+#   catbox:    POST /catbox                   -> текстом URL картинки
+#   файлы:     GET  /files/<name>             -> канонический MP4 (или JPG)
+#   счётчики:  GET  /stats
+#
+# Латентность задачи ~ lognormal вокруг --latency; провал задачи (--fail-rate) выясняется
+# только в конце, как у настоящих провайдеров; --http-error-rate — 503 на создание.
+
+import os, sys, json, math, time, uuid, random, argparse, threading, subprocess, tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATE = {"jobs": {}, "stats": {"created": 0, "polls": 0, "downloads": 0, "cancels": 0,
+                               "http_errors": 0, "failed": 0, "bytes_out": 0}}
+LOCK = threading.Lock()
+CFG = argparse.Namespace()
+PAYLOAD = {"mp4": b"", "jpg": b""}
+
+
+def make_mp4(seconds=5, size="1280x720", fps=24):
+    """Настоящий H.264 через lavfi (нужен для ffmpeg-стадий бота); без ffmpeg — просто байты."""
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    cmd = ["ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", f"testsrc2=s={size}:r={fps}:d={seconds}",
+           "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-movflags", "+faststart", path]
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(path, "rb") as f:
+            return f.read()
+    except Exception:
+        sys.stderr.write("fake_providers: ffmpeg unavailable, serving random bytes as mp4\n")
+        return os.urandom(max(1, CFG.mp4_kb) * 1024)
+    finally:
+        os.unlink(path)
+
+
+def _job_latency():
+    # lognormal: медиана = --latency, хвост растёт с --jitter
+    return CFG.latency * math.exp(random.gauss(0, CFG.jitter)) if CFG.jitter else CFG.latency
+
+
+def new_job(kind):
+    jid = uuid.uuid4().hex[:16]
+    job = {"id": jid, "kind": kind, "t0": time.monotonic(), "dur": _job_latency(),
+           "fail": random.random() < CFG.fail_rate, "canceled": False}
+    with LOCK:
+        STATE["jobs"][jid] = job
+        STATE["stats"]["created"] += 1
+    return job
+
+
+def job_state(jid):
+    """queued -> running -> succeeded|failed|canceled по прошедшему времени."""
+    with LOCK:
+        job = STATE["jobs"].get(jid)
+        STATE["stats"]["polls"] += 1
+    if job is None:
+        return None, None
+    if job["canceled"]:
+        return job, "canceled"
+    dt = time.monotonic() - job["t0"]
+    if dt < min(1.0, job["dur"] * 0.2):
+        return job, "queued"
+    if dt < job["dur"]:
+        return job, "running"
+    if job["fail"]:
+        with LOCK:
+            if not job.get("counted"):
+                job["counted"] = True
+                STATE["stats"]["failed"] += 1
+        return job, "failed"
+    return job, "succeeded"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if CFG.verbose:
+            sys.stderr.write("fake: " + fmt % args + "\n")
+
+    # ---- helpers ----
+    def _base(self):
+        return f"http://{self.headers.get('Host') or f'127.0.0.1:{CFG.port}'}"
+
+    def _send(self, code, body=b"", ctype="application/json"):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        elif isinstance(body, str):
+            body = body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _drain(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n else b""
+
+    def _rtt(self):
+        if CFG.rtt_ms:
+            time.sleep(CFG.rtt_ms / 1000.0)
+
+    def _http_error(self):
+        if random.random() < CFG.http_error_rate:
+            with LOCK:
+                STATE["stats"]["http_errors"] += 1
+            self._send(503, {"detail": "fake overload"})
+            return True
+        return False
+
+    # ---- routes ----
+    def do_POST(self):
+        self._drain()
+        self._rtt()
+        p = self.path.split("?", 1)[0]
+        base = self._base()
+        if p == "/catbox":
+            return self._send(200, f"{base}/files/input.jpg", "text/plain")
+        if p.startswith("/v1/predictions/") and p.endswith("/cancel"):
+            jid = p.split("/")[3]
+            with LOCK:
+                job = STATE["jobs"].get(jid)
+                if job:
+                    job["canceled"] = True
+                    STATE["stats"]["cancels"] += 1
+            return self._send(200 if job else 404, {"id": jid, "status": "canceled"})
+        if p == "/v1/predictions" or (p.startswith("/v1/models/") and p.endswith("/predictions")):
+            if self._http_error():
+                return
+            job = new_job("replicate")
+            return self._send(201, {"id": job["id"], "status": "starting",
+                                    "urls": {"get": f"{base}/v1/predictions/{job['id']}",
+                                             "cancel": f"{base}/v1/predictions/{job['id']}/cancel"}})
+        if p == "/luma/v1/videos":
+            if self._http_error():
+                return
+            return self._send(200, {"id": new_job("luma")["id"]})
+        if p == "/kie/api/v1/video/generate":
+            if self._http_error():
+                return
+            return self._send(200, {"task_id": new_job("kie")["id"]})
+        self._send(404, {"detail": "not found"})
+
+    def do_GET(self):
+        self._rtt()
+        p = self.path.split("?", 1)[0]
+        base = self._base()
+        if p == "/stats":
+            with LOCK:
+                return self._send(200, dict(STATE["stats"], jobs=len(STATE["jobs"])))
+        if p.startswith("/files/"):
+            body = PAYLOAD["jpg"] if p.endswith(".jpg") else PAYLOAD["mp4"]
+            with LOCK:
+                STATE["stats"]["downloads"] += 1
+                STATE["stats"]["bytes_out"] += len(body)
+            return self._send(200, body, "image/jpeg" if p.endswith(".jpg") else "video/mp4")
+        if p.startswith("/v1/predictions/"):
+            job, st = job_state(p.rsplit("/", 1)[-1])
+            if job is None:
+                return self._send(404, {"detail": "not found"})
+            st = {"queued": "starting", "running": "processing"}.get(st, st)
+            out = {"id": job["id"], "status": st, "urls": {"get": f"{base}{p}"}}
+            if st == "succeeded":
+                out["output"] = f"{base}/files/{job['id']}.mp4"
+            if st == "failed":
+                out["error"] = "fake provider failure"
+            return self._send(200, out)
+        if p.startswith("/luma/v1/videos/"):
+            job, st = job_state(p.rsplit("/", 1)[-1])
+            if job is None:
+                return self._send(404, {"detail": "not found"})
+            out = {"id": job["id"], "state": {"succeeded": "completed"}.get(st, st)}
+            if st == "succeeded":
+                out["url"] = f"{base}/files/{job['id']}.mp4"
+            return self._send(200, out)
+        if p.startswith("/kie/api/v1/video/tasks/"):
+            job, st = job_state(p.rsplit("/", 1)[-1])
+            if job is None:
+                return self._send(404, {"detail": "not found"})
+            out = {"task_id": job["id"], "status": {"running": "processing"}.get(st, st)}
+            if st == "succeeded":
+                out["download_url"] = f"{base}/files/{job['id']}.mp4"
+            return self._send(200, out)
+        self._send(404, {"detail": "not found"})
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="fake Replicate/Luma/KIE server")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=int(os.getenv("FAKE_PORT", "8099")))
+    p.add_argument("--latency", type=float, default=8.0, help="медиана времени задачи, сек")
+    p.add_argument("--jitter", type=float, default=0.3, help="sigma lognormal (0 — фиксированная)")
+    p.add_argument("--fail-rate", type=float, default=0.0)
+    p.add_argument("--http-error-rate", type=float, default=0.0)
+    p.add_argument("--rtt-ms", type=float, default=0.0, help="задержка на каждый HTTP-запрос")
+    p.add_argument("--mp4", default="", help="готовый MP4 вместо сгенерированного")
+    p.add_argument("--mp4-kb", type=int, default=800, help="размер заглушки, если нет ffmpeg")
+    p.add_argument("--seconds", type=int, default=5)
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("-v", "--verbose", action="store_true")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    global CFG
+    CFG = parse_args(argv)
+    if CFG.seed is not None:
+        random.seed(CFG.seed)
+    if CFG.mp4:
+        with open(CFG.mp4, "rb") as f:
+            PAYLOAD["mp4"] = f.read()
+    else:
+        PAYLOAD["mp4"] = make_mp4(CFG.seconds)
+    PAYLOAD["jpg"] = b"\xff\xd8\xff\xe0" + os.urandom(32 * 1024) + b"\xff\xd9"
+    srv = ThreadingHTTPServer((CFG.host, CFG.port), Handler)
+    srv.daemon_threads = True
+    print(f"fake providers on http://{CFG.host}:{CFG.port} mp4={len(PAYLOAD['mp4'])}B", flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
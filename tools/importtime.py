@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# /opt/content_factory/tools/importtime.py
+# Профиль старта: `python -X importtime` для модулей бота, каждый — в чистом интерпретаторе.
+#
+# Для каждого модуля:
+#   total ms  — сумма self по всем импортам минус старт голого интерпретатора (site, encodings, ...)
+#   top       — самые тяжёлые вложенные импорты (cumulative), по ним видно, что стоит сделать ленивым
+#   side fx   — что импорт создал на диске: OUT_DIR/LOG_DIR указывают во временную папку
+#   error     — последняя строка traceback, если импорт упал (нет зависимости, проверка env при импорте)
+#
+# usage: importtime.py [modules...] [--root DIR] [--top 8] [--repeat 3] [--json out.json] [--markdown out.md]
+#   без modules — DEFAULT_MODULES; --root — другой checkout (например, `git archive` старого коммита)
+#   для сравнения до/после; из --repeat прогонов берётся медиана
+
+import os, sys, json, argparse, statistics, subprocess, tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+DEFAULT_MODULES = [
+    "app.main", "app.bot", "app.bot_ui_patch", "app.config", "app.prompting",
+    "adapters", "adapters.providers", "app.replicate_adapter", "app.adapters.replicate_adapter",
+    "app.adapters.tts_adapter", "app.pipelines.product_exact", "app.longform", "app.batch",
+]
+
+
+def parse(stderr: str):
+    """Строки `import time: self | cumulative | name` -> [(self_us, cum_us, depth, name)]."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line.split(":", 1)[1].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((int(self_us), int(cum_us), depth, name.strip()))
+    return rows
+
+
+def run_once(module: str, root: Path):
+    with tempfile.TemporaryDirectory() as d:
+        env = dict(os.environ, OUT_DIR=os.path.join(d, "out"), LOG_DIR=os.path.join(d, "logs"),
+                   PYTHONPATH=str(root), PYTHONDONTWRITEBYTECODE="1")
+        p = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                           cwd=str(root), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        created = sorted(str(x.relative_to(d)) for x in Path(d).rglob("*"))
+    rows = parse(p.stderr)
+    error = None
+    if p.returncode != 0:
+        tail = [ln for ln in p.stderr.splitlines() if ln and not ln.startswith("import time:")]
+        error = tail[-1] if tail else f"exit {p.returncode}"
+    return rows, error, created
+
+
+def baseline(root: Path, repeat: int):
+    """Старт голого интерпретатора (site, encodings, ...): время и имена модулей."""
+    xs, names = [], set()
+    for _ in range(repeat):
+        rows, _, _ = run_once("sys", root)
+        xs.append(sum(r[0] for r in rows))
+        names.update(r[3] for r in rows)
+    return (int(statistics.median(xs)) if xs else 0), names
+
+
+def profile(module: str, root: Path, repeat: int, top: int, base):
+    base_us, base_names = base
+    totals, last = [], None
+    for _ in range(repeat):
+        rows, error, created = run_once(module, root)
+        totals.append(sum(r[0] for r in rows) - base_us)
+        last = (rows, error, created)
+    rows, error, created = last
+    mine = [r for r in rows if r[3] == module]
+    nested = sorted((r for r in rows if r[3] != module and r[3] not in base_names), key=lambda r: -r[1])[:top]
+    return {
+        "module": module,
+        "total_ms": round(statistics.median(totals) / 1000, 1),
+        "self_ms": round(mine[0][0] / 1000, 1) if mine else None,
+        "modules": len(rows),
+        "top": [{"name": r[3], "cum_ms": round(r[1] / 1000, 1)} for r in nested],
+        "side_effects": created,
+        "error": error,
+    }
+
+
+def markdown(res) -> str:
+    out = ["| module | total ms | modules | side effects | error |", "|---|---:|---:|---|---|"]
+    for r in res:
+        out.append(f"| `{r['module']}` | {r['total_ms']} | {r['modules']} | "
+                   f"{', '.join(r['side_effects']) or '—'} | {r['error'] or ''} |")
+    out.append("")
+    for r in res:
+        if r["top"]:
+            out.append(f"- `{r['module']}`: " + ", ".join(f"{t['name']} {t['cum_ms']}" for t in r["top"]))
+    return "\n".join(out) + "\n"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("modules", nargs="*")
+    ap.add_argument("--root", default=str(ROOT))
+    ap.add_argument("--top", type=int, default=8)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--json")
+    ap.add_argument("--markdown")
+    a = ap.parse_args()
+
+    root = Path(a.root).resolve()
+    base = baseline(root, max(1, a.repeat))
+    res = [profile(m, root, max(1, a.repeat), a.top, base) for m in (a.modules or DEFAULT_MODULES)]
+
+    print(f"{'module':<34} {'total ms':>9} {'mods':>5}  side effects / error")
+    for r in res:
+        note = r["error"] or ", ".join(r["side_effects"]) or ""
+        print(f"{r['module']:<34} {r['total_ms']:>9} {r['modules']:>5}  {note}")
+        for t in r["top"][:3]:
+            print(f"{'':<36}{t['cum_ms']:>7}  {t['name']}")
+    if a.json:
+        Path(a.json).write_text(json.dumps({"root": str(root), "baseline_ms": round(base[0] / 1000, 1),
+                                            "results": res}, ensure_ascii=False, indent=2))
+    if a.markdown:
+        Path(a.markdown).write_text(markdown(res), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# /opt/content_factory/tools/webhook_fake_update.py
+# Шлёт фейковые апдейты в локальный webhook (BOT_MODE=webhook) и печатает /healthz.
+# usage: webhook_fake_update.py [text] [--n 20] [--users 5] [--callback again]
+
+import os, sys, json, time, argparse, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BASE = os.getenv("WEBHOOK_LOCAL", f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', '8080')}")
+PATH = os.getenv("WEBHOOK_PATH", "/tg/webhook")
+SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+def fake_update(i, user, text=None, callback=None):
+    chat = {"id": user, "type": "private", "first_name": f"u{user}"}
+    frm = {"id": user, "is_bot": False, "first_name": f"u{user}"}
+    msg = {"message_id": i, "date": int(time.time()), "chat": chat, "from": frm}
+    if callback:
+        return {"update_id": i, "callback_query": {
+            "id": str(i), "from": frm, "chat_instance": str(user), "data": callback,
+            "message": dict(msg, text="menu")}}
+    return {"update_id": i, "message": dict(msg, text=text or "test")}
+
+def post(upd):
+    headers = {"Content-Type": "application/json"}
+    if SECRET:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = SECRET
+    r = urllib.request.Request(BASE + PATH, data=json.dumps(upd).encode(), headers=headers, method="POST")
+    t0 = time.time()
+    try:
+        with urllib.request.urlopen(r, timeout=10) as resp:
+            return resp.getcode(), time.time() - t0
+    except urllib.error.HTTPError as e:
+        return e.code, time.time() - t0
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("text", nargs="?", default="кот на пляже")
+    p.add_argument("--n", type=int, default=20)
+    p.add_argument("--users", type=int, default=5)
+    p.add_argument("--callback", default=None)
+    a = p.parse_args()
+    base_id = int(time.time())
+    ups = [fake_update(base_id + i, 100000 + i % a.users, a.text, a.callback) for i in range(a.n)]
+    with ThreadPoolExecutor(16) as ex:
+        res = list(ex.map(post, ups))
+    codes = {}
+    for c, _ in res:
+        codes[c] = codes.get(c, 0) + 1
+    print("HTTP codes:", codes, "max post latency: %.3fs" % max(dt for _, dt in res))
+    with urllib.request.urlopen(BASE + "/healthz", timeout=10) as r:
+        print(json.dumps(json.loads(r.read()), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()